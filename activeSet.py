@@ -0,0 +1,72 @@
+import numpy as np
+
+# Scheduler that limits a packing sweep to the tetrahedra that can still move
+# A tetrahedron leaves the active set when it converges, so late sweeps only cost
+# time for the stragglers instead of visiting all N tetrahedra
+# Whenever a tetrahedron has travelled wakedistance since it last did so, the
+# converged tetrahedra within the centroid filter distance of where it came from
+# are reactivated with their step scale and rotation range raised to at least
+# wakescale and wakerange, so they can move into the space that opened up
+# Without any reactivation the sweeps visit the same tetrahedra in the same order
+# as the full loops, so the results are identical
+class ActiveSet(object):
+	def __init__(self, wakedistance=0.1, wakescale=0.01, wakerange=1.0):
+		self.wakedistance = wakedistance
+		self.wakescale = wakescale
+		self.wakerange = wakerange
+		self.state = None
+		self.grid = None
+		self.active = set()
+		self.woken = 0
+		self.history = []
+		self.saved = None
+
+	# Binds the scheduler to a packing state and its broad phase grid
+	def attach(self, state, grid):
+		self.state = state
+		self.grid = grid
+		self.active = set(np.flatnonzero(~state.converged).tolist())
+		self.travel = np.zeros(len(state))
+		if self.saved:
+			assert len(self.saved['travel']) == len(state), "Saved travel distances do not match the state"
+			self.travel = np.array(self.saved['travel'], dtype=float)
+		self.saved = None
+
+	# Arrays to store in checkpoints: the distance every tetrahedron has travelled
+	# since it last woke its neighbours
+	def save(self):
+		return {'travel': self.travel.copy()}
+
+	# Makes the next attach continue from arrays returned by save()
+	def restore(self, saved):
+		self.saved = saved
+
+	def __len__(self):
+		return len(self.active)
+
+	# Indices to visit in the coming sweep, in ascending order
+	def sweep(self):
+		self.history.append(len(self.active))
+		return sorted(self.active)
+
+	# Removes a converged tetrahedron from the active set
+	def freeze(self, i):
+		self.active.discard(i)
+
+	# Records an accepted move of tetrahedron i from oldcentroid and oldverts to its
+	# current pose and reactivates its frozen neighbours once it travelled far enough
+	def moved(self, i, oldcentroid, oldverts):
+		state = self.state
+		self.travel[i] += np.linalg.norm(state.verts[i]-oldverts, axis=1).max()
+		if self.travel[i] < self.wakedistance:
+			return
+		self.travel[i] = 0.0
+		reach = 2*state.circumradius()
+		near = self.grid.neighbours(oldcentroid, i, count=False)
+		for k, d in zip(near, self.grid.distances(oldcentroid, near)):
+			if state.converged[k] and d <= reach:
+				state.converged[k] = False
+				state.scales[k] = max(state.scales[k], self.wakescale)
+				state.rotranges[k] = max(state.rotranges[k], self.wakerange)
+				self.active.add(k)
+				self.woken += 1
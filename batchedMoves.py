@@ -0,0 +1,133 @@
+import time
+import numpy as np
+import packingEngine
+
+# Packing with several candidate moves per tetrahedron and sweep
+# Instead of one translation and one rotation tried in turn, every visit draws
+# `candidates` poses, each a translation combined with a rotation, builds their
+# vertices in one batched matmul and tests all of them against the neighbours
+# within reach in a single call to the backend. The feasible pose that brings the
+# vertices closest to the center of mass (and, for V3, to the nearest neighbour)
+# is accepted; only when every candidate collides are the step scale and the
+# rotation range reduced. In the dense regime, where most single proposals
+# collide, this yields many more accepted moves per collision call
+
+# Rotation matrices composed from one rotation per coordinate plane, in the order
+# the serial loops compose them, for an array of angles in degrees of shape kx3
+def plane_rotations(degrees):
+	radians = np.radians(degrees)
+	cos = np.cos(radians)
+	sin = np.sin(radians)
+	rotations = np.tile(np.eye(3), (len(degrees), 1, 1))
+	for p, (j, k) in enumerate(((0,1), (0,2), (1,2))):
+		plane = np.tile(np.eye(3), (len(degrees), 1, 1))
+		plane[:,j,j] = cos[:,p]
+		plane[:,k,k] = cos[:,p]
+		plane[:,j,k] = -sin[:,p]
+		plane[:,k,j] = sin[:,p]
+		rotations = np.matmul(plane, rotations)
+	return rotations
+
+# count random translations for a tetrahedron with centroid c, drawn like
+# util.propose_translation: scaled by the distance to the center of mass and
+# flipped where they would move the tetrahedron away from it
+def propose_translations(c, centerOfMass, scale, count, rng=np.random):
+	dist = np.linalg.norm(centerOfMass-c)
+	tvecs = rng.uniform(-scale*dist, scale*dist, (count, len(c)))
+	away = np.linalg.norm(centerOfMass-c-tvecs, axis=1) > dist
+	tvecs[away] *= -1
+	return tvecs
+
+# Sum of the distances from point to every vertex, for a stack of kx4x3 vertices
+def net_distances(point, vertices):
+	return np.linalg.norm(vertices-point, axis=2).sum(axis=1)
+
+# Tests candidate poses (kx4x3, centroids kx3) of tetrahedron i against all other
+# tetrahedra within reach in one batched backend call
+# separation is an optional SeparationCache that resolves pairs without the backend
+# Returns a boolean array telling which candidates are free of collisions, the
+# number of pairs tested exactly and the number skipped on a cached gap
+def feasible_candidates(state, i, candidates, centroids, grid, backend, reach, separation=None):
+	near = set()
+	for c in centroids:
+		near.update(grid.neighbours(c, i, count=False))
+	feasible = np.ones(len(candidates), dtype=bool)
+	if not near:
+		return feasible, 0, 0
+	near = np.array(sorted(near))
+	ks, js = np.nonzero(np.linalg.norm(centroids[:,None,:]-state.centroids[near][None], axis=2) <= reach)
+	if len(ks) == 0:
+		return feasible, 0, 0
+	if separation is not None:
+		hits, exact, skipped = separation.overlaps(i, candidates, ks, near[js], backend)
+	else:
+		hits = np.asarray(backend.intersect_pairs(candidates[ks], state.verts[near[js]]), dtype=bool)
+		exact, skipped = len(ks), 0
+	feasible[ks[hits]] = False
+	return feasible, exact, skipped
+
+# Move strategy equivalent in spirit to V2/V3 that evaluates candidates poses per
+# tetrahedron and visit in one vectorized pass
+# Rotation angles are drawn as in the serial strategies, with random directions
+# since the best candidate is picked afterwards
+class BatchedMoves(packingEngine.MoveStrategy):
+	def __init__(self, variant='V2', candidates=8):
+		assert variant in ('V2', 'V3'), "Batched moves support the V2 and V3 variants, not {0}".format(variant)
+		assert candidates >= 1
+		self.variant = variant
+		self.candidates = candidates
+
+	def start(self, engine):
+		self.reach = 2*engine.state.circumradius()
+
+	def propose(self, engine, i, timed=False):
+		state = engine.state
+		stats = engine.stats
+		grid = engine.grid
+		centerOfMass = engine.centerOfMass
+		candidates = self.candidates
+
+		if timed:
+			start = time.time()
+		# get translations, with the local optimization bias for V3
+		tvecs = propose_translations(state.centroids[i], centerOfMass, state.scales[i], candidates)
+		target = None
+		if self.variant == 'V3':
+			j = grid.nearest(state.centroids[i], i)
+			if j is not None:
+				target = state.centroids[j]
+				bias = target - state.centroids[i]
+				tvecs += state.scales[i]*np.random.uniform(np.minimum(bias,0), np.maximum(bias,0), tvecs.shape)
+		if engine.deferred(i, tvecs):
+			return None
+		# get rotations, composed from one rotation in every plane
+		degrees = np.random.uniform(state.rotranges[i], size=(candidates, 3))*np.random.choice((-1.0, 1.0), (candidates, 3))
+		rotations = plane_rotations(degrees)
+		# test the poses as the state will store them
+		tvecs = state.stored_translation(i, tvecs)
+		centroids = state.centroids[i] + tvecs
+		poses = centroids[:,None,:] + np.matmul(state.reference, np.swapaxes(state.stored_orientations(np.matmul(rotations, state.orientations[i])), 1, 2))
+		if timed:
+			stats.add_time('rotation', time.time()-start)
+			start = time.time()
+		# test every candidate in one backend call
+		feasible, exact, skipped = feasible_candidates(state, i, poses, centroids, grid, engine.backend, self.reach, engine.separation)
+		if stats is not None:
+			stats.record_pairs(0, exact, skipped)
+			if timed:
+				stats.add_time('collision', time.time()-start)
+
+		# accept the best feasible candidate, or let the schedule scale back the step
+		# size and rotation range if every one of them collides
+		accepted = bool(feasible.any())
+		engine.schedule.translated(state, i, accepted)
+		engine.schedule.rotated(state, i, accepted)
+		if accepted:
+			score = net_distances(centerOfMass, poses)
+			if target is not None:
+				score += net_distances(target, poses)
+			best = np.argmin(np.where(feasible, score, np.inf))
+			engine.apply(i, tvecs[best], rotations[best], timed)
+		else:
+			engine.apply(i, None, None, timed)
+		return accepted, accepted
@@ -0,0 +1,204 @@
+import argparse
+import json
+import sys
+import time
+import numpy as np
+import collision
+import initialConfig
+import packingEngine
+import util
+from convexPolygon import Simplex
+
+# Benchmarks for collision throughput, sweep cost and convergence rate
+# Every benchmark uses fixed seeds; results are emitted as JSON and can be
+# compared against a stored baseline to flag regressions
+# Timings only compare against a baseline taken on the same machine, while the
+# densities reached after a fixed number of iterations are the same everywhere,
+# so the stored baseline only holds those (see PORTABLE)
+
+# Whether a larger value of each kind of metric is better
+HIGHER_IS_BETTER = {'pairs_per_second': True, 'seconds_per_sweep': False, 'density_per_second': True, 'density': True, 'iterations_to_density': False}
+
+# Kinds of metrics that do not depend on the machine running the benchmarks
+PORTABLE = ('density', 'iterations_to_density')
+
+# Step schedules compared by bench_schedule: geometric decay with the default
+# reductions of main.py and of the packing functions, and the adaptive schedule
+SCHEDULES = (('geometric0.999', lambda: packingEngine.GeometricSchedule(0.999, 0.999)),
+			 ('geometric0.95', lambda: packingEngine.GeometricSchedule(0.95, 0.95)),
+			 ('adaptive', packingEngine.AdaptiveSchedule))
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Tetrahedron Packing Benchmarks")
+	parser.add_argument("-o", "--output", help="write the JSON results to this file instead of stdout", default=None)
+	parser.add_argument("-b", "--baseline", help="compare against the JSON results stored in this file", default=None)
+	parser.add_argument("-sb", "--savebaseline", help="store the results as the new baseline in this file", default=None)
+	parser.add_argument("-t", "--tolerance", type=float, help="relative slowdown tolerated before a metric is flagged", default=0.2)
+	parser.add_argument("-cb", "--backends", nargs='+', help="collision backends to benchmark", default=['numpy'])
+	parser.add_argument("-n", "--sizes", type=int, nargs='+', help="numbers of tetrahedra for the sweep benchmarks", default=[4, 16, 64, 256, 1024, 2048])
+	parser.add_argument("-s", "--sweeps", type=int, help="sweeps timed per size", default=2)
+	parser.add_argument("-r", "--repeats", type=int, help="repetitions of each timing, the fastest is reported", default=3)
+	parser.add_argument("-p", "--pairs", type=int, help="pairs per collision benchmark", default=2000)
+	parser.add_argument("-dn", "--densitytetras", type=int, help="number of tetrahedra for the density benchmark", default=32)
+	parser.add_argument("-di", "--densityiterations", type=int, help="iterations for the density benchmark", default=200)
+	parser.add_argument("-ss", "--scheduleseeds", type=int, nargs='+', help="seeds of the schedule benchmark, which uses the size and iterations of the density benchmark", default=[0, 1, 2])
+	parser.add_argument("-sd", "--scheduledensity", type=float, help="box density the schedule benchmark counts iterations to", default=0.09)
+	parser.add_argument("-po", "--portable", help="only run the benchmarks whose results do not depend on the machine and leave out timings", action='store_true')
+	return parser.parse_args()
+
+# Random pairs of tetrahedra that are known to overlap (overlapping=True) or to be
+# disjoint, all close enough to pass the centroid filter
+def benchmark_pairs(numpairs, overlapping, seed=0):
+	rng = np.random.RandomState(seed)
+	ps = []
+	qs = []
+	while len(ps) < numpairs:
+		p, q = collision.random_pairs(numpairs, 0.3, rng)
+		keep = collision.intersect_pairs(p, q) == overlapping
+		ps.extend(p[keep])
+		qs.extend(q[keep])
+	return np.array(ps[:numpairs]), np.array(qs[:numpairs])
+
+# Shortest wall time of repeats calls to f
+def best_time(f, repeats):
+	times = []
+	for _ in range(repeats):
+		start = time.time()
+		f()
+		times.append(time.time()-start)
+	return min(times)
+
+# Pairs per second through util.collision_detection and through a single
+# batched backend call
+def bench_collisions(backendname, numpairs, repeats):
+	results = {}
+	backend = collision.make_backend(backendname)
+	subproc = getattr(backend, 'subproc', None)
+	for kind, overlapping in (('overlapping', True), ('disjoint', False)):
+		ps, qs = benchmark_pairs(numpairs, overlapping)
+		pairs = [(Simplex(p), Simplex(q)) for p, q in zip(ps, qs)]
+		def detect():
+			for s1, s2 in pairs:
+				util.collision_detection(s1, s2, subproc)
+		results['collision_detection/'+backendname+'/'+kind+'/pairs_per_second'] = numpairs/best_time(detect, repeats)
+		results['intersect_pairs/'+backendname+'/'+kind+'/pairs_per_second'] = numpairs/best_time(lambda: backend.intersect_pairs(ps, qs), repeats)
+	backend.close()
+	return results
+
+# Wall time per sweep of V2 and V3 as the number of tetrahedra grows
+# The time to generate the starting configuration is measured separately and
+# subtracted by timing a zero iteration run with the same seed
+def bench_sweeps(sizes, sweeps, repeats):
+	results = {}
+	backend = collision.make_backend('numpy')
+	for name, packing in (('V2', util.randomizedGuidedPackingV2), ('V3', util.randomizedGuidedPackingV3)):
+		for n in sizes:
+			def setup():
+				np.random.seed(n)
+				packing(n, max_iters=0, backend=backend)
+			def run():
+				np.random.seed(n)
+				packing(n, max_iters=sweeps, stepscalereduction=0.999, rotreduction=0.999, backend=backend)
+			elapsed = best_time(run, repeats)-best_time(setup, repeats)
+			results['sweep/'+name+'/n'+str(n)+'/seconds_per_sweep'] = max(elapsed, 0.0)/sweeps
+	backend.close()
+	return results
+
+# Starting configuration that compresses: a lattice at packing fraction 0.05,
+# loose enough to need no overlap repair, with a small initial step scale
+# The spread out start with the default step scale of 0.9 mostly expands
+def compressing_start(numtetras, seed):
+	np.random.seed(seed)
+	state = initialConfig.initial_state(numtetras, 'lattice', 0.05)
+	state.reset_schedule(0.2, 360.0)
+	return state
+
+# Box density reached after iterations sweeps, and per second of wall clock time
+# unless portable is set
+def bench_density(numtetras, iterations, portable=False):
+	results = {}
+	backend = collision.make_backend('numpy')
+	for name, packing in (('V2', util.randomizedGuidedPackingV2), ('V3', util.randomizedGuidedPackingV3)):
+		state = compressing_start(numtetras, 0)
+		start = time.time()
+		state = packing(numtetras, max_iters=iterations, stepscalereduction=0.999, rotreduction=0.999, backend=backend, state=state)
+		elapsed = time.time()-start
+		key = 'density/'+name+'/n'+str(numtetras)+'/'
+		results[key+'density'] = util.boxDensity(state)
+		if not portable:
+			results[key+'density_per_second'] = results[key+'density']/elapsed
+	backend.close()
+	return results
+
+# Iterations to density under each of SCHEDULES, from the same compressing start
+# for every seed: the mean box density reached after iterations sweeps and the
+# mean number of sweeps until the box density first reaches target, counting
+# runs that never do as iterations
+def bench_schedule(numtetras, iterations, seeds, target):
+	results = {}
+	backend = collision.make_backend('numpy')
+	for name, packing in (('V2', util.randomizedGuidedPackingV2), ('V3', util.randomizedGuidedPackingV3)):
+		for schedulename, make_schedule in SCHEDULES:
+			densities = []
+			reached = []
+			for seed in seeds:
+				first = [iterations]
+				def watch(iteration, state):
+					if first[0] == iterations and util.boxDensity(state) >= target:
+						first[0] = iteration+1
+					return False
+				state = packing(numtetras, max_iters=iterations, backend=backend, callback=watch, state=compressing_start(numtetras, seed), schedule=make_schedule())
+				densities.append(util.boxDensity(state))
+				reached.append(first[0])
+			key = 'schedule/'+name+'/n'+str(numtetras)+'/'+schedulename+'/'
+			results[key+'density'] = float(np.mean(densities))
+			results[key+'iterations_to_density'] = float(np.mean(reached))
+	backend.close()
+	return results
+
+# Compares results against a baseline and returns a list of human readable
+# descriptions of every metric that got worse by more than tolerance
+def compare(results, baseline, tolerance):
+	regressions = []
+	for key in sorted(results):
+		if key not in baseline or baseline[key] <= 0 or results[key] <= 0:
+			continue
+		kind = key.split('/')[-1]
+		if HIGHER_IS_BETTER[kind]:
+			change = results[key]/baseline[key] - 1
+			worse = change < -tolerance
+		else:
+			change = baseline[key]/results[key] - 1
+			worse = change < -tolerance
+		if worse:
+			regressions.append(key+": "+str(baseline[key])+" -> "+str(results[key])+" ("+str(int(round(100*change)))+"%)")
+	return regressions
+
+def main():
+	args = parse_args()
+	results = {}
+	if not args.portable:
+		for backendname in args.backends:
+			results.update(bench_collisions(backendname, args.pairs, args.repeats))
+		results.update(bench_sweeps(args.sizes, args.sweeps, args.repeats))
+	results.update(bench_density(args.densitytetras, args.densityiterations, args.portable))
+	results.update(bench_schedule(args.densitytetras, args.densityiterations, args.scheduleseeds, args.scheduledensity))
+	report = json.dumps(results, indent=1, sort_keys=True)
+	if args.output is not None:
+		with open(args.output, "w") as f:
+			f.write(report+"\n")
+	else:
+		print(report)
+	if args.savebaseline is not None:
+		with open(args.savebaseline, "w") as f:
+			f.write(report+"\n")
+	if args.baseline is not None:
+		with open(args.baseline) as f:
+			regressions = compare(results, json.load(f), args.tolerance)
+		for regression in regressions:
+			sys.stderr.write("REGRESSION "+regression+"\n")
+		if regressions:
+			sys.exit(1)
+
+if __name__ == "__main__":
+	main()
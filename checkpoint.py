@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+from packingState import PackingState, CompactPackingState
+from periodic import PeriodicCell
+
+# Copies everything needed to continue a packing run bit for bit: the poses and
+# vertices of all tetrahedra, the running center of mass bookkeeping, the
+# per-tetrahedron schedule, the iteration counter, the periodic cell if there is
+# one and the NumPy RNG state
+# A CompactPackingState is stored as its records, which hold its poses and
+# schedule, so no float64 poses or vertices are made for it
+# schedule and activeset may be the step schedule and the active set of the run,
+# whose saved arrays are stored with a schedule_ and an activeset_ prefix
+def snapshot(state, params=None, schedule=None, activeset=None):
+	rngName, rngKeys, rngPos, rngHasGauss, rngCachedGaussian = np.random.get_state()
+	arrays = {'reference': state.reference.copy(),
+			'basis': state.basis.copy(),
+			'centroid_sum': state.centroid_sum.copy(),
+			'counters': np.array([state.updates_since_resum, state.resum_interval, state.iteration]),
+			'cell': np.array([] if state.cell is None else [state.cell.length, state.cell.shrink]),
+			'rng_name': np.array(rngName),
+			'rng_keys': rngKeys.copy(),
+			'rng_scalars': np.array([rngPos, rngHasGauss, rngCachedGaussian], dtype=float),
+			'params': np.array(json.dumps(params or {}))}
+	if isinstance(state, CompactPackingState):
+		arrays['records'] = np.array(state.records)
+	else:
+		arrays.update({'centroids': state.centroids.copy(),
+					   'orientations': state.orientations.copy(),
+					   'verts': state.verts.copy(),
+					   'scales': state.scales.copy(),
+					   'rotranges': state.rotranges.copy(),
+					   'converged': state.converged.copy()})
+	for prefix, part in (('schedule_', schedule), ('activeset_', activeset)):
+		if part is not None:
+			for key, value in part.save().items():
+				arrays[prefix+key] = value
+	return arrays
+
+# Writes a snapshot to path atomically: the data goes to a temporary file in the
+# same directory which is synced and then renamed over path
+def write_snapshot(path, arrays):
+	tmp = path+'.tmp'
+	with open(tmp, 'wb') as f:
+		np.savez(f, **arrays)
+		f.flush()
+		os.fsync(f.fileno())
+	os.rename(tmp, path)
+
+# Writes a checkpoint of state (and of the global NumPy RNG) to path
+# params may hold any JSON-serializable run parameters to store alongside
+def save_checkpoint(path, state, params=None, schedule=None, activeset=None):
+	write_snapshot(path, snapshot(state, params, schedule, activeset))
+
+# Loads a checkpoint written by save_checkpoint, restores the global NumPy RNG
+# and returns the PackingState and the stored run parameters
+# A compact state is loaded into memory, or into a new memory-mapped file at path
+def load_checkpoint(path, statepath=None):
+	with np.load(path) as data:
+		counters = data['counters']
+		if 'records' in data:
+			records = data['records']
+			state = CompactPackingState.__new__(CompactPackingState)
+			state.allocate(data['reference'], len(records), data['basis'], int(counters[1]), statepath)
+			state.records[:] = records
+		else:
+			state = PackingState(data['reference'], data['centroids'], data['orientations'], data['basis'], int(counters[1]))
+			# the constructor re-orthonormalizes, so restore the exact stored arrays
+			state.orientations = data['orientations']
+			state.verts = data['verts']
+			state.scales = data['scales']
+			state.rotranges = data['rotranges']
+			state.converged = data['converged']
+		state.centroid_sum = data['centroid_sum']
+		state.updates_since_resum = int(counters[0])
+		state.iteration = int(counters[2])
+		if 'cell' in data and len(data['cell']):
+			state.cell = PeriodicCell(*data['cell'])
+		rngPos, rngHasGauss, rngCachedGaussian = data['rng_scalars']
+		np.random.set_state((str(data['rng_name']), data['rng_keys'], int(rngPos), int(rngHasGauss), float(rngCachedGaussian)))
+		params = json.loads(str(data['params']))
+	return state, params
+
+# Hands the arrays stored with prefix in the checkpoint at path to part, which
+# continues from them when the resumed run starts
+def load_part(path, prefix, part):
+	with np.load(path) as data:
+		part.restore(dict((key[len(prefix):], data[key]) for key in data.files if key.startswith(prefix)))
+
+def load_schedule(path, schedule):
+	load_part(path, 'schedule_', schedule)
+
+def load_activeset(path, activeset):
+	load_part(path, 'activeset_', activeset)
+
+# Packing callback that checkpoints the run every interval seconds
+# The state is copied at the end of a sweep and written by a background thread,
+# so the sweep only waits for the copy; if the previous write has not finished
+# yet the checkpoint is postponed to the next sweep
+class Checkpointer(object):
+	def __init__(self, path, interval=5.0, params=None, schedule=None, activeset=None):
+		self.path = path
+		self.interval = interval
+		self.params = params
+		self.schedule = schedule
+		self.activeset = activeset
+		self.last = time.time()
+		self.writer = None
+		self.written = 0
+
+	def __call__(self, iteration, state):
+		if time.time()-self.last < self.interval:
+			return False
+		if self.writer is not None and self.writer.is_alive():
+			return False
+		arrays = snapshot(state, self.params, self.schedule, self.activeset)
+		self.writer = threading.Thread(target=write_snapshot, args=(self.path, arrays))
+		self.writer.start()
+		self.last = time.time()
+		self.written += 1
+		return False
+
+	# Waits for a pending write and then writes a final checkpoint of state
+	def close(self, state=None):
+		if self.writer is not None:
+			self.writer.join()
+		if state is not None:
+			save_checkpoint(self.path, state, self.params, self.schedule, self.activeset)
+			self.written += 1
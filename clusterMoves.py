@@ -0,0 +1,191 @@
+import numpy as np
+import collision
+import util
+from convexPolygon import rotation_matrix
+
+# Collective moves of jammed groups of tetrahedra
+# Late in a packing, and especially with the nearest neighbour bias of V3,
+# tetrahedra end up in tight groups where every single move collides, so their
+# step scales decay to the threshold although the group as a whole could still
+# move towards the center of mass. Every few sweeps, and before a run would end
+# as converged, the tetrahedra whose step scale has fallen below jamscale are
+# grouped into clusters of mutual near-contacts (a separation bound of at most gap,
+# grown breadth first up to maxsize members), and every cluster of two or more is
+# offered a rigid translation towards the center of mass and a rigid rotation
+# about its centroid. Members cannot collide with each other under a rigid move,
+# so proposals are only tested against the tetrahedra outside the cluster, all
+# pairs in one backend call. Each proposal is retried up to attempts times with
+# the step scale and rotation range halved after every collision. Once a cluster
+# has moved, the tetrahedra around where it was get their step scale raised to at
+# least wakescale, so they can follow into the space it left
+class ClusterMoves(object):
+	def __init__(self, gap=0.02, maxsize=4, every=5, jamscale=0.01, stepscale=0.01, rotrange=5.0, attempts=8, wakescale=0.01):
+		assert gap >= 0
+		assert maxsize >= 2
+		assert every >= 1
+		self.gap = gap
+		self.maxsize = maxsize
+		self.every = every
+		self.jamscale = jamscale
+		self.stepscale = stepscale
+		self.rotrange = rotrange
+		self.attempts = attempts
+		self.wakescale = wakescale
+		self.proposed = 0
+		self.accepted = 0
+		self.history = []
+
+	# Whether the phase runs after sweep iteration, or now because the run has
+	# converged otherwise
+	def due(self, iteration, converged):
+		return converged or iteration % self.every == self.every-1
+
+	# Groups the jammed tetrahedra (a boolean mask) of state into clusters of
+	# mutual near-contacts, visiting seeds in random order
+	# Returns a list of index lists, leaving out single tetrahedra
+	def find_clusters(self, state, grid, jammed):
+		reach = 2*state.circumradius()
+		assigned = np.zeros(len(state), dtype=bool)
+		clusters = []
+		for seed in np.random.permutation(np.flatnonzero(jammed)):
+			if assigned[seed]:
+				continue
+			assigned[seed] = True
+			members = [seed]
+			k = 0
+			while k < len(members) and len(members) < self.maxsize:
+				u = members[k]
+				k += 1
+				# in index order, so clusters do not depend on the order of the grid cells
+				near = sorted(j for j in grid.neighbours(state.centroids[u], u, count=False) if jammed[j] and not assigned[j])
+				if not near:
+					continue
+				near = np.array(near)
+				near = near[np.linalg.norm(state.centroids[near]-state.centroids[u], axis=1) <= reach]
+				if not len(near):
+					continue
+				for j, bound in zip(near, collision.separation_bounds(state.verts[u], state.verts[near])):
+					if bound <= self.gap and len(members) < self.maxsize:
+						assigned[j] = True
+						members.append(j)
+			if len(members) > 1:
+				clusters.append(members)
+		return clusters
+
+	# Whether candidate vertices (kx4x3) for the members of a cluster overlap any
+	# tetrahedron outside it, as the engine's strategy sees their surroundings
+	def collides(self, engine, members, candidates):
+		inside = set(members)
+		ks = []
+		others = []
+		for k, c in enumerate(candidates.mean(axis=1)):
+			near, verts = engine.strategy.surroundings(engine, c, inside)
+			ks.extend([k]*len(near))
+			others.append(verts)
+		if engine.stats is not None:
+			engine.stats.record_pairs(0, len(ks))
+		if not ks:
+			return False
+		return np.asarray(engine.backend.intersect_pairs(candidates[ks], np.concatenate(others)), dtype=bool).any()
+
+	# Rotation about anchor composed from one random rotation in every plane, each
+	# flipped if it moves the vertices away from centerOfMass, as in V2
+	def rotation(self, centerOfMass, vertices, anchor, rotrange):
+		points = vertices.reshape(-1, 3)
+		netdist = util.net_distance(centerOfMass, points)
+		rotation = np.eye(3)
+		for j in range(3):
+			for k in range(j+1, 3):
+				planeRotation = rotation_matrix(np.random.uniform(rotrange), (j,k), 'deg')
+				if util.net_distance(centerOfMass, np.dot(points-anchor, planeRotation.T) + anchor) > netdist:
+					planeRotation = planeRotation.T
+				rotation = np.dot(planeRotation, rotation)
+		return rotation
+
+	# Translations of the centroids of members and their vertices after a rigid
+	# translation by tvec followed by a rotation about anchor, from the poses the
+	# state will store
+	def moved_vertices(self, state, members, tvec, rotation, anchor):
+		centroids = np.array(state.centroids[members], dtype=float)
+		# the rigid move takes centroid c to R(c+t-anchor)+anchor
+		shifts = state.stored_translation(members, np.dot(centroids+tvec-anchor, rotation.T) + anchor - centroids)
+		orientations = state.stored_orientations(np.matmul(rotation, np.asarray(state.orientations[members])))
+		return shifts, (centroids+shifts)[:,None,:] + np.matmul(state.reference, np.swapaxes(orientations, 1, 2))
+
+	# Proposes a rigid translation and then a rigid rotation of the cluster and
+	# applies whatever part of the move is free of collisions
+	# Returns whether the cluster moved
+	def move_cluster(self, engine, members):
+		state = engine.state
+		centerOfMass = engine.centerOfMass
+		members = np.array(members)
+		verts = state.verts[members]
+		anchor = np.asarray(state.centroids[members], dtype=float).mean(axis=0)
+		self.proposed += 1
+
+		# shifts holds the centroid translations of the move accepted so far
+		tvec = np.zeros(3)
+		shifts = None
+		for attempt in range(self.attempts):
+			proposal = util.propose_translation(anchor, centerOfMass, self.stepscale*0.5**attempt)
+			candidateShifts, candidates = self.moved_vertices(state, members, proposal, np.eye(3), anchor)
+			if not self.collides(engine, members, candidates):
+				tvec = proposal
+				shifts = candidateShifts
+				verts = candidates
+				anchor = anchor + tvec
+				break
+
+		rotation = np.eye(3)
+		for attempt in range(self.attempts):
+			proposal = self.rotation(centerOfMass, verts, anchor, self.rotrange*0.5**attempt)
+			candidateShifts, candidates = self.moved_vertices(state, members, tvec, proposal, anchor)
+			if not self.collides(engine, members, candidates):
+				rotation = proposal
+				shifts = candidateShifts
+				break
+
+		if shifts is None:
+			return False
+		oldCentroids = np.array(state.centroids[members], dtype=float)
+		for i, oldCentroid, shift in zip(members, oldCentroids, shifts):
+			oldVerts = state.verts[i].copy()
+			state.move(i, shift, rotation)
+			engine.grid.move(i, state.centroids[i])
+			if engine.activeset is not None:
+				engine.activeset.moved(i, oldCentroid, oldVerts)
+			if engine.separation is not None:
+				engine.separation.moved(i, oldVerts)
+		self.wake(engine, members, oldCentroids)
+		engine.centerOfMass = state.com()
+		self.accepted += 1
+		return True
+
+	# Raises the step scale of the tetrahedra that were within reach of the members
+	# before the move to at least wakescale, so they can follow into the space the
+	# cluster left
+	def wake(self, engine, members, oldCentroids):
+		state = engine.state
+		reach = 2*state.circumradius()
+		inside = set(members.tolist())
+		for c in oldCentroids:
+			near = engine.grid.neighbours(c, count=False)
+			for k, d in zip(near, engine.grid.distances(c, near)):
+				if k in inside or state.scales[k] >= self.wakescale or d > reach:
+					continue
+				state.scales[k] = self.wakescale
+				state.converged[k] = False
+				if engine.activeset is not None:
+					engine.activeset.active.add(k)
+
+	# Runs one phase of collective moves on the engine's state
+	# Returns the number of clusters that moved
+	def phase(self, engine):
+		state = engine.state
+		clusters = self.find_clusters(state, engine.grid, state.scales < self.jamscale)
+		moved = 0
+		for members in clusters:
+			if self.move_cluster(engine, members):
+				moved += 1
+		self.history.append((state.iteration, len(clusters), moved))
+		return moved
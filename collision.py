@@ -0,0 +1,511 @@
+import numpy as np
+import fcntl
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+import Queue
+from collections import deque
+
+# NumPy port of the Ganovelli-Ponchio-Rocchini tetrahedron overlap test used by
+# tetrahedron-intersect.clj. Every step mirrors the Clojure implementation
+# (including orient-tetra and its bit tests) and evaluates the same floating
+# point expressions in the same order, so both backends agree pair for pair.
+# All functions operate on stacks of tetrahedra with shape (m,4,3); a single
+# tetrahedron of shape (1,4,3) broadcasts against a stack of neighbours.
+
+# Dot product over the last axis, summed in the same order as the Clojure dot
+def _dot(a, b):
+	return (a[...,0]*b[...,0] + a[...,1]*b[...,1]) + a[...,2]*b[...,2]
+
+# Cross product over the last axis, matching the Clojure cross
+def _cross(a, b):
+	return np.stack([a[...,1]*b[...,2] - a[...,2]*b[...,1],
+					 a[...,2]*b[...,0] - a[...,0]*b[...,2],
+					 a[...,0]*b[...,1] - b[...,0]*a[...,1]], axis=-1)
+
+# Same as the Clojure normalize, which divides by the squared magnitude
+# Only the sign of results built from it is ever used
+def _normalize(v):
+	m = _dot(v, v)
+	safe = np.where(m > 0, m, 1.0)
+	return np.where((m > 0)[...,None], v/safe[...,None], v)
+
+# Bit mask of the positive entries of an (m,4) array of affine coordinates
+def _mask(affine):
+	positive = (affine > 0).astype(np.int64)
+	return positive[:,0] | (positive[:,1] << 1) | (positive[:,2] << 2) | (positive[:,3] << 3)
+
+# Reorders the vertices of each tetrahedron so that the last vertex lies on the
+# opposite side of the plane defined by the first three, as orient-tetra does
+def orient_tetra(tetras):
+	a = tetras[:,0]
+	b = tetras[:,1]
+	c = tetras[:,2]
+	d = tetras[:,3]
+	dp = _dot(_normalize(d-a), _normalize(_cross(b-a, c-a)))
+	swap = ~(dp < 0)
+	oriented = np.array(tetras, dtype=float)
+	oriented[swap,1] = tetras[swap,2]
+	oriented[swap,2] = tetras[swap,1]
+	return oriented
+
+# Edge test between two faces of the first tetrahedron
+# Returns True where the faces' shared edge yields a separating plane
+def _edge_a(ma, mb, ea, eb):
+	xa = ma & (ma ^ mb)
+	xb = mb & (xa ^ mb)
+	def edge(a, b, i, j):
+		cp = ea[:,i]*eb[:,j] - ea[:,j]*eb[:,i]
+		return (((cp > 0) & ((xa & a) > 0) & ((xb & b) > 0)) |
+				((cp < 0) & ((xa & b) > 0) & ((xb & a) > 0)))
+	return ~(((ma | mb) != 15) |
+			 edge(1, 2, 1, 0) |
+			 edge(1, 4, 2, 0) |
+			 edge(1, 8, 3, 0) |
+			 edge(2, 4, 2, 1) |
+			 edge(2, 8, 3, 1) |
+			 edge(4, 8, 3, 2))
+
+# Tests every pair (p[k], q[k]) for overlap
+# p and q are arrays of shape (m,4,3), or (1,4,3) to broadcast one tetrahedron
+# Returns a boolean array of length m
+def intersect_pairs(p, q):
+	p = orient_tetra(np.asarray(p, dtype=float))
+	q = orient_tetra(np.asarray(q, dtype=float))
+	pa, pb, pc, pd = p[:,0], p[:,1], p[:,2], p[:,3]
+	qa, qb, qc, qd = q[:,0], q[:,1], q[:,2], q[:,3]
+
+	# faces of p as candidate separating planes, with the edge checks in between
+	deltas = q - pa[:,None,:]
+	e0 = pb-pa
+	e1 = pc-pa
+	e2 = pd-pa
+	e3 = pc-pb
+	e4 = pd-pb
+	affine = [_dot(deltas, _cross(e0, e1)[:,None,:]),
+			  _dot(deltas, _cross(e2, e0)[:,None,:]),
+			  _dot(deltas, _cross(e1, e2)[:,None,:]),
+			  _dot(q - pb[:,None,:], _cross(e4, e3)[:,None,:])]
+	masks = [_mask(a) for a in affine]
+	separated = (masks[0] == 15) | (masks[1] == 15) | (masks[2] == 15) | (masks[3] == 15)
+	for a, b in ((0, 1), (0, 2), (1, 2), (0, 3), (1, 3), (2, 3)):
+		separated |= _edge_a(masks[a], masks[b], affine[a], affine[b])
+	# some vertex of q lies inside every face of p
+	contained = (masks[0] | masks[1] | masks[2] | masks[3]) != 15
+
+	# faces of q as candidate separating planes
+	deltas = p - qa[:,None,:]
+	f0 = qb-qa
+	f1 = qc-qa
+	f2 = qd-qa
+	f3 = qc-qb
+	f4 = qd-qb
+	separatedB = ((_dot(deltas, _cross(f0, f1)[:,None,:]) > 0).all(axis=1) |
+				  (_dot(deltas, _cross(f2, f0)[:,None,:]) > 0).all(axis=1) |
+				  (_dot(deltas, _cross(f1, f2)[:,None,:]) > 0).all(axis=1) |
+				  (_dot(p - qb[:,None,:], _cross(f4, f3)[:,None,:]) > 0).all(axis=1))
+
+	return ~separated & (contained | ~separatedB)
+
+# Tests one tetrahedron (4x3) against an array of neighbours (mx4x3)
+# Returns a boolean array of length m
+def intersect_many(p, qs):
+	qs = np.asarray(qs, dtype=float)
+	if len(qs) == 0:
+		return np.zeros(0, dtype=bool)
+	return intersect_pairs(np.asarray(p, dtype=float)[None], qs)
+
+# Returns True if the two tetrahedra (4x3 each) overlap
+def intersect_tetrahedra(p, q):
+	return bool(intersect_many(p, [q])[0])
+
+# Vertex indices of the four faces of a tetrahedron, one face per column
+FACES = np.array([[1,0,0,0],[2,2,1,1],[3,3,3,2]])
+
+# Lower bounds on the distance between a tetrahedron p (4x3) and each of the
+# tetrahedra in qs (mx4x3), zero where they may touch or overlap
+# Projecting onto a unit axis never lengthens a distance, so the gap between the
+# projected vertex ranges along any axis is a lower bound, and a positive one
+# proves the pair disjoint; the face normals of both tetrahedra and the line
+# through their centroids are tried and the largest gap kept
+def separation_bounds(p, qs):
+	p = np.asarray(p, dtype=float)
+	qs = np.asarray(qs, dtype=float)
+	if len(qs) == 0:
+		return np.zeros(0)
+	tetras = np.concatenate([p[None], qs])
+	a = tetras[:,FACES[0]]
+	normals = _cross(tetras[:,FACES[1]]-a, tetras[:,FACES[2]]-a)
+	axes = np.empty((len(qs), 9, 3))
+	axes[:,:4] = normals[0]
+	axes[:,4:8] = normals[1:]
+	axes[:,8] = qs.mean(axis=1)-p.mean(axis=0)
+	norms = np.sqrt(_dot(axes, axes))
+	axes /= np.where(norms > 0, norms, np.inf)[...,None]
+	pp = np.matmul(axes, p.T)
+	qq = np.matmul(axes, np.swapaxes(qs, 1, 2))
+	gaps = np.maximum(qq.min(axis=2)-pp.max(axis=2), pp.min(axis=2)-qq.max(axis=2))
+	return np.maximum(gaps.max(axis=1), 0.0)
+
+# Tests one tetrahedron p (4x3) against each of the tetrahedra in qs (mx4x3) for a
+# vertex of either lying strictly inside the other, which proves that they overlap
+# Most overlaps between slightly moved neighbours are of this kind, and it is far
+# cheaper than the exact test
+def vertex_overlaps(p, qs):
+	p = np.asarray(p, dtype=float)
+	qs = np.asarray(qs, dtype=float)
+	if len(qs) == 0:
+		return np.zeros(0, dtype=bool)
+	tetras = np.concatenate([p[None], qs])
+	a = tetras[:,FACES[0]]
+	normals = _cross(tetras[:,FACES[1]]-a, tetras[:,FACES[2]]-a)
+	offsets = _dot(normals, a)
+	# point every normal towards the vertex opposite its face, vertex k for face k
+	signs = np.sign(_dot(normals, tetras)-offsets)
+	normals = normals*signs[...,None]
+	offsets = offsets*signs
+	pInside = (np.matmul(p, np.swapaxes(normals[1:], 1, 2)) > offsets[1:,None,:]).all(axis=2).any(axis=1)
+	qInside = (np.matmul(qs, normals[0].T) > offsets[0]).all(axis=2).any(axis=1)
+	return pInside | qInside
+
+# Starts a clojure REPL subprocess and asks it to load the intersection code
+# without waiting for it to finish, so several REPLs can boot concurrently
+def spawn_clojure_repl(script="tetrahedron-intersect.clj"):
+	subproc = subprocess.Popen('clojure', stdout=subprocess.PIPE, stdin=subprocess.PIPE)
+	subproc.stdin.write('(clojure.main/load-script "'+script+'")')
+	subproc.stdin.write('(flush)')
+	return subproc
+
+# Waits until a spawned clojure REPL has loaded the intersection code
+def wait_clojure_repl(subproc):
+	subproc.stdout.readline() # flush out useless line
+	subproc.stdout.readline() # flush out useless line
+
+# Starts a clojure REPL subprocess with the intersection code loaded
+def start_clojure_repl(script="tetrahedron-intersect.clj"):
+	subproc = spawn_clojure_repl(script)
+	wait_clojure_repl(subproc)
+	return subproc
+
+# Asks a running clojure REPL whether two tetrahedra, given as clojure
+# vector literals, intersect
+def clojure_intersect(subproc, string1, string2):
+	command = '(prn (intersect-tetrahedra? '+string1+' '+string2+'))'
+	subproc.stdin.write(command)
+	subproc.stdin.write('(flush)')
+	subproc.stdout.readline() # flush out empty line
+	collided = subproc.stdout.readline()
+	subproc.stdout.readline() # flush out empty line
+	return collided == 'true\n'
+
+# Formats a 4x3 array as a clojure vector literal
+# repr keeps full double precision so the REPL sees exactly the same numbers
+def format_tetra(vertices):
+	return '['+' '.join('['+' '.join(repr(float(x)) for x in vertex)+']' for vertex in vertices)+']'
+
+# Formats any array of coordinates as one flat clojure vector of numbers,
+# the compact format of the batch protocol
+def format_numbers(coordinates):
+	return '['+' '.join(repr(float(x)) for x in np.ravel(coordinates))+']'
+
+# In-process collision backend using the vectorized NumPy implementation
+class NumpyBackend(object):
+	name = 'numpy'
+	threadsafe = True
+
+	# Returns a boolean array telling which of qs overlap p
+	def intersect(self, p, qs):
+		return intersect_many(p, qs)
+
+	# Returns True if p overlaps any of qs
+	def intersects_any(self, p, qs):
+		return bool(intersect_many(p, qs).any())
+
+	# Returns a boolean array telling which pairs (ps[k], qs[k]) overlap
+	def intersect_pairs(self, ps, qs):
+		return intersect_pairs(ps, qs)
+
+	def close(self):
+		pass
+
+# Reply to a request queued on a ClojureBackend, filled in when read back
+class PendingReply(object):
+	def __init__(self, backend):
+		self.backend = backend
+		self.done = False
+		self.value = None
+
+	# Blocks until the reply has been read and returns it as a boolean array
+	def result(self):
+		while not self.done:
+			self.backend._receive()
+		return self.value
+
+# Collision backend that sends batches of tetrahedra to a clojure REPL subprocess
+# Kept for parity testing against the NumPy implementation
+# Requests are pipelined: submit writes a batch and returns immediately, so the
+# next batch can be queued before the reply to the previous one has arrived
+class ClojureBackend(object):
+	name = 'clojure'
+	threadsafe = False
+
+	# max_pending bounds the number of unanswered requests so that neither pipe
+	# buffer can fill up and deadlock the two processes
+	def __init__(self, script="tetrahedron-intersect.clj", wait=True, max_pending=16):
+		self.subproc = spawn_clojure_repl(script)
+		self.pending = deque()
+		self.max_pending = max_pending
+		if wait:
+			wait_clojure_repl(self.subproc)
+
+	# Waits until the REPL has loaded the intersection code
+	def wait(self):
+		wait_clojure_repl(self.subproc)
+
+	def _send(self, command):
+		while len(self.pending) >= self.max_pending:
+			self._receive()
+		self.subproc.stdin.write('(prn '+command+')')
+		self.subproc.stdin.write('(flush)')
+		reply = PendingReply(self)
+		self.pending.append(reply)
+		return reply
+
+	# Reads the reply to the oldest pending request
+	def _receive(self):
+		reply = self.pending.popleft()
+		self.subproc.stdout.readline() # flush out empty line
+		bits = self.subproc.stdout.readline().strip().strip('"')
+		self.subproc.stdout.readline() # flush out empty line
+		reply.value = np.array([bit == '1' for bit in bits], dtype=bool)
+		reply.done = True
+
+	# Queues a test of p against every tetrahedron in qs
+	def submit(self, p, qs):
+		return self._send('(intersect-batch '+format_numbers(np.concatenate([np.ravel(p), np.ravel(qs)]))+')')
+
+	# Queues a test of every pair (ps[k], qs[k])
+	def submit_pairs(self, ps, qs):
+		return self._send('(intersect-pairs '+format_numbers(np.stack([ps, qs], axis=1))+')')
+
+	def intersect(self, p, qs):
+		qs = np.asarray(qs, dtype=float)
+		if len(qs) == 0:
+			return np.zeros(0, dtype=bool)
+		return self.submit(p, qs).result()
+
+	def intersects_any(self, p, qs):
+		return bool(self.intersect(p, qs).any())
+
+	# Splits the pairs into batches of chunk pairs and queues them all before
+	# reading the first reply
+	def intersect_pairs(self, ps, qs, chunk=256):
+		ps = np.asarray(ps, dtype=float)
+		qs = np.asarray(qs, dtype=float)
+		replies = [self.submit_pairs(ps[k:k+chunk], qs[k:k+chunk]) for k in range(0, len(ps), chunk)]
+		if not replies:
+			return np.zeros(0, dtype=bool)
+		return np.concatenate([reply.result() for reply in replies])
+
+	def close(self):
+		while self.pending:
+			self._receive()
+		self.subproc.stdin.close()
+		self.subproc.wait()
+
+# Pool of clojure REPL subprocesses shared by concurrent callers
+# Each call borrows an idle REPL for its duration, so up to size threads can
+# have requests in flight at once
+class ClojurePool(object):
+	name = 'clojure-pool'
+	threadsafe = True
+
+	def __init__(self, size=4, script="tetrahedron-intersect.clj"):
+		self.backends = [ClojureBackend(script, wait=False) for _ in range(size)]
+		self.idle = Queue.Queue()
+		for backend in self.backends:
+			backend.wait()
+			self.idle.put(backend)
+
+	def _call(self, method, *args):
+		backend = self.idle.get()
+		try:
+			return getattr(backend, method)(*args)
+		finally:
+			self.idle.put(backend)
+
+	def intersect(self, p, qs):
+		return self._call('intersect', p, qs)
+
+	def intersects_any(self, p, qs):
+		return self._call('intersects_any', p, qs)
+
+	def intersect_pairs(self, ps, qs):
+		return self._call('intersect_pairs', ps, qs)
+
+	def close(self):
+		for backend in self.backends:
+			backend.close()
+
+# Socket the shared collision server listens on unless told otherwise
+DEFAULT_SOCKET = "/tmp/tetrahedron-collision.sock"
+
+# Messages between ServerBackend and collisionServer.py: a 4 byte operation and an
+# array count, then every array as its number of dimensions, its shape and its
+# float64 values, all in network byte order
+# Operations are ping (no arrays), many (p, qs), pair (ps, qs) and the replies
+# okay (no arrays) and bits (one array of 0s and 1s)
+def send_message(sock, op, *arrays):
+	parts = [struct.pack('!4sI', op, len(arrays))]
+	for array in arrays:
+		array = np.ascontiguousarray(array, dtype='>f8')
+		parts.append(struct.pack('!I', array.ndim)+struct.pack('!'+'I'*array.ndim, *array.shape))
+		parts.append(array.tostring())
+	sock.sendall(''.join(parts))
+
+# Reads exactly size bytes, raising socket.error if the peer went away
+def receive_exactly(sock, size):
+	chunks = []
+	while size > 0:
+		chunk = sock.recv(min(size, 1 << 20))
+		if not chunk:
+			raise socket.error("connection closed")
+		chunks.append(chunk)
+		size -= len(chunk)
+	return ''.join(chunks)
+
+# Reads one message and returns its operation and arrays
+def receive_message(sock):
+	op, count = struct.unpack('!4sI', receive_exactly(sock, 8))
+	arrays = []
+	for _ in range(count):
+		ndim = struct.unpack('!I', receive_exactly(sock, 4))[0]
+		shape = struct.unpack('!'+'I'*ndim, receive_exactly(sock, 4*ndim))
+		values = receive_exactly(sock, 8*int(np.prod(shape)))
+		arrays.append(np.frombuffer(values, dtype='>f8').reshape(shape).astype(float))
+	return op, arrays
+
+# Connects to the collision server at path and checks that it answers
+# Returns the connected socket, or None if no healthy server is listening there
+def connect_server(path=DEFAULT_SOCKET, timeout=5.0):
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	sock.settimeout(timeout)
+	try:
+		sock.connect(path)
+		send_message(sock, 'ping')
+		if receive_message(sock)[0] != 'okay':
+			raise socket.error("unexpected reply")
+	except (socket.error, struct.error):
+		sock.close()
+		return None
+	sock.settimeout(None)
+	return sock
+
+# Starts collisionServer.py serving the named backend on path, detached into its
+# own session so it outlives the process that started it
+def spawn_server(path=DEFAULT_SOCKET, backend='clojure-pool'):
+	script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'collisionServer.py')
+	devnull = open(os.devnull, 'r+')
+	return subprocess.Popen([sys.executable, script, '-so', path, '-cb', backend],
+							stdin=devnull, stdout=devnull, stderr=devnull, close_fds=True, preexec_fn=os.setsid)
+
+# Collision backend that forwards requests to a collision server shared by all
+# packing processes on the machine over a Unix socket, so the clojure REPLs behind
+# it start once instead of once per run
+# Before every connection the server is health checked with a ping; when none
+# answers, a stale socket file is removed and a new server is spawned, and a
+# request that fails on a dead connection is retried once on a fresh one
+class ServerBackend(object):
+	name = 'server'
+	threadsafe = False
+
+	# backend is the backend the server runs if this client has to start it
+	# timeout bounds the wait for a freshly spawned server to come up
+	def __init__(self, path=DEFAULT_SOCKET, backend='clojure-pool', timeout=120.0):
+		self.path = path
+		self.backend = backend
+		self.timeout = timeout
+		self.sock = None
+		self.connect()
+
+	# Connects to a healthy server, spawning one if needed
+	# Spawning happens under a lock file, so clients that find no server at the
+	# same time start only one
+	def connect(self):
+		self.sock = connect_server(self.path)
+		if self.sock is not None:
+			return
+		with open(self.path+'.lock', 'w') as lock:
+			fcntl.flock(lock, fcntl.LOCK_EX)
+			self.sock = connect_server(self.path)
+			if self.sock is not None:
+				return
+			if os.path.exists(self.path):
+				os.remove(self.path)
+			server = spawn_server(self.path, self.backend)
+			deadline = time.time()+self.timeout
+			while self.sock is None:
+				assert server.poll() is None, "The collision server exited with status {0}".format(server.returncode)
+				assert time.time() < deadline, "The collision server did not start within {0} seconds".format(self.timeout)
+				time.sleep(0.1)
+				self.sock = connect_server(self.path)
+
+	def _request(self, op, *arrays):
+		for attempt in range(2):
+			try:
+				send_message(self.sock, op, *arrays)
+				reply, values = receive_message(self.sock)
+				assert reply == 'bits', "The collision server failed to answer a request"
+				return values[0].astype(bool)
+			except (socket.error, struct.error):
+				if attempt == 1:
+					raise
+				self.sock.close()
+				self.connect()
+
+	def intersect(self, p, qs):
+		qs = np.asarray(qs, dtype=float)
+		if len(qs) == 0:
+			return np.zeros(0, dtype=bool)
+		return self._request('many', p, qs)
+
+	def intersects_any(self, p, qs):
+		return bool(self.intersect(p, qs).any())
+
+	def intersect_pairs(self, ps, qs):
+		ps = np.asarray(ps, dtype=float)
+		if len(ps) == 0:
+			return np.zeros(0, dtype=bool)
+		return self._request('pair', ps, qs)
+
+	# Disconnects; the server keeps running for other clients
+	def close(self):
+		if self.sock is not None:
+			self.sock.close()
+			self.sock = None
+
+BACKENDS = {'numpy': NumpyBackend, 'clojure': ClojureBackend, 'clojure-pool': ClojurePool, 'server': ServerBackend}
+
+# Creates a collision backend by name
+def make_backend(name='numpy'):
+	assert name in BACKENDS, "Unknown collision backend {0}, expected one of {1}".format(name, sorted(BACKENDS.keys()))
+	return BACKENDS[name]()
+
+# Generates numpairs random pairs of tetrahedra with vertices in a unit cube,
+# the second offset by up to spread in each axis
+# The default spread makes roughly half of the pairs overlap
+def random_pairs(numpairs, spread=0.3, rng=np.random):
+	p = rng.uniform(0.0, 1.0, (numpairs, 4, 3))
+	q = rng.uniform(0.0, 1.0, (numpairs, 4, 3)) + rng.uniform(-spread, spread, (numpairs, 1, 3))
+	return p, q
+
+# Runs two backends on the same random pairs and returns the indices, pairs and
+# answers of every pair on which they disagree
+def cross_check(numpairs, backend1, backend2, spread=0.3, rng=np.random):
+	p, q = random_pairs(numpairs, spread, rng)
+	answers1 = backend1.intersect_pairs(p, q)
+	answers2 = backend2.intersect_pairs(p, q)
+	return [(k, p[k], q[k], bool(answers1[k]), bool(answers2[k])) for k in np.nonzero(answers1 != answers2)[0]]
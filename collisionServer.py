@@ -0,0 +1,81 @@
+import argparse
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+import SocketServer
+import numpy as np
+import collision
+
+# Long-lived collision server shared by packing processes over a Unix socket
+# It starts one collision backend, typically a pool of clojure REPLs, and answers
+# the requests of collision.ServerBackend clients until it is stopped; clients
+# spawn it on demand, so it rarely needs to be started by hand
+# Backends that are not thread-safe serve one request at a time
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Tetrahedron Collision Server")
+	parser.add_argument("-so", "--socket", help="Unix socket to listen on", default=collision.DEFAULT_SOCKET)
+	parser.add_argument("-cb", "--backend", help="collision backend to serve", choices=sorted(name for name in collision.BACKENDS if name != 'server'), default='clojure-pool')
+	return parser.parse_args()
+
+# Answers the requests of one client connection until it disconnects
+class CollisionHandler(SocketServer.BaseRequestHandler):
+	def handle(self):
+		server = self.server
+		while True:
+			try:
+				op, arrays = collision.receive_message(self.request)
+			except (socket.error, struct.error):
+				return
+			if op == 'ping':
+				collision.send_message(self.request, 'okay')
+				continue
+			with server.lock:
+				if op == 'many':
+					bits = server.backend.intersect(arrays[0], arrays[1])
+				elif op == 'pair':
+					bits = server.backend.intersect_pairs(arrays[0], arrays[1])
+				else:
+					return
+			collision.send_message(self.request, 'bits', np.asarray(bits, dtype=float))
+
+class CollisionServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+	daemon_threads = True
+
+	def __init__(self, path, backend):
+		SocketServer.UnixStreamServer.__init__(self, path, CollisionHandler)
+		self.backend = backend
+		# a lock that is never contended when the backend is thread-safe
+		self.lock = threading.Lock() if not backend.threadsafe else DummyLock()
+
+class DummyLock(object):
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		return False
+
+# Serves the named backend on path until interrupted or terminated, then closes
+# the backend and removes the socket and the lock file clients spawn it under
+def serve(path=collision.DEFAULT_SOCKET, backendname='clojure-pool'):
+	# exit through the cleanup below on SIGTERM as well
+	signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+	backend = collision.make_backend(backendname)
+	if os.path.exists(path):
+		os.remove(path)
+	server = CollisionServer(path, backend)
+	try:
+		server.serve_forever()
+	finally:
+		server.server_close()
+		backend.close()
+		for leftover in (path, path+'.lock'):
+			if os.path.exists(leftover):
+				os.remove(leftover)
+
+if __name__ == "__main__":
+	args = parse_args()
+	serve(args.socket, args.backend)
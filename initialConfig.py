@@ -0,0 +1,330 @@
+import numpy as np
+import collision
+import metrics
+import util
+from convexPolygon import rotation_matrix
+from packingState import PackingState, CompactPackingState, CHUNK, quaternion_matrices
+from spatialGrid import SpatialGrid, CompactGrid
+
+# Vectorized generators of compact starting configurations
+# Every generator places numtetras non-overlapping tetrahedra of the shape built by
+# generate_tetrahedra with uniformly random orientations inside a region whose
+# volume gives the requested initial packing fraction, and returns a PackingState
+# Compact starts pack best with a small initial step scale
+# spread: the original generate_tetrahedra, a cloud growing linearly with N
+# lattice: a jittered face centered cubic lattice, filled from the center outwards
+# rsa: random sequential addition inside a sphere, using the broad phase grid
+INITIALIZERS = ('spread', 'lattice', 'rsa')
+
+# Packing fractions up to which lattice_configuration removes all overlaps and
+# rsa_configuration fits every tetrahedron into its sphere
+MAX_LATTICE_FRACTION = 0.2
+MAX_RSA_FRACTION = 0.2
+
+# Number of pairs random sequential addition tests in one backend call; the exact
+# test takes about a kilobyte per pair, and a batch can have thousands of pairs
+# once the sphere fills up
+PAIRS = 1024
+
+# The tetrahedron generate_tetrahedra starts from, with a vertex at the origin
+def base_tetrahedron(l=1.0):
+	return np.array([[0.0,0.0,0.0],[l/np.sqrt(5),0.0,2*l/np.sqrt(5)],[2*l/np.sqrt(5),l/np.sqrt(5),0.0],[0.0,2*l/np.sqrt(5),l/np.sqrt(5)]])
+
+# The tetrahedron generate_tetrahedra starts from, centered at the origin
+# Its first vertex is closer to the centroid than the others
+def reference_tetrahedron(l=1.0):
+	vertices = base_tetrahedron(l)
+	return vertices - vertices.mean(axis=0)
+
+# Distance from the centroid to the farthest vertex of a centered reference shape
+def bounding_radius(reference):
+	return np.linalg.norm(reference, axis=1).max()
+
+# n unit quaternions drawn uniformly from SO(3), normalized Gaussian 4-vectors
+def random_quaternions(n, rng=np.random):
+	q = rng.normal(size=(n, 4))
+	q /= np.linalg.norm(q, axis=1)[:,None]
+	return q
+
+# n rotation matrices drawn uniformly from SO(3)
+def random_orientations(n, rng=np.random):
+	return quaternion_matrices(random_quaternions(n, rng))
+
+# The indices among candidates whose centroid lies within reach of c
+def within(candidates, centroids, c, reach):
+	candidates = np.array(candidates, dtype=int)
+	return candidates[np.linalg.norm(centroids[candidates]-c, axis=1) <= reach]
+
+# Indices of the tetrahedra in state that overlap another one
+def overlapping(state, backend):
+	reach = 2*bounding_radius(state.reference)
+	grid = state.spatial_grid(reach)
+	found = []
+	for i in range(len(state)):
+		near = within(grid.neighbours(state.centroids[i], i, count=False), state.centroids, state.centroids[i], reach)
+		if len(near) and backend.intersects_any(state.verts[i], state.verts[near]):
+			found.append(i)
+	return found
+
+# Flat indices into a side^3 grid of the numtetras sites of a face centered cubic
+# lattice closest to the center, nearest first and in index order among sites at
+# the same distance; the sites are the grid points whose indices have an even sum
+# Distances are compared as exact squared integers of doubled coordinates, so
+# only a few bytes per grid point are needed besides the sort, and the sites are
+# returned as int32 without holding on to the sort of all grid points
+def lattice_sites(side, numtetras):
+	index = np.arange(side, dtype=np.int32)
+	offsets = (2*index-(side-1))**2
+	squares = (offsets[:,None,None] + offsets[None,:,None] + offsets[None,None,:]).ravel()
+	squares[((index[:,None,None] + index[None,:,None] + index[None,None,:]).ravel() & 1) == 1] = np.iinfo(np.int32).max
+	return np.argsort(squares, kind='mergesort')[:numtetras].astype(np.int32)
+
+# Moves tetrahedron i of state to the first of tries poses near site that overlaps
+# none of the placed tetrahedra (a boolean mask): every pose has a uniformly
+# random orientation and a centroid in the cube of half width halfwidth around
+# the site
+# Poses are drawn in batches and every batch is checked in one backend call;
+# grid must have cells of at least reach plus the half diagonal of that cube
+# If no pose is free, i pushes its way in at the pose overlapping the fewest
+# placed tetrahedra, which are taken out to be put back later
+# Returns the indices taken out
+def relocate(state, i, site, halfwidth, grid, placed, backend, rng, tries=64, batch=16):
+	reach = 2*bounding_radius(state.reference)
+	near = within(grid.neighbours(site, i, count=False), state.centroids, site, reach+np.sqrt(3)*halfwidth)
+	near = near[placed[near]]
+	best = None
+	for _ in range(0, tries, batch):
+		centroids = site + rng.uniform(-halfwidth, halfwidth, (batch, 3))
+		rotations = random_orientations(batch, rng)
+		hits = [[] for _ in range(batch)]
+		if len(near):
+			ks, js = np.nonzero(np.linalg.norm(centroids[:,None,:]-state.centroids[near][None,:,:], axis=2) <= reach)
+			if len(ks):
+				candidateVerts = centroids[ks][:,None,:] + np.matmul(state.reference, np.swapaxes(rotations[ks], 1, 2))
+				overlaps = np.asarray(backend.intersect_pairs(candidateVerts, state.verts[near[js]]), dtype=bool)
+				for k, j in zip(ks[overlaps], near[js[overlaps]]):
+					hits[k].append(j)
+		for k in range(batch):
+			if best is None or len(hits[k]) < len(best[2]):
+				best = (centroids[k], rotations[k], hits[k])
+		if not best[2]:
+			break
+	centroid, rotation, pushed = best
+	state.move(i, centroid-state.centroids[i], np.dot(rotation, np.asarray(state.orientations[i]).T))
+	grid.move(i, state.centroids[i])
+	# the pose as stored, which a compact state rounds to float32, may touch more
+	stored = within(near, state.centroids, state.centroids[i], reach)
+	if len(stored):
+		overlaps = np.asarray(backend.intersect_pairs(np.repeat(state.verts[i][None], len(stored), axis=0), state.verts[stored]), dtype=bool)
+		pushed = stored[overlaps]
+	placed[pushed] = False
+	placed[i] = True
+	return pushed
+
+# Jittered face centered cubic lattice holding numtetras tetrahedra at roughly the
+# given packing fraction; the lattice sites closest to the center are used, and
+# their nearest neighbours are about 12% further apart than in a simple cubic
+# lattice of the same packing fraction
+# When neighbouring sites are at least a circumsphere diameter apart, every site is
+# jittered by up to the free space and no overlap is possible. In tighter lattices
+# every tetrahedron that overlaps another is taken out and put back one at a time,
+# center outwards, at a free pose found by relocate within half a nearest neighbour
+# distance of its site. Tetrahedra still left out after maxrounds passes move to
+# spare sites just outside the filled ones, where there is room, for up to three
+# times as many passes again; this reaches packing fractions of about
+# MAX_LATTICE_FRACTION
+# compact builds a CompactPackingState, backed by the file at path if one is given,
+# filled a chunk at a time; the random draws are the same as for the full state
+# Raises ValueError when overlaps are left
+def lattice_configuration(numtetras, packingfraction=0.1, l=1.0, rng=np.random, backend='numpy', resum_interval=1000, maxrounds=5, compact=False, path=None):
+	reference = reference_tetrahedron(l)
+	# grid step of the lattice, whose sites fill every other grid cube
+	spacing = (metrics.tetra_volume(l)/(2*packingfraction))**(1.0/3.0)
+	spares = 32 + numtetras//8
+	side = int(np.ceil((2*(numtetras+spares))**(1.0/3.0)))
+	sites = lattice_sites(side, numtetras+spares)
+	# nearest neighbours are sqrt(2) grid steps apart along a face diagonal
+	freedom = max(0.0, (spacing-np.sqrt(2)*bounding_radius(reference))/2.0)
+	if compact:
+		state = CompactPackingState.empty(reference, numtetras, resum_interval=resum_interval, path=path)
+		for start in range(0, numtetras, CHUNK):
+			chunk = sites[start:min(start+CHUNK, numtetras)]
+			centroids = (np.array(np.unravel_index(chunk, (side, side, side))).T-(side-1)/2.0)*spacing
+			state.centroids[start:start+CHUNK] = centroids + rng.uniform(-freedom, freedom, centroids.shape)
+		for start in range(0, numtetras, CHUNK):
+			state.quaternions[start:start+CHUNK] = random_quaternions(min(CHUNK, numtetras-start), rng)
+		state.resum()
+	else:
+		centroids = (np.array(np.unravel_index(sites[:numtetras], (side, side, side))).T-(side-1)/2.0)*spacing
+		centroids = centroids + rng.uniform(-freedom, freedom, centroids.shape)
+		state = PackingState(reference, centroids, random_orientations(numtetras, rng), resum_interval=resum_interval)
+	if freedom == 0.0:
+		ownBackend = isinstance(backend, str)
+		if ownBackend:
+			backend = collision.make_backend(backend)
+		halfwidth = spacing/np.sqrt(2)
+		grid = state.spatial_grid(2*bounding_radius(reference)+np.sqrt(3)*halfwidth)
+		found = overlapping(state, backend)
+		placed = np.ones(numtetras, dtype=bool)
+		placed[found] = False
+		# sites of the tetrahedra moved to spare sites
+		moved = {}
+		spare = numtetras
+		for rounds in range(4*maxrounds):
+			if not found:
+				break
+			if rounds >= maxrounds:
+				for i in found:
+					if i not in moved and spare < len(sites):
+						moved[i] = sites[spare]
+						spare += 1
+			# sites are in order from the center, so overlaps are repaired center outwards
+			for i in found:
+				if placed[i]:
+					continue
+				site = (np.array(np.unravel_index(moved.get(i, sites[i]), (side, side, side)))-(side-1)/2.0)*spacing
+				relocate(state, i, site, halfwidth, grid, placed, backend, rng)
+			found = list(np.flatnonzero(~placed))
+		if ownBackend:
+			backend.close()
+		if found:
+			raise ValueError("Could not remove the overlaps of {0} of {1} tetrahedra from a lattice at packing fraction {2}; lattices reach about {3}".format(len(found), numtetras, packingfraction, MAX_LATTICE_FRACTION))
+	return state
+
+# Random sequential addition of numtetras tetrahedra inside a sphere sized for the
+# given packing fraction
+# Candidates are drawn in vectorized batches; those overlapping a tetrahedron
+# placed before the batch are found in one backend call through the broad phase
+# grid, and the rest are kept in turn unless they overlap one kept from the batch
+# Once maxattempts candidates have been drawn without placing every tetrahedron
+# the sphere is saturated, and the rest are placed the same way in up to
+# maxshells thin shells around it, each with a fresh budget of attempts
+# compact returns the placed tetrahedra as a CompactPackingState, backed by the
+# file at path if one is given, with the candidates rounded to float32 before they
+# are tested; the random draws are the same as for the full state
+# Raises ValueError when tetrahedra are left over
+def rsa_configuration(numtetras, packingfraction=0.1, l=1.0, rng=np.random, backend='numpy', resum_interval=1000, maxattempts=None, batch=256, maxshells=10, shell=0.05, compact=False, path=None):
+	reference = reference_tetrahedron(l)
+	reach = 2*bounding_radius(reference)
+	radius = (3*numtetras*metrics.tetra_volume(l)/(4*np.pi*packingfraction))**(1.0/3.0)
+	if maxattempts is None:
+		maxattempts = 100*numtetras
+	ownBackend = isinstance(backend, str)
+	if ownBackend:
+		backend = collision.make_backend(backend)
+	if compact:
+		# tetrahedra go straight into the records, the grid sharing their centroids;
+		# its dense cells cover the sphere, the rare ones in the shells overflow
+		state = CompactPackingState.empty(reference, numtetras, resum_interval=resum_interval, path=path)
+		grid = CompactGrid.reserve(state.centroids, reach, -radius*np.ones(3), radius*np.ones(3))
+		centroids = state.centroids
+		verts = state.verts
+	else:
+		grid = SpatialGrid(np.zeros((0, 3)), reach)
+		centroids = np.empty((numtetras, 3))
+		orientations = np.empty((numtetras, 3, 3))
+		verts = np.empty((numtetras, 4, 3))
+	placed = 0
+	inner = 0.0
+	shells = 0
+	attempts = 0
+	while placed < numtetras:
+		if attempts >= maxattempts:
+			if shells == maxshells:
+				break
+			inner, radius = radius, radius*(1+shell)
+			shells += 1
+			attempts = 0
+		# uniform points in the sphere, or the shell around it, and uniform orientations
+		directions = rng.normal(size=(batch, 3))
+		directions /= np.linalg.norm(directions, axis=1)[:,None]
+		candidates = directions*(inner**3 + (radius**3-inner**3)*rng.uniform(size=(batch, 1)))**(1.0/3.0)
+		rotations = random_orientations(batch, rng)
+		if compact:
+			# candidates are tested in the poses they are stored in
+			candidates = candidates.astype(np.float32).astype(float)
+			quaternions = state.stored_quaternions(rotations)
+			rotations = quaternion_matrices(quaternions)
+		candidateVerts = candidates[:,None,:] + np.matmul(reference, np.swapaxes(rotations, 1, 2))
+		attempts += batch
+		ks = []
+		js = []
+		for k, c in enumerate(candidates):
+			near = within(grid.neighbours(c, count=False), centroids, c, reach)
+			ks.extend([k]*len(near))
+			js.extend(near)
+		free = np.ones(batch, dtype=bool)
+		ks = np.array(ks, dtype=int)
+		js = np.array(js, dtype=int)
+		for p in range(0, len(ks), PAIRS):
+			pairs = slice(p, p+PAIRS)
+			free[ks[pairs][np.asarray(backend.intersect_pairs(candidateVerts[ks[pairs]], verts[js[pairs]]), dtype=bool)]] = False
+		start = placed
+		for k in np.flatnonzero(free):
+			c = candidates[k]
+			near = within(grid.neighbours(c, count=False), centroids, c, reach)
+			near = near[near >= start]
+			if len(near) and backend.intersects_any(candidateVerts[k], verts[near]):
+				continue
+			grid.add(c)
+			if compact:
+				state.quaternions[placed] = quaternions[k]
+			else:
+				centroids[placed] = c
+				orientations[placed] = rotations[k]
+				verts[placed] = candidateVerts[k]
+			placed += 1
+			if placed == numtetras:
+				break
+	if ownBackend:
+		backend.close()
+	if placed < numtetras:
+		raise ValueError("Random sequential addition placed only {0} of {1} tetrahedra at packing fraction {2}; it reaches about {3}".format(placed, numtetras, packingfraction, MAX_RSA_FRACTION))
+	if compact:
+		state.resum()
+		return state
+	return PackingState(reference, centroids, orientations, resum_interval=resum_interval)
+
+# The spread out cloud of generate_tetrahedra built straight into a
+# CompactPackingState, backed by the file at path if one is given, a chunk at a
+# time and without a Simplex per tetrahedron
+# The random draws are those of generate_tetrahedra, so the poses are the same up
+# to their rounding to float32
+def spread_configuration(numtetras, genmult=2, geninc=2, l=1.0, resum_interval=1000, path=None):
+	center = base_tetrahedron(l).mean(axis=0)
+	state = CompactPackingState.empty(reference_tetrahedron(l), numtetras, resum_interval=resum_interval, path=path)
+	multiplier = genmult
+	for start in range(0, numtetras, CHUNK):
+		count = min(CHUNK, numtetras-start)
+		centroids = np.tile(center, (count, 1))
+		orientations = np.tile(np.eye(3), (count, 1, 1))
+		# the first tetrahedron stays where it is
+		for k in range(1 if start == 0 else 0, count):
+			choice = np.random.choice(3)
+			for j in range(3):
+				if j == choice:
+					centroids[k,j] += np.random.uniform(multiplier*l,(multiplier+1)*l)
+				else:
+					centroids[k,j] += np.random.uniform((multiplier+1)*l)
+			rotation = rotation_matrix(np.random.uniform(360),(0,1),'deg')
+			rotation = np.dot(rotation_matrix(np.random.uniform(360),(1,2),'deg'), rotation)
+			orientations[k] = np.dot(rotation_matrix(np.random.uniform(360),(0,2),'deg'), rotation)
+			multiplier += geninc
+		state.centroids[start:start+count] = centroids
+		state.quaternions[start:start+count] = state.stored_quaternions(orientations)
+	state.resum()
+	return state
+
+# Starting configuration built by the named initializer
+# genmult and geninc are only used by spread, packingfraction only by lattice and rsa
+# compact returns a CompactPackingState, memory-mapped to path if one is given,
+# which every initializer builds without float64 arrays of all tetrahedra
+def initial_state(numtetras, init='spread', packingfraction=0.1, genmult=2, geninc=2, l=1.0, rng=np.random, backend='numpy', resum_interval=1000, compact=False, path=None):
+	assert init in INITIALIZERS, "Unknown initializer {0}, expected one of {1}".format(init, INITIALIZERS)
+	if init == 'lattice':
+		return lattice_configuration(numtetras, packingfraction, l, rng, backend, resum_interval, compact=compact, path=path)
+	elif init == 'rsa':
+		return rsa_configuration(numtetras, packingfraction, l, rng, backend, resum_interval, compact=compact, path=path)
+	if compact:
+		return spread_configuration(numtetras, genmult, geninc, l, resum_interval, path)
+	return PackingState.from_simplices(util.generate_tetrahedra(numtetras, genmult, geninc, l), resum_interval)
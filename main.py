@@ -1,4 +1,20 @@
 import argparse
+import functools
+import numpy as np
+import activeSet
+import batchedMoves
+import checkpoint
+import clusterMoves
+import collision
+import initialConfig
+import metrics
+import multistart
+import packingEngine
+import packingIO
+import parallelSweep
+import periodic
+import packingStats
+import separationCache
 import util
 
 def parse_args():
@@ -15,41 +31,184 @@ def parse_args():
 	parser.add_argument("-v", "--verbose", action='store_true')
 	parser.add_argument("-b", "--bias", help="induce nearest neighbor attraction bias between tetrahedra to avoid dogpile clustering", action='store_true')
 	parser.add_argument("-np", "--noplot", help="disable plotting tetrahedra with plotly", action='store_true', default=False)
+	parser.add_argument("-cb", "--backend", help="collision detection backend", choices=sorted(collision.BACKENDS.keys()), default='numpy')
+	parser.add_argument("-cc", "--crosscheck", type=int, help="compare the numpy and clojure collision backends on this many random pairs, then exit", default=0)
+	parser.add_argument("-s", "--seed", type=int, help="random seed; restarts use consecutive seeds starting here", default=None)
+	parser.add_argument("-k", "--restarts", type=int, help="number of independently seeded packings to run, keeping the densest", default=1)
+	parser.add_argument("-p", "--workers", type=int, help="number of worker processes for restarts", default=1)
+	parser.add_argument("-ce", "--checkpointevery", type=int, help="iterations between restart density checkpoints, 0 disables cancellation", default=100)
+	parser.add_argument("-cm", "--cancelmargin", type=float, help="cancel a restart whose density trails the best at a checkpoint by more than this fraction", default=0.25)
+	parser.add_argument("-cp", "--checkpointpath", help="periodically write a checkpoint of the run to this file", default=None)
+	parser.add_argument("-ci", "--checkpointinterval", type=float, help="seconds between checkpoints", default=5.0)
+	parser.add_argument("-r", "--resume", help="continue the run stored in this checkpoint file, with its original parameters", default=None)
+	parser.add_argument("-f", "--format", help="output file format", choices=packingIO.FORMATS, default='text')
+	parser.add_argument("-q", "--quiet", help="do not echo the text output to stdout", action='store_true')
+	parser.add_argument("-t", "--trajectory", help="save packing frames to this memory-mapped npy file", default=None)
+	parser.add_argument("-fi", "--frameinterval", type=int, help="iterations between trajectory frames", default=10)
+	parser.add_argument("-S", "--stats", help="print counters and timings of the packing loop when the run ends", action='store_true')
+	parser.add_argument("-sf", "--statsfile", help="stream cumulative counters and timings to this file as one JSON line per iteration", default=None)
+	parser.add_argument("-ss", "--statssample", type=int, help="time one in this many proposals when gathering stats", default=16)
+	parser.add_argument("-m", "--metric", help="container used to measure density for progress reports and the target density", choices=metrics.METRICS, default='box')
+	parser.add_argument("-td", "--targetdensity", type=float, help="stop once the density measured with the chosen metric reaches this value", default=None)
+	parser.add_argument("-me", "--metricevery", type=int, help="iterations between density measurements", default=1)
+	parser.add_argument("-as", "--activeset", help="only visit tetrahedra that have not converged, reactivating converged ones when a neighbour moves away", action='store_true')
+	parser.add_argument("-wd", "--wakedistance", type=float, help="distance, in edge lengths, a tetrahedron travels before its converged neighbours are reactivated", default=0.1)
+	parser.add_argument("-ps", "--parallelsweep", type=int, help="split every sweep into cell colours processed by this many worker processes, 0 runs serial sweeps", default=0)
+	parser.add_argument("-in", "--init", help="starting configuration: the original spread out cloud, a jittered lattice or random sequential addition", choices=initialConfig.INITIALIZERS, default='spread')
+	parser.add_argument("-if", "--initfraction", type=float, help="packing fraction of the lattice and rsa starting configurations", default=0.1)
+	parser.add_argument("-pb", "--periodic", help="pack in a shrinking periodic cell to estimate the bulk density, starting at the initial fraction", action='store_true')
+	parser.add_argument("-sc", "--separationcache", help="cache lower bounds on the separation of neighbouring tetrahedra to skip exact overlap tests for small moves", action='store_true')
+	parser.add_argument("-K", "--candidates", type=int, help="candidate moves drawn and tested together per tetrahedron and sweep, 1 tries one translation and one rotation in turn", default=1)
+	parser.add_argument("-sh", "--shrink", type=float, help="fraction by which the periodic cell is compressed after every sweep, valid between 0 and 1", default=0.01)
+	parser.add_argument("-lod", "--levelofdetail", help="tetrahedra to plot: all of them, the outer layer on the convex hull or a random sample", choices=util.DETAIL_LEVELS, default='all')
+	parser.add_argument("-ls", "--lodsample", type=int, help="number of tetrahedra plotted by the sample level of detail", default=1000)
+	parser.add_argument("-an", "--animate", help="also plot an animation of the trajectory saved with -t", action='store_true')
+	parser.add_argument("-co", "--compact", help="store the packing in float32 records with quaternion orientations, for 10^5 to 10^6 tetrahedra", action='store_true')
+	parser.add_argument("-mm", "--memmap", help="back the compact packing state with this memory-mapped file, implies -co", default=None)
+	parser.add_argument("-cl", "--clusters", help="periodically move clusters of jammed tetrahedra in near contact as rigid bodies", action='store_true')
+	parser.add_argument("-cg", "--clustergap", type=float, help="separation, in edge lengths, below which jammed tetrahedra join a cluster", default=0.02)
+	parser.add_argument("-cs", "--clustersize", type=int, help="largest number of tetrahedra moved together", default=4)
+	parser.add_argument("-cv", "--clusterevery", type=int, help="iterations between cluster move phases", default=5)
+	parser.add_argument("-ad", "--adaptive", help="grow and shrink each step scale and rotation range to hold a target acceptance rate instead of only shrinking them on rejection", action='store_true')
+	parser.add_argument("-ta", "--targetacceptance", type=float, help="acceptance rate held by the adaptive schedule, valid between 0 and 1", default=0.3)
+	parser.add_argument("-aw", "--acceptancewindow", type=int, help="number of recent proposals the adaptive schedule averages acceptance over", default=20)
 	return parser.parse_args()
 
+# Runs both collision backends on the same random pairs and reports disagreements
+def crosscheck(numpairs):
+	numpyBackend = collision.make_backend('numpy')
+	clojureBackend = collision.make_backend('clojure')
+	disagreements = collision.cross_check(numpairs, numpyBackend, clojureBackend)
+	clojureBackend.close()
+	for k, p, q, numpyAnswer, clojureAnswer in disagreements:
+		print("pair "+str(k)+": numpy "+str(numpyAnswer)+", clojure "+str(clojureAnswer))
+		print(collision.format_tetra(p)+" "+collision.format_tetra(q))
+	print(str(len(disagreements))+" disagreements in "+str(numpairs)+" pairs")
+
 def main():
 	args = parse_args()
+	if args.crosscheck > 0:
+		crosscheck(args.crosscheck)
+		return
+	assert not args.animate or args.trajectory is not None, "Animating needs a trajectory saved with -t"
+	args.compact = args.compact or args.memmap is not None
 	packedTets = None
 	filename = "graph_n"+str(args.numtetras)+"_is"+str(args.initstepscale)+"_sr"+str(args.stepscalereduction)+"_st"+str(args.stepthreshold)+"_ir"+str(args.initrotationrange)+"_rr"+str(args.rotreduction)+"_rt"+str(args.rotationthreshold)+"_l"+str(args.length)+"_i"+str(args.iterations)
+	variant = 'V2'
 	if args.bias:
 		filename += "_withbias"
-		packedTets = util.randomizedGuidedPackingV3(args.numtetras, initstepscale=args.initstepscale, stepscalereduction=args.stepscalereduction,
-					initrotrange=args.initrotationrange, rotreduction=args.rotreduction, stepthreshold=args.stepthreshold,
-					rotationthreshold=args.rotationthreshold, l=args.length, max_iters=args.iterations, verbose=args.verbose)
+		variant = 'V3'
+	kwargs = dict(initstepscale=args.initstepscale, stepscalereduction=args.stepscalereduction,
+				  initrotrange=args.initrotationrange, rotreduction=args.rotreduction, stepthreshold=args.stepthreshold,
+				  rotationthreshold=args.rotationthreshold, l=args.length, max_iters=args.iterations, verbose=args.verbose)
+	params = {'variant': variant, 'numtetras': args.numtetras, 'kwargs': kwargs}
+	if args.periodic:
+		params['periodic'] = {'packingfraction': args.initfraction, 'initshrink': args.shrink}
+	if args.parallelsweep > 0:
+		params['parallel'] = {'workers': args.parallelsweep, 'seed': args.seed if args.seed is not None else np.random.randint(2**31)}
+	if args.candidates > 1:
+		params['batched'] = {'candidates': args.candidates}
+	if args.adaptive:
+		params['adaptive'] = {'target': args.targetacceptance, 'window': args.acceptancewindow}
+	if args.restarts > 1:
+		assert args.checkpointpath is None and args.resume is None and args.trajectory is None, "Checkpoints and trajectories are not supported with restarts"
+		assert args.statsfile is None and args.memmap is None, "Stats files and memory-mapped states are not supported with restarts"
+		assert 'parallel' not in params, "Parallel sweeps are not supported with restarts, whose runs already use the worker processes"
+	state = None
+	initial = None
+	if args.resume is not None:
+		state, params = checkpoint.load_checkpoint(args.resume, args.memmap)
+		variant, kwargs = str(params['variant']), params['kwargs']
+	else:
+		if args.seed is not None:
+			np.random.seed(args.seed)
+		if 'periodic' in params:
+			if args.compact:
+				initial = functools.partial(periodic.periodic_configuration, args.numtetras, args.initfraction, args.length, args.shrink, backend=args.backend, compact=True, path=args.memmap)
+		elif args.init != 'spread' or args.compact:
+			initial = functools.partial(initialConfig.initial_state, args.numtetras, args.init, args.initfraction, l=args.length, backend=args.backend, compact=args.compact, path=args.memmap)
+		# restarts make their starting states once they are seeded
+		if initial is not None and args.restarts == 1:
+			state = initial()
+			state.reset_schedule(args.initstepscale, args.initrotationrange)
+	# the move strategy follows the stored parameters when resuming as well
+	assert 'periodic' not in params or 'batched' not in params, "Batched moves are not supported with periodic packings"
+	strategy = variant
+	if 'periodic' in params:
+		strategy = periodic.PeriodicMoves(**params['periodic'])
+	elif 'batched' in params:
+		strategy = batchedMoves.BatchedMoves(variant, params['batched']['candidates'])
+	if 'parallel' in params:
+		strategy = parallelSweep.ParallelSweep(strategy, params['parallel']['workers'], params['parallel']['seed'])
+	# the schedule follows the stored parameters when resuming, not the command line
+	schedule = None
+	if 'adaptive' in params:
+		schedule = packingEngine.AdaptiveSchedule(params['adaptive']['target'], params['adaptive']['window'])
+		if args.resume is not None:
+			checkpoint.load_schedule(args.resume, schedule)
+	activeset = None
+	if args.activeset:
+		activeset = activeSet.ActiveSet(args.wakedistance*kwargs['l'])
+		if args.resume is not None:
+			checkpoint.load_activeset(args.resume, activeset)
+	checkpointer = None
+	checkpointpath = args.checkpointpath or args.resume
+	if checkpointpath is not None:
+		checkpointer = checkpoint.Checkpointer(checkpointpath, args.checkpointinterval, params, schedule, activeset)
+	trajectory = None
+	if args.trajectory is not None:
+		trajectory = packingIO.TrajectoryWriter(args.trajectory, max(1, kwargs['max_iters']//args.frameinterval), params['numtetras'], args.frameinterval)
+	monitor = None
+	if (args.verbose or args.targetdensity is not None) and 'periodic' not in params:
+		monitor = metrics.DensityMonitor(args.metric, kwargs['l'], args.targetdensity, args.metricevery, args.verbose)
+		# the monitor reports the density, so the packing loop only reports its counters
+		if args.verbose:
+			kwargs = dict(kwargs, reportdensity=False)
+	stats = None
+	statsfile = None
+	if args.stats or args.statsfile is not None:
+		if args.statsfile is not None:
+			statsfile = open(args.statsfile, "w")
+		stats = packingStats.PackingStats(args.statssample, statsfile)
+	separation = None
+	if args.separationcache:
+		separation = separationCache.SeparationCache()
+	clusters = None
+	if args.clusters:
+		clusters = clusterMoves.ClusterMoves(args.clustergap*kwargs['l'], args.clustersize, args.clusterevery)
+	if args.restarts > 1:
+		seed = args.seed if args.seed is not None else np.random.randint(2**31-args.restarts)
+		features = dict(stats=stats, activeset=activeset, separation=separation, clusters=clusters, schedule=schedule)
+		packedTets, summaries = multistart.run_restarts(args.restarts, args.workers, strategy, seed, args.checkpointevery, args.cancelmargin, args.backend,
+														initial, features, monitor, numtetras=params['numtetras'], **kwargs)
+		print(multistart.summary_table(summaries))
+		stats = multistart.best_summary(summaries)['stats']
+	else:
+		callback = util.chain_callbacks(monitor, checkpointer, trajectory)
+		packedTets = packingEngine.pack(strategy, params['numtetras'], backend=args.backend, callback=callback, state=state, stats=stats, activeset=activeset, separation=separation, clusters=clusters, schedule=schedule, **kwargs)
+		if args.compact:
+			packedTets.flush()
+		if checkpointer is not None:
+			checkpointer.close(packedTets)
+		if trajectory is not None:
+			trajectory.close()
+		if statsfile is not None:
+			statsfile.close()
+	if 'periodic' in params:
+		print("periodic cell length: "+str(packedTets.cell.length)+", density: "+str(periodic.periodic_density(packedTets, kwargs['l'])))
+	outputfile = packingIO.OUTPUT_FILES[args.format]
+	echo = args.format == 'text' and not args.quiet
+	packingIO.write_packing(outputfile, packedTets, args.format, echo)
+	if echo:
+		print("")
 	else:
-		packedTets = util.randomizedGuidedPackingV2(args.numtetras, initstepscale=args.initstepscale, stepscalereduction=args.stepscalereduction,
-					initrotrange=args.initrotationrange, rotreduction=args.rotreduction, stepthreshold=args.stepthreshold,
-					rotationthreshold=args.rotationthreshold, l=args.length, max_iters=args.iterations, verbose=args.verbose)
-	output = ""
-	with open("packing_output.txt","wb") as f:
-		for basis in packedTets[0].b:
-			line = ""
-			for coord in basis:
-				line += str(coord)+" "
-			line += "\n"
-			f.write(line)
-			output += line
-		for tet in packedTets:
-			line = ""
-			for vertex in tet.v:
-				for coord in vertex:
-					line += str(coord)+" "
-			line += "\n"
-			f.write(line)
-			output += line
-	print(output)
+		print("wrote "+str(len(packedTets))+" tetrahedra to "+outputfile)
+	if args.stats:
+		print(stats.summary())
 	if not args.noplot:
-		util.plot_tetrahedra(packedTets, filename+".html")
+		util.plot_tetrahedra(packedTets, filename+".html", args.levelofdetail, args.lodsample)
+		if args.animate:
+			util.plot_trajectory(packingIO.read_trajectory(args.trajectory), filename+"_trajectory.html", args.levelofdetail, args.lodsample, args.frameinterval)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,179 @@
+import numpy as np
+from convexPolygon import rotation_matrix
+
+# scipy is optional, only the convex hull metric needs it
+try:
+	from scipy.spatial import ConvexHull
+except ImportError:
+	ConvexHull = None
+
+# Packing quality metrics: the density of the packing relative to a container
+# box: smallest axis aligned box, maintained incrementally when the state tracks it
+# hull: convex hull of all vertices (requires scipy)
+# sphere: near-minimal bounding sphere
+# obb: near-minimal oriented box
+METRICS = ('box', 'hull', 'sphere', 'obb')
+
+# Volume of a regular tetrahedron with edge length l
+def tetra_volume(l=1.0):
+	return l**3.0/(6*2**0.5)
+
+# Vertices of a packing (a PackingState, a list of Simplex objects or an nx4x3 array
+# such as one read back by packingIO) as an nx4x3 array
+def packing_vertices(tetlist):
+	if isinstance(tetlist, np.ndarray):
+		return tetlist
+	if hasattr(tetlist, 'verts'):
+		return np.asarray(tetlist.verts)
+	return np.array([tet.v for tet in tetlist])
+
+# Axis aligned bounding box of a packing kept up to date as single tetrahedra move
+# Growing the box is O(1); only when a tetrahedron that defined a face moves inward
+# is that axis rescanned, from the per-tetrahedron bounds rather than all vertices
+class IncrementalAABB(object):
+	# verts should have shape nx4x3
+	def __init__(self, verts):
+		self.lows = verts.min(axis=1)
+		self.highs = verts.max(axis=1)
+		self.lo = self.lows.min(axis=0)
+		self.hi = self.highs.max(axis=0)
+
+	# Builds the box from per-tetrahedron bounds (nx3 lows and highs) computed by
+	# the caller, e.g. a chunk at a time; they are kept in the dtype given
+	@classmethod
+	def from_bounds(cls, lows, highs):
+		box = cls.__new__(cls)
+		box.lows = lows
+		box.highs = highs
+		box.lo = lows.min(axis=0)
+		box.hi = highs.max(axis=0)
+		return box
+
+	# Record the new vertices (4x3) of tetrahedron i
+	# The bounds are rounded to the dtype they are kept in first, so the faces are
+	# compared with the values actually stored
+	def update(self, i, tetverts):
+		oldlow = self.lows[i].copy()
+		oldhigh = self.highs[i].copy()
+		low = tetverts.min(axis=0).astype(self.lows.dtype)
+		high = tetverts.max(axis=0).astype(self.highs.dtype)
+		self.lows[i] = low
+		self.highs[i] = high
+		shrunk = (oldlow == self.lo) & (low > oldlow)
+		self.lo = np.minimum(self.lo, low)
+		if shrunk.any():
+			self.lo[shrunk] = self.lows[:,shrunk].min(axis=0)
+		shrunk = (oldhigh == self.hi) & (high < oldhigh)
+		self.hi = np.maximum(self.hi, high)
+		if shrunk.any():
+			self.hi[shrunk] = self.highs[:,shrunk].max(axis=0)
+
+	def volume(self):
+		return np.prod(self.hi-self.lo)
+
+# Volume of the smallest axis aligned box containing all tetrahedra
+# Uses the incrementally maintained box when the state tracks one
+def box_volume(tetlist):
+	bounds = getattr(tetlist, 'bounds', None)
+	if bounds is not None:
+		return bounds.volume()
+	points = packing_vertices(tetlist).reshape(-1, 3)
+	return np.prod(points.max(axis=0)-points.min(axis=0))
+
+# Volume of the convex hull of all vertices
+def hull_volume(tetlist):
+	assert ConvexHull is not None, "The hull metric requires scipy"
+	return ConvexHull(packing_vertices(tetlist).reshape(-1, 3)).volume
+
+# Vertices that can lie on the convex hull, all of them if scipy is unavailable
+# Shrinks the point sets handed to the sphere and oriented box searches
+def hull_points(points):
+	if ConvexHull is None or len(points) <= 4:
+		return points
+	return points[ConvexHull(points).vertices]
+
+# Near-minimal sphere enclosing points (mx3), returns the center and radius
+# Starts from Ritter's sphere and refines the center with Badoiu-Clarkson steps
+# towards the farthest point, keeping the smallest sphere seen
+def bounding_sphere(points, iterations=100):
+	a = points[np.argmax(np.linalg.norm(points-points[0], axis=1))]
+	b = points[np.argmax(np.linalg.norm(points-a, axis=1))]
+	center = (a+b)/2.0
+	bestCenter = center
+	bestRadius = np.inf
+	for k in range(1, iterations+1):
+		dists = np.linalg.norm(points-center, axis=1)
+		far = np.argmax(dists)
+		if dists[far] < bestRadius:
+			bestCenter = center
+			bestRadius = dists[far]
+		center = center + (points[far]-center)/(k+1.0)
+	return bestCenter, bestRadius
+
+# Volume of a near-minimal sphere containing all tetrahedra
+def sphere_volume(tetlist):
+	center, radius = bounding_sphere(hull_points(packing_vertices(tetlist).reshape(-1, 3)))
+	return 4.0/3.0*np.pi*radius**3
+
+# Near-minimal oriented box enclosing points (mx3), returns its axes (rows of a
+# 3x3 rotation) and volume
+# Starts from the better of the principal axes and the coordinate axes, then
+# rotates the frame in each plane by shrinking angles while the volume decreases
+def oriented_box(points, startangle=22.5, minangle=0.05):
+	def volume(axes):
+		projected = np.dot(points, axes.T)
+		return np.prod(projected.max(axis=0)-projected.min(axis=0))
+	centered = points-points.mean(axis=0)
+	principal = np.linalg.eigh(np.dot(centered.T, centered))[1].T
+	best = min((np.eye(3), principal), key=volume)
+	bestVolume = volume(best)
+	angle = startangle
+	while angle >= minangle:
+		improved = False
+		for plane in ((0,1), (1,2), (0,2)):
+			for sign in (1, -1):
+				axes = np.dot(rotation_matrix(sign*angle, plane, 'deg', 3), best)
+				v = volume(axes)
+				if v < bestVolume:
+					best = axes
+					bestVolume = v
+					improved = True
+		if not improved:
+			angle /= 2.0
+	return best, bestVolume
+
+# Volume of a near-minimal oriented box containing all tetrahedra
+def obb_volume(tetlist):
+	return oriented_box(hull_points(packing_vertices(tetlist).reshape(-1, 3)))[1]
+
+VOLUMES = {'box': box_volume, 'hull': hull_volume, 'sphere': sphere_volume, 'obb': obb_volume}
+
+# Density of a packing of tetrahedra with edge length l relative to the container
+# given by metric
+def density(tetlist, metric='box', l=1.0):
+	assert metric in VOLUMES, "Unknown metric {0}, expected one of {1}".format(metric, METRICS)
+	return tetra_volume(l)*len(tetlist)/VOLUMES[metric](tetlist)
+
+# Packing callback that measures the density every `every` iterations, keeps the
+# history, prints it in verbose mode and stops the run once target is reached
+# For the box metric the state is asked to track its bounds incrementally
+class DensityMonitor(object):
+	def __init__(self, metric='box', l=1.0, target=None, every=1, verbose=False):
+		assert metric in VOLUMES, "Unknown metric {0}, expected one of {1}".format(metric, METRICS)
+		self.metric = metric
+		self.l = l
+		self.target = target
+		self.every = every
+		self.verbose = verbose
+		self.history = []
+
+	def __call__(self, iteration, state):
+		if (iteration+1) % self.every != 0:
+			return False
+		if self.metric == 'box' and getattr(state, 'bounds', None) is None and hasattr(state, 'track_bounds'):
+			state.track_bounds()
+		d = density(state, self.metric, self.l)
+		self.history.append((iteration+1, d))
+		if self.verbose:
+			print(self.metric+" density after iteration "+str(iteration+1)+": "+str(d))
+		return self.target is not None and d >= self.target
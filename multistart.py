@@ -0,0 +1,116 @@
+import multiprocessing
+import time
+import numpy as np
+import collision
+import packingEngine
+import util
+
+# Packing functions of the variants, keyed by name, as parameter sweeps run them
+VARIANTS = {'V1': util.randomizedGuidedPacking,
+			'V2': util.randomizedGuidedPackingV2,
+			'V3': util.randomizedGuidedPackingV3}
+
+# Per-process state of a pool worker, set up once by _init_worker
+_backend = None
+_best = None
+
+# Gives every worker process its own collision backend and a handle on the
+# shared table of best densities seen at each checkpoint
+def _init_worker(backendname, best):
+	global _backend, _best
+	_backend = collision.make_backend(backendname)
+	_best = best
+
+# Packing callback that records the density at every checkpoint iteration and
+# cancels the run when it trails the best run so far by more than margin
+# density(state, l) measures the runs, their box density by default
+class CheckpointCanceller(object):
+	def __init__(self, best, checkpoint, margin, l=1.0, density=util.boxDensity):
+		self.best = best
+		self.checkpoint = checkpoint
+		self.margin = margin
+		self.l = l
+		self.density = density
+		self.iterations = 0
+		self.cancelled = False
+
+	def __call__(self, iteration, state):
+		self.iterations = iteration+1
+		if self.checkpoint <= 0 or self.iterations % self.checkpoint != 0:
+			return False
+		slot = self.iterations//self.checkpoint - 1
+		if slot >= len(self.best):
+			return False
+		density = self.density(state, self.l)
+		with self.best.get_lock():
+			if density > self.best[slot]:
+				self.best[slot] = density
+			bestDensity = self.best[slot]
+		self.cancelled = density < (1-self.margin)*bestDensity
+		return self.cancelled
+
+# Runs one seeded packing inside a worker and returns its summary and final state
+def _run(job):
+	seed, strategy, initial, features, monitor, kwargs, checkpoint, margin = job
+	np.random.seed(seed)
+	l = kwargs.get('l', 1.0)
+	state = None
+	if initial is not None:
+		state = initial()
+		state.reset_schedule(kwargs.get('initstepscale', 0.9), kwargs.get('initrotrange', 360.0))
+	canceller = CheckpointCanceller(_best, checkpoint, margin, l, strategy.density)
+	start = time.time()
+	state = packingEngine.pack(strategy, backend=_backend, callback=util.chain_callbacks(canceller, monitor), state=state, **dict(kwargs, **features))
+	summary = {'seed': seed,
+			   'density': strategy.density(state, l),
+			   'iterations': canceller.iterations,
+			   'time': time.time()-start,
+			   'cancelled': canceller.cancelled,
+			   'stats': features.get('stats')}
+	return summary, state
+
+# The summary of the best run: the densest of those that were not cancelled
+def best_summary(summaries):
+	return max(summaries, key=lambda s: (not s['cancelled'], s['density']))
+
+# Runs restarts independently seeded packings with the given move strategy, a
+# name from packingEngine.STRATEGIES or a MoveStrategy, across a pool of worker
+# processes and returns the densest final state with a list of per-run
+# summaries, in seed order
+# initial makes the starting state of a run after it is seeded, the strategy's
+# starting configuration is used if it is None
+# features holds the optional objects of packingEngine.pack (stats, activeset,
+# separation, clusters, schedule) and monitor a further callback; every run gets
+# its own copies of them and of the strategy, and the stats of a run are in its summary
+# Every checkpoint iterations a run is cancelled if its density, as the strategy
+# measures it, is more than margin (a fraction) below the best density any run
+# reached at that checkpoint
+def run_restarts(restarts, workers, strategy='V2', seed=0, checkpoint=100, margin=0.25, backend='numpy', initial=None, features=None, monitor=None, **kwargs):
+	if isinstance(strategy, str):
+		assert strategy in packingEngine.STRATEGIES, "Unknown move strategy {0}, expected one of {1}".format(strategy, sorted(packingEngine.STRATEGIES.keys()))
+		strategy = packingEngine.STRATEGIES[strategy]()
+	assert restarts >= 1 and workers >= 1
+	slots = 1
+	if checkpoint > 0:
+		slots = max(1, kwargs.get('max_iters', 1000)//checkpoint)
+	best = multiprocessing.Array('d', [0.0]*slots)
+	jobs = [(seed+k, strategy, initial, features or {}, monitor, kwargs, checkpoint, margin) for k in range(restarts)]
+	pool = multiprocessing.Pool(workers, _init_worker, (backend, best))
+	try:
+		results = pool.map(_run, jobs, chunksize=1)
+	finally:
+		pool.close()
+		pool.join()
+	summaries = [summary for summary, state in results]
+	return results[summaries.index(best_summary(summaries))][1], summaries
+
+# Formats per-run summaries as a plain text table, marking the best run
+def summary_table(summaries):
+	best = best_summary(summaries)
+	lines = ["{0:>10} {1:>12} {2:>10} {3:>10}  {4}".format("seed", "density", "iterations", "time (s)", "status")]
+	for s in summaries:
+		status = "cancelled" if s['cancelled'] else "finished"
+		if s is best:
+			status += " (best)"
+		lines.append("{0:>10} {1:>12.6f} {2:>10} {3:>10.2f}  {4}".format(s['seed'], s['density'], s['iterations'], s['time'], status))
+	return "\n".join(lines)
@@ -0,0 +1,448 @@
+import collections
+import time
+import numpy as np
+import collision
+import util
+from convexPolygon import rotation_matrix
+from packingState import PackingState
+
+# Packing loop shared by every variant of the guided packing
+# A PackingEngine owns a collision backend and runs packings one sweep at a time;
+# what differs between the variants, how proposals are drawn, tested and swept,
+# lives in a move strategy:
+# V1: a single random plane rotation per proposal
+# V2: rotations composed from one random rotation in every plane
+# V3: V2 with a translation bias towards the nearest neighbour
+# batchedMoves.BatchedMoves, periodic.PeriodicMoves and parallelSweep.ParallelSweep
+# are strategies too, so the schedule and every optional feature work with them
+# The backend is created once per engine, so any number of runs can reuse it
+
+# Progress reported after every sweep by PackingEngine.run
+# state is the live PackingState, not a copy; read it before the next sweep
+Snapshot = collections.namedtuple('Snapshot', ['iteration', 'converged', 'centerOfMass', 'state'])
+
+# Draws and tests the proposals for one tetrahedron; subclasses provide the
+# rotations and may override any other step of a sweep
+class MoveStrategy(object):
+	# Starting configuration of numtetras tetrahedra for runs started without a state
+	def initial_state(self, engine, numtetras, genmult, geninc, comresum):
+		return PackingState.from_simplices(util.generate_tetrahedra(numtetras,genmult,geninc,engine.l), comresum)
+
+	# Called once the engine has set up a run, and when the engine is closed
+	def start(self, engine):
+		pass
+
+	def close(self):
+		pass
+
+	# Broad phase grid over the state of the engine
+	def grid(self, engine):
+		return util.build_grid(engine.state)
+
+	# Determines whether candidate vertices for tetrahedron i overlap any other
+	def collides(self, engine, i, candidate, timed=False):
+		return util.collides(engine.state, i, candidate, engine.grid, engine.backend, engine.stats, timed, engine.separation)
+
+	# Indices of the tetrahedra other than those in exclude whose centroids lie
+	# within the interaction range of c, and their vertices as seen from c
+	def surroundings(self, engine, c, exclude=()):
+		state = engine.state
+		near = np.array([j for j in engine.grid.neighbours(c, count=False) if j not in exclude], dtype=int)
+		near = near[np.linalg.norm(state.centroids[near]-c, axis=1) <= 2*state.circumradius()]
+		return near, state.verts[near]
+
+	# Translation for tetrahedron i, moving it towards the center of mass
+	def translation(self, engine, i):
+		state = engine.state
+		return util.propose_translation(state.centroids[i], engine.centerOfMass, state.scales[i])
+
+	# Rotation matrix for tetrahedron i, about to be posed with usedVerts around
+	# usedCentroid
+	def rotation(self, engine, i, usedVerts, usedCentroid):
+		raise NotImplementedError
+
+	# Proposes a translation and then a rotation for tetrahedron i, applies what
+	# does not collide and returns whether each was accepted, or None if the
+	# engine defers the translation
+	def propose(self, engine, i, timed=False):
+		state = engine.state
+		stats = engine.stats
+		useTranslation = True
+		useRotation = True
+
+		# get translation, as the state will store it
+		tvec = self.translation(engine, i)
+		if engine.deferred(i, tvec):
+			return None
+		tvec = state.stored_translation(i, tvec)
+		translated = state.verts[i] + tvec
+		# reject translation if it results in a collision and update the step size
+		if engine.collides(i, translated, timed):
+			useTranslation = False
+		engine.schedule.translated(state, i, useTranslation)
+
+		usedVerts = state.verts[i]
+		usedCentroid = state.centroids[i]
+		if useTranslation:
+			usedVerts = translated
+			usedCentroid = state.centroids[i] + tvec
+
+		if timed:
+			start = time.time()
+		# get rotation
+		rotation = self.rotation(engine, i, usedVerts, usedCentroid)
+		rotated = state.pose_vertices(usedCentroid, state.stored_orientations(np.dot(rotation, state.orientations[i])))
+		if timed:
+			stats.add_time('rotation', time.time()-start)
+		# reject rotation if it results in a collision and update the rotation size
+		if engine.collides(i, rotated, timed):
+			useRotation = False
+		engine.schedule.rotated(state, i, useRotation)
+
+		engine.apply(i, tvec if useTranslation else None, rotation if useRotation else None, timed)
+		return useTranslation, useRotation
+
+	# Visits the tetrahedra at indices, in order
+	def sweep(self, engine, indices):
+		for i in indices:
+			engine.visit(i)
+
+	# Called after every sweep and its cluster phase; returns False while the
+	# strategy has work left that should keep the run going
+	def end_sweep(self, engine):
+		return True
+
+	# Packing fraction of state, measured in its bounding box
+	def density(self, state, l=1.0):
+		return util.boxDensity(state, l)
+
+	# Prints the progress report of a verbose run
+	def report(self, engine):
+		state = engine.state
+		cubeVolume = util.cubeContainerVolume(state)
+		print "box container volume: ", cubeVolume
+		tetVolume = engine.l**3.0/(6*2**0.5)*len(state)
+		print "density: ", tetVolume/cubeVolume
+
+class V1Moves(MoveStrategy):
+	def rotation(self, engine, i, usedVerts, usedCentroid):
+		centerOfMass = engine.centerOfMass
+		degrees = np.random.uniform(engine.state.rotranges[i])
+		plane = (0,np.random.choice(range(1,len(usedCentroid))))
+		rotation = rotation_matrix(degrees,plane,'deg')
+		# flip direction of rotation if it increases net vertex distance from COM
+		if util.net_distance(centerOfMass, util.rotate_vertices(usedVerts, rotation)) > util.net_distance(centerOfMass, usedVerts):
+			rotation = rotation.T
+		return rotation
+
+class V2Moves(MoveStrategy):
+	def rotation(self, engine, i, usedVerts, usedCentroid):
+		centerOfMass = engine.centerOfMass
+		rotation = np.eye(len(usedCentroid))
+		netdist = util.net_distance(centerOfMass, usedVerts)
+		for j in range(len(usedCentroid)):
+			for k in range(j+1,len(usedCentroid)):
+				degrees = np.random.uniform(engine.state.rotranges[i])
+				planeRotation = rotation_matrix(degrees,(j,k),'deg')
+				# flip direction of rotation if it increases net vertex distance from COM
+				if util.net_distance(centerOfMass, util.rotate_vertices(usedVerts, planeRotation)) > netdist:
+					planeRotation = planeRotation.T
+				rotation = np.dot(planeRotation, rotation)
+		return rotation
+
+class V3Moves(MoveStrategy):
+	def translation(self, engine, i):
+		state = engine.state
+		tvec = MoveStrategy.translation(self, engine, i)
+		# add local optimization bias
+		j = engine.grid.nearest(state.centroids[i], i)
+		# if only one tetrahedron
+		if j == None:
+			j = i
+		bias = state.centroids[j] - state.centroids[i]
+		tvec += state.scales[i]*np.random.uniform(np.minimum(bias,0),np.maximum(bias,0))
+		return tvec
+
+	def rotation(self, engine, i, usedVerts, usedCentroid):
+		state = engine.state
+		centerOfMass = engine.centerOfMass
+		# find nearest after possible translation
+		j = engine.grid.nearest(usedCentroid, i)
+		# if only one tetrahedron
+		if j == None:
+			nearestCentroid = usedCentroid
+		else:
+			nearestCentroid = state.centroids[j]
+		rotation = np.eye(len(usedCentroid))
+		netdist1 = util.net_distance(centerOfMass, usedVerts)
+		netdist2 = util.net_distance(nearestCentroid, usedVerts)
+		for j in range(len(usedCentroid)):
+			for k in range(j+1,len(usedCentroid)):
+				degrees = np.random.uniform(state.rotranges[i])
+				planeRotation = rotation_matrix(degrees,(j,k),'deg')
+				rotatedVerts = util.rotate_vertices(usedVerts, planeRotation)
+				netrdist1 = util.net_distance(centerOfMass, rotatedVerts)
+				netrdist2 = util.net_distance(nearestCentroid, rotatedVerts)
+				# flip direction of rotation if it increases net vertex distance from COM
+				if netrdist1 > netdist1 and netrdist2 > netrdist2:
+					planeRotation = planeRotation.T
+				rotation = np.dot(planeRotation, rotation)
+		return rotation
+
+STRATEGIES = {'V1': V1Moves, 'V2': V2Moves, 'V3': V3Moves}
+
+# Updates the step scale and rotation range of a tetrahedron after each of its
+# proposals; the convergence test still compares them against the thresholds
+# geometric: the original schedule, shrinking by a constant factor after every
+# rejection and never growing
+# adaptive: grows or shrinks them to hold a target acceptance rate
+class GeometricSchedule(object):
+	def __init__(self, stepscalereduction=0.95, rotreduction=0.95):
+		assert(stepscalereduction>0 and stepscalereduction<1)
+		assert(rotreduction>0 and rotreduction<1)
+		self.stepscalereduction = stepscalereduction
+		self.rotreduction = rotreduction
+
+	def attach(self, state):
+		pass
+
+	# Arrays to store in checkpoints; the geometric schedule keeps no state
+	def save(self):
+		return {}
+
+	def restore(self, saved):
+		pass
+
+	def translated(self, state, i, accepted):
+		if not accepted:
+			state.scales[i] *= self.stepscalereduction
+
+	def rotated(self, state, i, accepted):
+		if not accepted:
+			state.rotranges[i] *= self.rotreduction
+
+# Every tetrahedron keeps a moving average of the outcomes of its recent
+# translations and rotations, over roughly window proposals, and after every
+# proposal its step scale or rotation range is multiplied by
+# exp(gain*(rate-target)): it grows while more proposals than the target are
+# accepted and shrinks while fewer are. A single early rejection therefore no
+# longer throttles a tetrahedron for the rest of the run, and jammed tetrahedra,
+# whose rates fall to zero, still shrink geometrically below the thresholds
+# Neither grows past its largest value at the start of the run, since steps as
+# long as the distance to the center of mass can carry tetrahedra outwards
+# Averages start at the target; they and the caps are stored in checkpoints, and
+# a schedule given saved arrays with restore() continues from them when attached
+class AdaptiveSchedule(object):
+	def __init__(self, target=0.3, window=20, gain=0.5):
+		assert target > 0 and target < 1
+		assert window >= 1
+		assert gain > 0
+		self.target = target
+		self.window = float(window)
+		self.gain = gain
+		self.saved = None
+
+	def attach(self, state):
+		if self.saved is not None:
+			self.maxscale, self.maxrange = self.saved['caps']
+			self.translationRates = np.array(self.saved['translation_rates'], dtype=np.float32)
+			self.rotationRates = np.array(self.saved['rotation_rates'], dtype=np.float32)
+			assert len(self.translationRates) == len(state), "Saved acceptance rates do not match the state"
+			self.saved = None
+			return
+		self.maxscale = state.scales.max()
+		self.maxrange = np.abs(state.rotranges).max()
+		self.translationRates = np.full(len(state), self.target, dtype=np.float32)
+		self.rotationRates = np.full(len(state), self.target, dtype=np.float32)
+
+	# Arrays to store in checkpoints: the acceptance rates and the two caps
+	def save(self):
+		return {'caps': np.array([self.maxscale, self.maxrange]),
+				'translation_rates': self.translationRates.copy(),
+				'rotation_rates': self.rotationRates.copy()}
+
+	# Makes the next attach continue from arrays returned by save()
+	def restore(self, saved):
+		self.saved = saved
+
+	def adapt(self, rates, values, i, accepted, limit):
+		rates[i] += (accepted-rates[i])/self.window
+		values[i] = min(limit, values[i]*np.exp(self.gain*(rates[i]-self.target)))
+
+	def translated(self, state, i, accepted):
+		self.adapt(self.translationRates, state.scales, i, accepted, self.maxscale)
+
+	def rotated(self, state, i, accepted):
+		self.adapt(self.rotationRates, state.rotranges, i, accepted, self.maxrange)
+
+# Runs guided packings with one move strategy and one collision backend
+# strategy may be a name from STRATEGIES or a MoveStrategy object, backend a
+# backend name or an already running backend object, which is then left open
+# schedule defaults to the geometric one with the given reductions
+# verbose runs report their counters every 10 sweeps, and the strategy's density
+# report with them unless reportdensity is False, e.g. when a callback reports it
+class PackingEngine(object):
+	def __init__(self, strategy='V2', backend='numpy', stepscalereduction=0.95, rotreduction=0.95, stepthreshold=1e-6, rotationthreshold=0.1, l=1.0, verbose=False, schedule=None, reportdensity=True):
+		assert(stepthreshold>0)
+		if schedule is None:
+			schedule = GeometricSchedule(stepscalereduction, rotreduction)
+		self.schedule = schedule
+		if isinstance(strategy, str):
+			assert strategy in STRATEGIES, "Unknown move strategy {0}, expected one of {1}".format(strategy, sorted(STRATEGIES.keys()))
+			strategy = STRATEGIES[strategy]()
+		self.strategy = strategy
+		self.ownBackend = isinstance(backend, str)
+		if self.ownBackend:
+			backend = collision.make_backend(backend)
+		self.backend = backend
+		self.stepthreshold = stepthreshold
+		self.rotationthreshold = rotationthreshold
+		self.l = l
+		self.verbose = verbose
+		self.reportdensity = reportdensity
+		self.state = None
+
+	# Starts a run on state, or on numtetras tetrahedra from the strategy's
+	# starting configuration when no state is given, and returns the state being packed
+	# stats, activeset, separation and clusters are the optional PackingStats,
+	# ActiveSet, SeparationCache and ClusterMoves of the run
+	def start(self, state=None, numtetras=None, genmult=2, geninc=2, initstepscale=0.9, initrotrange=360.0, comresum=1000, stats=None, activeset=None, separation=None, clusters=None):
+		assert(initstepscale>0 and initstepscale<=1)
+		# state may hold a run to resume, e.g. one loaded from a checkpoint
+		if state is None:
+			state = self.strategy.initial_state(self, numtetras, genmult, geninc, comresum)
+			state.reset_schedule(initstepscale, initrotrange)
+		self.state = state
+		self.centerOfMass = state.com()
+		self.grid = self.strategy.grid(self)
+		self.stats = stats
+		self.activeset = activeset
+		self.separation = separation
+		self.clusters = clusters
+		self.schedule.attach(state)
+		# activeset may restrict the sweeps to the tetrahedra that can still move
+		if activeset is not None:
+			activeset.attach(state, self.grid)
+		# separation may cache pair separations to skip exact tests for small moves
+		if separation is not None:
+			separation.attach(state)
+		self.strategy.start(self)
+		return state
+
+	# Whether a proposal translating tetrahedron i by tvec (or by any of the rows
+	# of tvec) must be left for later; engines packing only part of the
+	# tetrahedra defer translations that could reach beyond it
+	def deferred(self, i, tvec):
+		return False
+
+	# Determines whether candidate vertices for tetrahedron i overlap any other
+	def collides(self, i, candidate, timed=False):
+		return self.strategy.collides(self, i, candidate, timed)
+
+	# Marks tetrahedron i as converged
+	def freeze(self, i):
+		self.state.converged[i] = True
+		if self.activeset is not None:
+			self.activeset.freeze(i)
+
+	# Applies the accepted parts of a move of tetrahedron i, tvec or rotation None
+	# when rejected, to the state and everything that tracks it
+	def apply(self, i, tvec, rotation, timed=False):
+		state = self.state
+		if timed:
+			start = time.time()
+		if tvec is not None or rotation is not None:
+			if self.activeset is not None or self.separation is not None:
+				oldCentroid = state.centroids[i].copy()
+				oldVerts = state.verts[i].copy()
+			state.move(i, tvec, rotation)
+			self.grid.move(i, state.centroids[i])
+			if self.activeset is not None:
+				self.activeset.moved(i, oldCentroid, oldVerts)
+			if self.separation is not None:
+				self.separation.moved(i, oldVerts)
+
+		# update center of mass from the running centroid sum
+		self.centerOfMass = state.com()
+		if timed:
+			self.stats.add_time('update', time.time()-start)
+
+	# Proposes and applies moves for tetrahedron i
+	# Returns False if the proposal was deferred
+	def visit(self, i):
+		state = self.state
+		stats = self.stats
+		# preliminary convergence check
+		if state.scales[i] < self.stepthreshold and abs(state.rotranges[i]) < self.rotationthreshold:
+			self.freeze(i)
+			return True
+		# time this proposal if it is one of the sampled ones
+		timed = stats is not None and stats.sample()
+		accepted = self.strategy.propose(self, i, timed)
+		if accepted is None:
+			if stats is not None:
+				stats.record_deferred()
+			return False
+		if stats is not None:
+			stats.record_moves(*accepted)
+		return True
+
+	# Runs one sweep over the tetrahedra and returns True once all have converged
+	def step(self):
+		state = self.state
+		iteration = state.iteration
+		visit = xrange(len(state)) if self.activeset is None else self.activeset.sweep()
+		self.strategy.sweep(self, visit)
+		# collective moves of jammed groups every few sweeps and before converging
+		moved = 0
+		if self.clusters is not None and self.clusters.due(iteration, state.converged.all()):
+			moved = self.clusters.phase(self)
+		finished = self.strategy.end_sweep(self)
+
+		# print density calculation, check convergence condition
+		state.iteration = iteration+1
+		pruned = self.grid.end_sweep()
+		if self.stats is not None:
+			self.stats.end_sweep(iteration, state, pruned)
+		if self.verbose and iteration % 10 == 9:
+			print("Iteration: " + str(iteration+1))
+			print "candidates pruned by grid: ", pruned
+			if self.clusters is not None:
+				print "cluster moves accepted: ", self.clusters.accepted, "of", self.clusters.proposed
+			if self.reportdensity:
+				self.strategy.report(self)
+		return state.converged.all() and moved == 0 and finished
+
+	# Generator running sweeps until max_iters iterations are done or every
+	# tetrahedron has converged, yielding a Snapshot after each sweep
+	# Nothing is copied; stop iterating to stop the run early
+	def run(self, max_iters=1000):
+		while self.state.iteration < max_iters:
+			done = self.step()
+			yield Snapshot(self.state.iteration, int(self.state.converged.sum()), self.centerOfMass, self.state)
+			if done:
+				return
+
+	# Closes what the strategy set up and the backend if the engine started it
+	def close(self):
+		try:
+			self.strategy.close()
+		finally:
+			if self.ownBackend:
+				self.backend.close()
+
+# Runs one packing with the given move strategy to completion, the way the
+# randomizedGuidedPacking functions do, and returns the final state
+# callback(iteration, state) is called after every sweep and stops the run by
+# returning True
+def pack(strategy, numtetras, genmult=2, geninc=2, initstepscale=0.9, stepscalereduction=0.95, initrotrange=360.0, rotreduction=0.95, stepthreshold=1e-6, rotationthreshold=0.1, l=1.0, max_iters=1000, verbose=False, backend='numpy', comresum=1000, callback=None, state=None, stats=None, activeset=None, separation=None, clusters=None, schedule=None, reportdensity=True):
+	engine = PackingEngine(strategy, backend, stepscalereduction, rotreduction, stepthreshold, rotationthreshold, l, verbose, schedule, reportdensity)
+	try:
+		state = engine.start(state, numtetras, genmult, geninc, initstepscale, initrotrange, comresum, stats, activeset, separation, clusters)
+		for snapshot in engine.run(max_iters):
+			# let the caller observe progress and stop the run early
+			if callback is not None and callback(snapshot.iteration-1, state):
+				break
+	finally:
+		engine.close()
+	return state
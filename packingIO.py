@@ -0,0 +1,134 @@
+import io
+import itertools
+import os
+import sys
+import tempfile
+import zipfile
+import numpy as np
+from packingState import CHUNK
+
+# Output formats for packings
+# text: one line per basis vector followed by one line of 12 coordinates per tetrahedron
+# npy: a single (3+4n)x3 float array laid out like the text format, the basis rows
+#   followed by the vertex rows, which can be memory-mapped when reading
+# npz: named arrays 'basis' (3x3) and 'vertices' (nx4x3)
+FORMATS = ('text', 'npy', 'npz')
+
+# Default output file name for each format
+OUTPUT_FILES = {'text': "packing_output.txt", 'npy': "packing_output.npy", 'npz': "packing_output.npz"}
+
+# Lines of the text format, generated one at a time
+def text_lines(basis, vertices):
+	for row in basis:
+		yield ''.join(str(coord)+" " for coord in row)+"\n"
+	for tet in vertices:
+		yield ''.join(str(coord)+" " for coord in tet.ravel())+"\n"
+
+# Writes a packing in the text format, streaming it line by line
+# If echo is set every line is also written to stdout as it is produced
+def write_text(path, basis, vertices, echo=False):
+	with open(path, "wb") as f:
+		for line in text_lines(basis, vertices):
+			f.write(line)
+			if echo:
+				sys.stdout.write(line)
+
+# Vertex rows (4kx3, float64) of chunks of k tetrahedra, computed one chunk at a
+# time, so vertices may also be computed on demand, e.g. the verts of a compact state
+def vertex_rows(vertices, chunk=CHUNK):
+	for start in range(0, len(vertices), chunk):
+		yield np.asarray(vertices[start:start+chunk], dtype=float).reshape(-1, 3)
+
+# Writes the npy header of a float64 array of the given shape to the open file f,
+# followed by its data as blocks of rows in C order
+def write_npy_blocks(f, shape, blocks):
+	np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(np.dtype(float)), 'fortran_order': False, 'shape': shape})
+	for block in blocks:
+		f.write(np.ascontiguousarray(block, dtype=float).tobytes())
+
+# Writes a packing in the npy format
+# The file is streamed a chunk of tetrahedra at a time, so at most one chunk of
+# float64 vertices is held; unlike a memory map, written pages do not stay resident
+def write_npy(path, basis, vertices, chunk=CHUNK):
+	with open(path, "wb") as f:
+		write_npy_blocks(f, (3+4*len(vertices), 3), itertools.chain([basis], vertex_rows(vertices, chunk)))
+
+# Writes a packing in the npz format, the archive np.savez would write
+# The vertices are streamed a chunk at a time into a temporary npy file next to
+# path, which the archive then copies in blocks
+def write_npz(path, basis, vertices, chunk=CHUNK):
+	if not path.endswith('.npz'):
+		path += '.npz'
+	fd, temp = tempfile.mkstemp(suffix='.npy', dir=os.path.dirname(os.path.abspath(path)))
+	try:
+		with os.fdopen(fd, "wb") as f:
+			write_npy_blocks(f, (len(vertices), 4, 3), vertex_rows(vertices, chunk))
+		header = io.BytesIO()
+		np.save(header, np.asarray(basis, dtype=float))
+		archive = zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED, allowZip64=True)
+		try:
+			archive.writestr('basis.npy', header.getvalue())
+			archive.write(temp, 'vertices.npy')
+		finally:
+			archive.close()
+	finally:
+		os.remove(temp)
+
+# Writes a packing (anything with basis and verts, such as a PackingState) in the given format
+def write_packing(path, state, format='text', echo=False):
+	assert format in FORMATS, "Unknown output format {0}, expected one of {1}".format(format, FORMATS)
+	if format == 'text':
+		write_text(path, state.basis, state.verts, echo)
+	elif format == 'npy':
+		write_npy(path, state.basis, state.verts)
+	else:
+		write_npz(path, state.basis, state.verts)
+
+# Reads a packing written in any of the formats, chosen by file extension
+# Returns the basis (3x3) and the vertices (nx4x3); npy files are memory-mapped
+# unless mmap is False, so only the parts that are used get read
+def read_packing(path, mmap=True):
+	if path.endswith('.npy'):
+		data = np.load(path, mmap_mode='r' if mmap else None)
+		return data[:3], data[3:].reshape(-1, 4, 3)
+	elif path.endswith('.npz'):
+		with np.load(path) as data:
+			return data['basis'], data['vertices']
+	else:
+		with open(path) as f:
+			rows = [[float(x) for x in line.split()] for line in f if line.strip()]
+		return np.array(rows[:3]), np.array(rows[3:]).reshape(-1, 4, 3)
+
+# Packing callback that appends the vertices to a preallocated memory-mapped
+# npy file of shape (numframes, n, 4, 3) every `every` iterations
+# Frame k holds the packing after iteration (k+1)*every; frames that were never
+# written stay zero and are dropped by read_trajectory. Frames are copied a chunk
+# of tetrahedra at a time and flushed once written
+class TrajectoryWriter(object):
+	def __init__(self, path, numframes, numtetras, every=10, chunk=CHUNK):
+		self.every = every
+		self.chunk = chunk
+		self.frames = np.lib.format.open_memmap(path, mode='w+', dtype=float, shape=(numframes, numtetras, 4, 3))
+		self.written = 0
+
+	def __call__(self, iteration, state):
+		if (iteration+1) % self.every == 0 and self.written < len(self.frames):
+			frame = self.frames[self.written]
+			for start in range(0, len(frame), self.chunk):
+				frame[start:start+self.chunk] = state.verts[start:start+self.chunk]
+			self.frames.flush()
+			self.written += 1
+		return False
+
+	def close(self):
+		self.frames.flush()
+		del self.frames
+
+# Memory-maps a trajectory written by TrajectoryWriter
+# Returns the written frames as an (f, n, 4, 3) array
+def read_trajectory(path):
+	frames = np.load(path, mmap_mode='r')
+	count = len(frames)
+	while count > 0 and not frames[count-1].any():
+		count -= 1
+	return frames[:count]
@@ -0,0 +1,413 @@
+import numpy as np
+from convexPolygon import Simplex, rotation_matrix
+from metrics import IncrementalAABB
+from spatialGrid import SpatialGrid, CompactGrid
+
+# Array-backed container for the tetrahedra being packed
+# Every tetrahedron is stored as a position (its centroid) and a 3x3 orientation
+# matrix applied to one shared reference shape centered at the origin
+# Rotations are composed into the orientation matrices instead of being applied to
+# vertices, so the shape cannot drift; the nx4x3 vertex array is materialized from
+# the poses with one batched matmul and refreshed row by row as moves are accepted
+class PackingState(object):
+	# reference should have shape 4x3 and be centered at the origin
+	# centroids should have shape nx3 and orientations shape nx3x3
+	# basis should have shape 3x3 and is shared by all tetrahedra
+	# resum_interval is the number of pose updates after which the running
+	# centroid sum is recomputed exactly and the orientations are re-orthonormalized
+	def __init__(self, reference, centroids, orientations, basis=np.array([[1.0,0.0,0.0],[0.0,1.0,0.0],[0.0,0.0,1.0]]), resum_interval=1000):
+		self.reference = np.array(reference, dtype=float)
+		self.centroids = np.array(centroids, dtype=float)
+		self.orientations = np.array(orientations, dtype=float)
+		self.basis = np.array(basis, dtype=float)
+		self.resum_interval = resum_interval
+		self.bounds = None
+		# periodic simulation cell, if the packing has periodic boundaries
+		self.cell = None
+		self.resum()
+		self.reset_schedule()
+
+	# Builds a state from a list of congruent Simplex objects
+	# The first tetrahedron provides the reference shape and each orientation is
+	# recovered by a least squares fit snapped to the nearest orthogonal matrix
+	# Any further keyword arguments are passed on to the constructor
+	@classmethod
+	def from_simplices(cls, tetralist, resum_interval=1000, **kwargs):
+		reference = tetralist[0].v - tetralist[0].c
+		centroids = np.array([tet.c for tet in tetralist])
+		offsets = np.array([tet.v - tet.c for tet in tetralist])
+		orientations = np.array([np.linalg.lstsq(reference, offset, rcond=None)[0].T for offset in offsets])
+		return cls(reference, centroids, orthonormalize(orientations), tetralist[0].b, resum_interval, **kwargs)
+
+	def __len__(self):
+		return len(self.centroids)
+
+	# Reset the per-tetrahedron optimizer schedule (step scale, rotation range and
+	# convergence flag) and the count of completed iterations
+	def reset_schedule(self, initstepscale=0.9, initrotrange=360.0):
+		self.scales = np.full(len(self.centroids), float(initstepscale))
+		self.rotranges = np.full(len(self.centroids), float(initrotrange))
+		self.converged = np.zeros(len(self.centroids), dtype=bool)
+		self.iteration = 0
+
+	# Returns a Simplex-compatible view of tetrahedron i
+	def __getitem__(self, i):
+		if i < 0:
+			i += len(self.centroids)
+		if i < 0 or i >= len(self.centroids):
+			raise IndexError("tetrahedron index out of range")
+		return SimplexView(self, i)
+
+	def __iter__(self):
+		for i in range(len(self.centroids)):
+			yield SimplexView(self, i)
+
+	# Distance from the centroid to the farthest vertex, shared by all tetrahedra
+	# The reference shape need not be regular, so every vertex is considered
+	def circumradius(self):
+		return np.linalg.norm(self.reference, axis=1).max()
+
+	# Broad phase grid over the centroids with the given cell size
+	def spatial_grid(self, cellsize):
+		return SpatialGrid(self.centroids, cellsize)
+
+	# Vertices of the tetrahedra at indices (all by default) in one batched matmul
+	def vertices(self, indices=slice(None)):
+		return self.centroids[indices][...,None,:] + np.matmul(self.reference, np.swapaxes(self.orientations[indices], -1, -2))
+
+	# Vertices of the reference shape placed at centroid with the given orientation
+	def pose_vertices(self, centroid, orientation):
+		return centroid + np.dot(self.reference, orientation.T)
+
+	# Recompute the running centroid sum exactly, remove any rounding drift from the
+	# orientations and rematerialize every vertex
+	def resum(self):
+		self.orientations = orthonormalize(self.orientations)
+		self.verts = self.vertices()
+		self.centroid_sum = self.centroids.sum(axis=0)
+		self.updates_since_resum = 0
+		if self.bounds is not None:
+			self.track_bounds()
+
+	# Start keeping an axis aligned bounding box of all vertices up to date as
+	# tetrahedra move, available as bounds
+	def track_bounds(self):
+		self.bounds = IncrementalAABB(self.verts)
+
+	# Get "center of mass" of all tetrahedra from the running centroid sum in O(1)
+	def com(self):
+		return self.centroid_sum/len(self.centroids)
+
+	# Apply an optional translation and an optional rotation about the centroid
+	# to tetrahedron i and refresh its vertices once
+	def move(self, i, tvec=None, rotation=None):
+		if tvec is not None:
+			self.centroids[i] += tvec
+			self.centroid_sum += tvec
+		if rotation is not None:
+			self.orientations[i] = np.dot(rotation, self.orientations[i])
+		self.verts[i] = self.pose_vertices(self.centroids[i], self.orientations[i])
+		if self.bounds is not None:
+			self.bounds.update(i, self.verts[i])
+		self.updates_since_resum += 1
+		if self.updates_since_resum >= self.resum_interval:
+			self.resum()
+
+	# The translations of the tetrahedra at indices i and the orientation matrices
+	# exactly as move would store them, so candidate poses can be checked as they
+	# will be kept; the full state stores both as given
+	def stored_translation(self, i, tvec):
+		return tvec
+
+	def stored_orientations(self, orientations):
+		return orientations
+
+	# Translate tetrahedron i by tvec in place
+	def translate(self, i, tvec):
+		self.move(i, tvec=np.asarray(tvec, dtype=float))
+
+	# Rotate tetrahedron i in place with a dxd rotation matrix about anchor,
+	# default anchor is its centroid
+	def rotate(self, i, matrix, anchor=None):
+		tvec = None
+		if anchor is not None:
+			tvec = np.dot(self.centroids[i]-anchor, matrix.T) + anchor - self.centroids[i]
+		self.move(i, tvec, matrix)
+
+	# Returns an independent list of Simplex objects with the current coordinates
+	def to_simplices(self):
+		return [Simplex(v, self.basis) for v in self.verts]
+
+	# Independent state of copies of the tetrahedra at indices, in that order, with
+	# their schedules, the periodic cell and the iteration count, e.g. to pack part
+	# of the state elsewhere
+	def subset(self, indices):
+		state = PackingState.__new__(type(self))
+		state.reference = self.reference
+		state.basis = self.basis
+		state.resum_interval = self.resum_interval
+		state.bounds = None
+		state.cell = self.cell
+		state.centroids = self.centroids[indices]
+		state.orientations = self.orientations[indices]
+		state.verts = self.verts[indices]
+		state.centroid_sum = state.centroids.sum(axis=0)
+		state.updates_since_resum = 0
+		state.scales = self.scales[indices]
+		state.rotranges = self.rotranges[indices]
+		state.converged = self.converged[indices]
+		state.iteration = self.iteration
+		return state
+
+# Layout of one tetrahedron in a CompactPackingState, 37 bytes without padding
+COMPACT_RECORD = np.dtype([('centroid', '<f4', (3,)), ('quaternion', '<f4', (4,)), ('scale', '<f4'), ('rotrange', '<f4'), ('converged', '?')])
+
+# Number of tetrahedra converted at a time when a compact state is filled or its
+# vertices are computed, so float64 temporaries never exist for all of them at
+# once; the megabyte or so they take stays small next to the records of 10^5
+# tetrahedra
+CHUNK = 4096
+
+# PackingState for packings of 10^5 to 10^6 tetrahedra
+# Every tetrahedron is one COMPACT_RECORD: a float32 centroid, a float32 unit
+# quaternion for its orientation and its schedule, all in one record array that is
+# optionally a memory-mapped file at path. Vertices are not stored; verts and
+# orientations are read-only proxies that compute float64 vertices and rotation
+# matrices for the indices asked for, so the exact overlap test still sees float64
+# Storing poses in float32 rounds them to about 1e-7 of the coordinates; moves
+# test candidates rounded the same way, so accepted moves leave no overlaps
+class CompactPackingState(PackingState):
+	def __init__(self, reference, centroids, orientations, basis=np.array([[1.0,0.0,0.0],[0.0,1.0,0.0],[0.0,0.0,1.0]]), resum_interval=1000, path=None):
+		self.allocate(reference, len(centroids), basis, resum_interval, path)
+		for start in range(0, len(centroids), CHUNK):
+			chunk = slice(start, start+CHUNK)
+			self.centroids[chunk] = centroids[chunk]
+			self.quaternions[chunk] = matrix_quaternions(orientations[chunk])
+		self.resum()
+		self.reset_schedule()
+
+	# Builds a state of numtetras tetrahedra at the origin in the reference
+	# orientation, to be filled in place
+	@classmethod
+	def empty(cls, reference, numtetras, basis=np.array([[1.0,0.0,0.0],[0.0,1.0,0.0],[0.0,0.0,1.0]]), resum_interval=1000, path=None):
+		state = cls.__new__(cls)
+		state.allocate(reference, numtetras, basis, resum_interval, path)
+		state.quaternions[:,0] = 1.0
+		state.resum()
+		state.reset_schedule()
+		return state
+
+	# Sets up the record array, in memory or in a new file at path, and the views
+	# onto its fields
+	def allocate(self, reference, numtetras, basis, resum_interval, path):
+		self.reference = np.array(reference, dtype=float)
+		self.basis = np.array(basis, dtype=float)
+		self.resum_interval = resum_interval
+		self.bounds = None
+		self.cell = None
+		self.path = path
+		if path is None:
+			self.records = np.zeros(numtetras, dtype=COMPACT_RECORD)
+		else:
+			self.records = np.memmap(path, dtype=COMPACT_RECORD, mode='w+', shape=(numtetras,))
+		self.centroids = self.records['centroid']
+		self.quaternions = self.records['quaternion']
+		self.scales = self.records['scale']
+		self.rotranges = self.records['rotrange']
+		self.converged = self.records['converged']
+		self.orientations = CompactOrientations(self)
+		self.verts = CompactVertices(self)
+
+	# The schedule lives in the records, so it is reset in place
+	def reset_schedule(self, initstepscale=0.9, initrotrange=360.0):
+		self.scales[:] = initstepscale
+		self.rotranges[:] = initrotrange
+		self.converged[:] = False
+		self.iteration = 0
+
+	def spatial_grid(self, cellsize):
+		return CompactGrid(self.centroids, cellsize)
+
+	def vertices(self, indices=slice(None)):
+		centroids = np.asarray(self.centroids[indices], dtype=float)
+		return centroids[...,None,:] + np.matmul(self.reference, np.swapaxes(quaternion_matrices(self.quaternions[indices]), -1, -2))
+
+	# Recompute the running centroid sum exactly
+	# Quaternions are normalized whenever they change and vertices are not stored,
+	# so unlike the full state nothing else needs refreshing
+	def resum(self):
+		self.centroid_sum = self.centroids.sum(axis=0, dtype=float)
+		self.updates_since_resum = 0
+
+	# The bounds of each tetrahedron are computed a chunk at a time and kept in
+	# float32, so tracking them adds 24 bytes per tetrahedron
+	def track_bounds(self):
+		lows = np.empty((len(self), 3), dtype=np.float32)
+		highs = np.empty((len(self), 3), dtype=np.float32)
+		for start in range(0, len(self), CHUNK):
+			verts = self.vertices(slice(start, start+CHUNK))
+			lows[start:start+CHUNK] = verts.min(axis=1)
+			highs[start:start+CHUNK] = verts.max(axis=1)
+		self.bounds = IncrementalAABB.from_bounds(lows, highs)
+
+	def move(self, i, tvec=None, rotation=None):
+		if tvec is not None:
+			old = self.centroids[i].astype(float)
+			self.centroids[i] = old + tvec
+			# add the change actually stored, after rounding to float32
+			self.centroid_sum += self.centroids[i] - old
+		if rotation is not None:
+			self.quaternions[i] = self.stored_quaternions(np.dot(rotation, quaternion_matrices(self.quaternions[i])))
+		if self.bounds is not None:
+			self.bounds.update(i, self.vertices(i))
+		self.updates_since_resum += 1
+		if self.updates_since_resum >= self.resum_interval:
+			self.resum()
+
+	# Centroids are rounded to float32 when stored
+	def stored_translation(self, i, tvec):
+		old = np.asarray(self.centroids[i], dtype=float)
+		return (old + tvec).astype(np.float32) - old
+
+	# Unit quaternions, rounded to float32, of orientation matrices
+	def stored_quaternions(self, orientations):
+		q = matrix_quaternions(orientations)
+		return (q/np.linalg.norm(q, axis=-1)[...,None]).astype(np.float32)
+
+	def stored_orientations(self, orientations):
+		return quaternion_matrices(self.stored_quaternions(orientations))
+
+	def to_simplices(self):
+		return [Simplex(self.vertices(i), self.basis) for i in range(len(self))]
+
+	# The subset is always kept in memory
+	def subset(self, indices):
+		state = CompactPackingState.__new__(type(self))
+		state.allocate(self.reference, len(indices), self.basis, self.resum_interval, None)
+		state.records[:] = self.records[indices]
+		state.cell = self.cell
+		state.iteration = self.iteration
+		state.resum()
+		return state
+
+	# Pickled as the records and what allocate needs, e.g. to send a subset to a
+	# worker process; the views onto the records are rebuilt when loaded, in memory
+	def __getstate__(self):
+		return (self.reference, self.basis, self.resum_interval, np.array(self.records), self.cell, self.iteration)
+
+	def __setstate__(self, saved):
+		reference, basis, resum_interval, records, cell, iteration = saved
+		self.allocate(reference, len(records), basis, resum_interval, None)
+		self.records[:] = records
+		self.cell = cell
+		self.iteration = iteration
+		self.resum()
+
+	# Writes pending changes of a memory-mapped state to its file
+	def flush(self):
+		if self.path is not None:
+			self.records.flush()
+
+# Read-only view of the vertices of a CompactPackingState, computed in float64
+# for the indices asked for
+class CompactVertices(object):
+	def __init__(self, state):
+		self.state = state
+
+	def __len__(self):
+		return len(self.state)
+
+	@property
+	def shape(self):
+		return (len(self.state),) + self.state.reference.shape
+
+	def __getitem__(self, indices):
+		return self.state.vertices(indices)
+
+	def __iter__(self):
+		for start in range(0, len(self.state), CHUNK):
+			for tetverts in self.state.vertices(slice(start, start+CHUNK)):
+				yield tetverts
+
+	def __array__(self, dtype=None):
+		return np.asarray(self.state.vertices(), dtype=dtype)
+
+	def copy(self):
+		return self.state.vertices()
+
+# View of the orientations of a CompactPackingState as float64 rotation matrices
+# Assigning matrices stores their quaternions
+class CompactOrientations(object):
+	def __init__(self, state):
+		self.state = state
+
+	def __len__(self):
+		return len(self.state)
+
+	def __getitem__(self, indices):
+		return quaternion_matrices(self.state.quaternions[indices])
+
+	def __setitem__(self, indices, matrices):
+		self.state.quaternions[indices] = self.state.stored_quaternions(matrices)
+
+	def __array__(self, dtype=None):
+		return np.asarray(quaternion_matrices(self.state.quaternions), dtype=dtype)
+
+	def copy(self):
+		return quaternion_matrices(self.state.quaternions)
+
+# Snaps a stack of nearly orthogonal matrices to the closest orthogonal ones
+def orthonormalize(matrices):
+	u, s, vt = np.linalg.svd(matrices)
+	return np.matmul(u, vt)
+
+# Rotation matrices (...x3x3) of unit quaternions (...x4, scalar first), in float64
+def quaternion_matrices(q):
+	w, x, y, z = np.moveaxis(np.asarray(q, dtype=float), -1, 0)
+	return np.stack([np.stack([1-2*(y*y+z*z), 2*(x*y-z*w), 2*(x*z+y*w)], axis=-1),
+					 np.stack([2*(x*y+z*w), 1-2*(x*x+z*z), 2*(y*z-x*w)], axis=-1),
+					 np.stack([2*(x*z-y*w), 2*(y*z+x*w), 1-2*(x*x+y*y)], axis=-1)], axis=-2)
+
+# Unit quaternions (...x4, scalar first) of rotation matrices (...x3x3)
+# The entries of 4qq^T are linear in the matrix; the row of its largest diagonal
+# entry gives q with the best conditioning
+def matrix_quaternions(matrices):
+	m = np.asarray(matrices, dtype=float)
+	shape = m.shape[:-2]
+	m = m.reshape(-1, 3, 3)
+	trace = m[:,0,0] + m[:,1,1] + m[:,2,2]
+	outer = np.stack([np.stack([1+trace, m[:,2,1]-m[:,1,2], m[:,0,2]-m[:,2,0], m[:,1,0]-m[:,0,1]], axis=-1),
+					  np.stack([m[:,2,1]-m[:,1,2], 1+2*m[:,0,0]-trace, m[:,0,1]+m[:,1,0], m[:,0,2]+m[:,2,0]], axis=-1),
+					  np.stack([m[:,0,2]-m[:,2,0], m[:,0,1]+m[:,1,0], 1+2*m[:,1,1]-trace, m[:,1,2]+m[:,2,1]], axis=-1),
+					  np.stack([m[:,1,0]-m[:,0,1], m[:,0,2]+m[:,2,0], m[:,1,2]+m[:,2,1], 1+2*m[:,2,2]-trace], axis=-1)], axis=1)
+	k = np.argmax(np.diagonal(outer, axis1=1, axis2=2), axis=1)
+	rows = outer[np.arange(len(m)), k]
+	q = rows/(2*np.sqrt(rows[np.arange(len(m)), k]))[:,None]
+	return q.reshape(shape + (4,))
+
+# Thin Simplex-compatible view onto one tetrahedron of a PackingState
+# v and c are views into the state arrays, so reading them costs no copies
+# and translate/Rotate update the state itself
+class SimplexView(Simplex):
+	def __init__(self, state, index):
+		self.state = state
+		self.index = index
+
+	@property
+	def v(self):
+		return self.state.verts[self.index]
+
+	@property
+	def c(self):
+		return self.state.centroids[self.index]
+
+	@property
+	def b(self):
+		return self.state.basis
+
+	def translate(self, tvec):
+		assert len(tvec) == len(self.v[0]), "Translation dimensionality {0} does not match simplex dimensionilty {1}".format(len(tvec),len(self.v[0]))
+		self.state.translate(self.index, tvec)
+
+	def Rotate(self, angle, plane, unit='rad', anchor=None):
+		self.state.rotate(self.index, rotation_matrix(angle, plane, unit, len(self.c)), anchor)
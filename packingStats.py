@@ -0,0 +1,141 @@
+import json
+import time
+import numpy as np
+
+# Names of the timed sections of a proposal
+# collision: broad phase, centroid filter and exact overlap test (kernel or IPC)
+# rotation: building the rotation and the rotated candidate
+# update: applying an accepted move to the state, grid and center of mass
+SECTIONS = ('collision', 'rotation', 'update')
+
+# Counters and timers for the packing loop
+# Counters are exact; timers are only read for every sample_every-th proposal and
+# scaled up, so gathering statistics costs almost nothing on the other proposals
+# If stream is a file, one JSON line with the cumulative numbers is written per sweep
+# Stats gathered on part of a packing start with phase, the number of proposals
+# made before it, so that the parts continue the sampling of the whole
+class PackingStats(object):
+	def __init__(self, sample_every=16, stream=None, phase=0):
+		self.sample_every = sample_every
+		self.stream = stream
+		self.phase = phase
+		self.proposals = 0
+		self.deferred = 0
+		self.translations_accepted = 0
+		self.translations_rejected = 0
+		self.rotations_accepted = 0
+		self.rotations_rejected = 0
+		self.pruned_by_grid = 0
+		self.pruned_by_centroid = 0
+		self.exact_pairs = 0
+		self.cached_pairs = 0
+		self.sampled = 0
+		self.times = dict((section, 0.0) for section in SECTIONS)
+		self.converged_at = None
+		self.sweeps = 0
+		self.start = time.time()
+
+	# Counts a proposal and tells whether its sections should be timed
+	def sample(self):
+		self.proposals += 1
+		if (self.proposals+self.phase) % self.sample_every == 0:
+			self.sampled += 1
+			return True
+		return False
+
+	# Adds time measured for a sampled proposal to a section
+	def add_time(self, section, seconds):
+		self.times[section] += seconds
+
+	# Estimated total time spent in a section, scaled up from the samples
+	def estimated_time(self, section):
+		if self.sampled == 0:
+			return 0.0
+		return self.times[section]*float(self.proposals)/self.sampled
+
+	def record_moves(self, translated, rotated):
+		if translated:
+			self.translations_accepted += 1
+		else:
+			self.translations_rejected += 1
+		if rotated:
+			self.rotations_accepted += 1
+		else:
+			self.rotations_rejected += 1
+
+	# Counts a proposal left for later because its translation reached too far
+	def record_deferred(self):
+		self.deferred += 1
+
+	# Counts the pairs left out by the centroid filter, those sent to the exact test
+	# and those the separation cache resolved without it
+	def record_pairs(self, pruned, exact, cached=0):
+		self.pruned_by_centroid += pruned
+		self.exact_pairs += exact
+		self.cached_pairs += cached
+
+	# Adds the counters and sampled times of stats gathered on part of the packing,
+	# such as a cell processed by a worker, to these
+	def merge(self, other):
+		for name in ('proposals', 'deferred', 'translations_accepted', 'translations_rejected', 'rotations_accepted',
+					 'rotations_rejected', 'pruned_by_grid', 'pruned_by_centroid', 'exact_pairs', 'cached_pairs', 'sampled'):
+			setattr(self, name, getattr(self, name)+getattr(other, name))
+		for section in SECTIONS:
+			self.times[section] += other.times[section]
+
+	# Close out a sweep: record the grid pruning and per-tetrahedron convergence and
+	# stream the cumulative numbers if a stream was given
+	def end_sweep(self, iteration, state, pruned):
+		self.sweeps += 1
+		self.pruned_by_grid += pruned
+		if self.converged_at is None:
+			self.converged_at = np.full(len(state), -1, dtype=int)
+		self.converged_at[(self.converged_at < 0) & state.converged] = iteration+1
+		if self.stream is not None:
+			record = self.as_dict()
+			record['iteration'] = iteration+1
+			self.stream.write(json.dumps(record, sort_keys=True)+"\n")
+
+	def as_dict(self):
+		record = {'proposals': self.proposals,
+				  'deferred': self.deferred,
+				  'translations_accepted': self.translations_accepted,
+				  'translations_rejected': self.translations_rejected,
+				  'rotations_accepted': self.rotations_accepted,
+				  'rotations_rejected': self.rotations_rejected,
+				  'pruned_by_grid': self.pruned_by_grid,
+				  'pruned_by_centroid': self.pruned_by_centroid,
+				  'exact_pairs': self.exact_pairs,
+				  'cached_pairs': self.cached_pairs,
+				  'elapsed': time.time()-self.start}
+		for section in SECTIONS:
+			record[section+'_time'] = self.estimated_time(section)
+		if self.converged_at is not None:
+			record['converged'] = int((self.converged_at >= 0).sum())
+		return record
+
+	# Human readable summary of the run
+	def summary(self):
+		record = self.as_dict()
+		elapsed = record['elapsed']
+		line = "sweeps: "+str(self.sweeps)+", proposals: "+str(self.proposals)
+		if self.deferred:
+			line += " ("+str(self.deferred)+" deferred)"
+		lines = [line+", wall time: "+"{0:.2f}".format(elapsed)+" s"]
+		for kind in ('translations', 'rotations'):
+			accepted = record[kind+'_accepted']
+			total = accepted+record[kind+'_rejected']
+			rate = accepted/float(total) if total else 0.0
+			lines.append(kind+": "+str(accepted)+" accepted, "+str(total-accepted)+" rejected ("+"{0:.1%}".format(rate)+" accepted)")
+		lines.append("pairs: "+str(self.pruned_by_grid)+" pruned by grid, "+str(self.pruned_by_centroid)+" pruned by centroid filter, "+str(self.exact_pairs)+" exact tests, "+str(self.cached_pairs)+" skipped by separation cache")
+		for section in SECTIONS:
+			seconds = record[section+'_time']
+			share = seconds/elapsed if elapsed > 0 else 0.0
+			lines.append(section+" time: ~"+"{0:.3f}".format(seconds)+" s ("+"{0:.1%}".format(share)+", sampled 1 in "+str(self.sample_every)+")")
+		if self.converged_at is not None:
+			done = self.converged_at[self.converged_at >= 0]
+			line = "converged: "+str(len(done))+" of "+str(len(self.converged_at))
+			if len(done):
+				line += ", at iterations "+str(int(done.min()))+" (first) / "+str(int(np.median(done)))+" (median) / "+str(int(done.max()))+" (last)"
+			lines.append(line)
+		return "\n".join(lines)
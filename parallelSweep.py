@@ -0,0 +1,279 @@
+import multiprocessing
+import numpy as np
+import collision
+import packingEngine
+import packingStats
+
+# Parallel sweeps by spatial domain decomposition
+# Space is split into cubic cells as wide as the interaction range (twice the
+# circumradius) plus twice the largest step a parallel move may take, and the cells
+# are coloured by the parities of their integer coordinates
+# Cells of one colour are at least one cell apart, so tetrahedra moving in
+# different cells of the same colour can never touch each other; each colour's
+# cells are processed concurrently while everything outside them stays put
+# Within a cell the tetrahedra move one after the other with the wrapped move
+# strategy, on a copy of the cell and its surroundings, so every move is accepted
+# or rejected exactly like in the serial sweep. The cells only log what happened;
+# the moves and the schedule updates are replayed on the packing in the calling
+# process, so the schedule and every optional feature of the engine see them
+# A proposal longer than the largest parallel step is deferred, and tetrahedra
+# that were deferred or moved into an already processed colour are visited
+# serially at the end of the sweep
+# Every cell draws from its own random generator seeded by the run seed, the
+# iteration, the colour and the cell coordinates, so the result for a given seed
+# does not depend on the number of workers
+# In a periodic cell the cells wrap around, with an even number of them per axis
+# so the colours still alternate; cells too narrow for two per axis are swept
+# serially
+
+# Number of cell colours, one per combination of coordinate parities
+COLOURS = 8
+
+# Collision backend of the current process, set up once by _init_worker
+_backend = None
+
+def _init_worker(backendname):
+	global _backend
+	_backend = collision.make_backend(backendname)
+
+# Random generator for one cell of one colour phase
+def cell_rng(seed, iteration, colour, key):
+	return np.random.RandomState([seed & 0xffffffff, iteration, colour]+[k & 0xffffffff for k in key])
+
+# Calls function with the global NumPy generator drawing from cell_rng(*rngkey),
+# which the strategies use, and restores the global generator afterwards
+def with_cell_rng(rngkey, function):
+	saved = np.random.get_state()
+	np.random.set_state(cell_rng(*rngkey).get_state())
+	try:
+		return function()
+	finally:
+		np.random.set_state(saved)
+
+# Schedule of a cell, logging every update to be applied in the calling process
+class ScheduleLog(object):
+	def __init__(self, events):
+		self.events = events
+
+	def attach(self, state):
+		pass
+
+	def translated(self, state, i, accepted):
+		self.events.append(('translated', i, accepted))
+
+	def rotated(self, state, i, accepted):
+		self.events.append(('rotated', i, accepted))
+
+# Engine moving the tetrahedra of one cell, the first of its state, against the
+# others, which stay put
+# The center of mass is that of the whole packing, kept up to date from the
+# moves made here, and translations longer than maxstep are deferred
+# Every move, convergence and schedule update is logged in events
+class CellEngine(packingEngine.PackingEngine):
+	def __init__(self, strategy, backend, stepthreshold, rotationthreshold, l, maxstep, center, numtetras):
+		self.events = []
+		packingEngine.PackingEngine.__init__(self, strategy, backend, stepthreshold=stepthreshold, rotationthreshold=rotationthreshold, l=l, schedule=ScheduleLog(self.events))
+		self.maxstep = maxstep
+		self.center = center
+		self.numtetras = numtetras
+
+	def start(self, state, stats=None):
+		packingEngine.PackingEngine.start(self, state, stats=stats)
+		self.centerOfMass = self.center
+		return state
+
+	def deferred(self, i, tvec):
+		return np.linalg.norm(tvec, axis=-1).max() > self.maxstep
+
+	def freeze(self, i):
+		self.events.append(('converged', i))
+		packingEngine.PackingEngine.freeze(self, i)
+
+	def apply(self, i, tvec, rotation, timed=False):
+		if tvec is not None or rotation is not None:
+			self.events.append(('moved', i, tvec, rotation))
+		if tvec is not None:
+			self.center = self.center + tvec/self.numtetras
+		packingEngine.PackingEngine.apply(self, i, tvec, rotation, timed)
+		self.centerOfMass = self.center
+
+# Moves the tetrahedra of one cell one after the other
+# task is a tuple of
+#   rngkey: (seed, iteration, colour, key) for cell_rng
+#   strategy: the MoveStrategy to move them with
+#   state: a subset of the packing, the tetrahedra to move first and then every
+#     tetrahedron they could touch
+#   moving: the number of tetrahedra to move
+#   center, numtetras: center of mass and number of tetrahedra of the packing
+#   params: (stepthreshold, rotationthreshold, l, maxstep), maxstep the longest
+#     translation allowed, longer proposals are deferred
+#   sampling: (sample_every, phase) of the statistics to gather, None for none
+# backend defaults to the one set up for the process by _init_worker
+# Returns the events logged by its CellEngine, with ('deferred', index) for the
+# deferred tetrahedra, and the statistics gathered
+def process_cell(task, backend=None):
+	rngkey, strategy, state, moving, center, numtetras, params, sampling = task
+	stepthreshold, rotationthreshold, l, maxstep = params
+	stats = None
+	if sampling is not None:
+		stats = packingStats.PackingStats(sampling[0], phase=sampling[1])
+	engine = CellEngine(strategy, backend or _backend, stepthreshold, rotationthreshold, l, maxstep, center, numtetras)
+	engine.start(state, stats=stats)
+	def visit():
+		for k in range(moving):
+			if not engine.visit(k):
+				engine.events.append(('deferred', k))
+	with_cell_rng(rngkey, visit)
+	if stats is not None:
+		stats.pruned_by_grid += engine.grid.end_sweep()
+	return engine.events, stats
+
+# Move strategy running the sweeps of another one split into colour phases whose
+# cells are processed by a pool of worker processes
+# inner is a MoveStrategy or a name from packingEngine.STRATEGIES
+# seed seeds the per-cell random generators; the starting configuration, when the
+# run starts without a state, is drawn from the global NumPy generator as usual
+# maxstep bounds the translations taken in parallel, the circumradius by default
+class ParallelSweep(packingEngine.MoveStrategy):
+	def __init__(self, inner='V2', workers=2, seed=0, maxstep=None):
+		assert workers >= 1
+		if isinstance(inner, str):
+			assert inner in packingEngine.STRATEGIES, "Unknown move strategy {0}, expected one of {1}".format(inner, sorted(packingEngine.STRATEGIES.keys()))
+			inner = packingEngine.STRATEGIES[inner]()
+		self.inner = inner
+		self.workers = workers
+		self.seed = seed
+		self.maxstep = maxstep
+		self.pool = None
+
+	def initial_state(self, engine, numtetras, genmult, geninc, comresum):
+		return self.inner.initial_state(engine, numtetras, genmult, geninc, comresum)
+
+	# the calling process runs the cells itself, on the engine's backend, when
+	# there is a single worker
+	def start(self, engine):
+		self.inner.start(engine)
+		state = engine.state
+		self.limit = self.maxstep
+		if self.limit is None:
+			self.limit = state.circumradius()
+		self.cellsize = 2*state.circumradius() + 2*self.limit
+		if self.workers > 1 and self.pool is None:
+			self.pool = multiprocessing.Pool(self.workers, _init_worker, (engine.backend.name,))
+
+	def close(self):
+		try:
+			if self.pool is not None:
+				self.pool.close()
+				self.pool.join()
+				self.pool = None
+		finally:
+			self.inner.close()
+
+	def grid(self, engine):
+		return self.inner.grid(engine)
+
+	def collides(self, engine, i, candidate, timed=False):
+		return self.inner.collides(engine, i, candidate, timed)
+
+	def surroundings(self, engine, c, exclude=()):
+		return self.inner.surroundings(engine, c, exclude)
+
+	def propose(self, engine, i, timed=False):
+		return self.inner.propose(engine, i, timed)
+
+	def end_sweep(self, engine):
+		return self.inner.end_sweep(engine)
+
+	def density(self, state, l=1.0):
+		return self.inner.density(state, l)
+
+	def report(self, engine):
+		self.inner.report(engine)
+
+	# Cell coordinates of every tetrahedron and the number of cells per axis in a
+	# periodic cell, None without one; None for both when it is too narrow
+	def cell_keys(self, state):
+		centroids = np.asarray(state.centroids, dtype=float)
+		if state.cell is None:
+			return np.floor(centroids/self.cellsize).astype(int), None
+		ncells = int(state.cell.length // self.cellsize)
+		ncells -= ncells % 2
+		if ncells < 2:
+			return None, None
+		return np.floor(state.cell.wrap(centroids)/(state.cell.length/ncells)).astype(int) % ncells, ncells
+
+	# Runs tasks for cells, in the pool or in this process
+	def run_tasks(self, engine, tasks):
+		if self.pool is not None:
+			return self.pool.map(process_cell, tasks, chunksize=max(1, len(tasks)//(4*self.workers)))
+		return [process_cell(task, engine.backend) for task in tasks]
+
+	# Copies the inputs of one cell
+	def make_task(self, engine, rngkey, moving, others, limit):
+		state = engine.state
+		params = (engine.stepthreshold, engine.rotationthreshold, engine.l, limit)
+		sampling = None
+		if engine.stats is not None:
+			sampling = (engine.stats.sample_every, engine.stats.proposals)
+		return (rngkey, self.inner, state.subset(list(moving)+list(others)), len(moving), engine.centerOfMass, len(state), params, sampling)
+
+	# Applies what a cell logged to the packing, with indices the global indices of
+	# its state, and returns the tetrahedra it deferred
+	def replay(self, engine, indices, events, stats):
+		state = engine.state
+		deferred = []
+		for event in events:
+			i = indices[event[1]]
+			if event[0] == 'translated':
+				engine.schedule.translated(state, i, event[2])
+			elif event[0] == 'rotated':
+				engine.schedule.rotated(state, i, event[2])
+			elif event[0] == 'moved':
+				engine.apply(i, event[2], event[3])
+			elif event[0] == 'converged':
+				engine.freeze(i)
+			else:
+				deferred.append(i)
+		if stats is not None:
+			engine.stats.merge(stats)
+		return deferred
+
+	def sweep(self, engine, indices):
+		state = engine.state
+		iteration = state.iteration
+		pending = np.zeros(len(state), dtype=bool)
+		pending[list(indices)] = True
+		pending &= ~state.converged
+		for colour in range(COLOURS):
+			keys, ncells = self.cell_keys(state)
+			if keys is None:
+				break
+			colours = (keys[:,0] & 1) + 2*(keys[:,1] & 1) + 4*(keys[:,2] & 1)
+			occupancy = {}
+			for i, key in enumerate(map(tuple, keys)):
+				occupancy.setdefault(key, []).append(i)
+			cells = {}
+			for i in np.flatnonzero(pending & (colours == colour)):
+				cells.setdefault(tuple(keys[i]), []).append(i)
+			tasks = []
+			for key in sorted(cells):
+				moving = cells[key]
+				around = set()
+				for dx in (-1, 0, 1):
+					for dy in (-1, 0, 1):
+						for dz in (-1, 0, 1):
+							near = (key[0]+dx, key[1]+dy, key[2]+dz)
+							if ncells is not None:
+								near = tuple(k % ncells for k in near)
+							around.update(occupancy.get(near, ()))
+				others = sorted(around - set(moving))
+				tasks.append((moving, others, self.make_task(engine, (self.seed, iteration, colour, key), moving, others, self.limit)))
+			for (moving, others, task), (events, stats) in zip(tasks, self.run_tasks(engine, [task for moving, others, task in tasks])):
+				pending[moving] = False
+				pending[self.replay(engine, moving+others, events, stats)] = True
+		# deferred tetrahedra and those that moved into an already processed
+		# colour are visited one at a time on the packing itself, whose grid finds
+		# their neighbours, each with a generator of its own
+		for i in np.flatnonzero(pending):
+			with_cell_rng((self.seed, iteration, COLOURS, (i,)), lambda: engine.visit(i))
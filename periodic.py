@@ -0,0 +1,234 @@
+import time
+import numpy as np
+import collision
+import metrics
+import initialConfig
+import packingEngine
+from spatialGrid import PeriodicGrid
+from convexPolygon import rotation_matrix
+from packingState import PackingState, CompactPackingState
+
+# Offsets, in cell lengths, from the nearest image of a point to all images that
+# can lie within one cell length of it
+SHIFTS = np.array([[dx,dy,dz] for dx in (-1,0,1) for dy in (-1,0,1) for dz in (-1,0,1)], dtype=float)
+
+# Cubic simulation cell with periodic boundaries
+# length is the side of the cell and shrink the fraction by which the cell is
+# compressed after every sweep, adapted as compressions are accepted or rejected
+class PeriodicCell(object):
+	def __init__(self, length, shrink=0.01):
+		self.length = float(length)
+		self.shrink = float(shrink)
+
+	def volume(self):
+		return self.length**3
+
+	# Maps points into the cell [0, length)^3
+	def wrap(self, points):
+		return points - self.length*np.floor(points/self.length)
+
+	# Shortest periodic image of the displacements d
+	def minimum_image(self, d):
+		return d - self.length*np.round(d/self.length)
+
+	# Images of the points in centroids (nx3) whose centroid lies within reach of c
+	# Returns the indices into centroids and, for each, the translation that
+	# carries the stored point onto that image, a whole number of cell lengths
+	# along every axis
+	# With a cell at least 2*reach wide only the minimum image can be in reach;
+	# narrower cells down to reach are handled by also looking at its neighbours
+	def images(self, c, centroids, reach):
+		d = np.asarray(centroids, dtype=float)-c
+		nearest = -np.round(d/self.length)
+		offsets = d[:,None,:] + (nearest[:,None,:]+SHIFTS[None])*self.length
+		indices, shifts = np.nonzero(np.linalg.norm(offsets, axis=2) <= reach)
+		return indices, (nearest[indices]+SHIFTS[shifts])*self.length
+
+# Determines whether candidate vertices for tetrahedron i intersect a periodic
+# image of any other tetrahedron in the state, or only of those at indices near
+def collides_periodic(state, i, candidate, reach, backend, near=None):
+	cell = state.cell
+	if near is None:
+		near = np.arange(len(state))
+	near = np.asarray(near, dtype=int)
+	indices, translations = cell.images(candidate.mean(axis=0), state.centroids[near], reach)
+	keep = near[indices] != i
+	if not keep.any():
+		return False
+	return backend.intersects_any(candidate, state.verts[near[indices[keep]]] + translations[keep][:,None,:])
+
+# Interaction range of the tetrahedra in a state: twice the distance from the
+# centroid to the farthest vertex
+def interaction_range(state):
+	return 2*initialConfig.bounding_radius(state.reference)
+
+# Packing fraction of a periodic packing: the volume of its tetrahedra with edge
+# length l per cell volume
+def periodic_density(state, l=1.0):
+	return metrics.tetra_volume(l)*len(state)/state.cell.volume()
+
+# Random sequential addition of numtetras tetrahedra with uniformly random
+# orientations into a periodic cell sized for the given packing fraction
+# compact and path make a CompactPackingState, kept in a file at path if given
+def periodic_configuration(numtetras, packingfraction=0.05, l=1.0, shrink=0.01, rng=np.random, backend='numpy', resum_interval=1000, maxattempts=None, compact=False, path=None):
+	reference = initialConfig.reference_tetrahedron(l)
+	reach = 2*initialConfig.bounding_radius(reference)
+	cell = PeriodicCell((numtetras*metrics.tetra_volume(l)/packingfraction)**(1.0/3.0), shrink)
+	assert cell.length >= reach, "The periodic cell must be at least as wide as the interaction range, lower the packing fraction or add tetrahedra"
+	if maxattempts is None:
+		maxattempts = 100*numtetras
+	ownBackend = isinstance(backend, str)
+	if ownBackend:
+		backend = collision.make_backend(backend)
+	centroids = np.empty((numtetras, 3))
+	verts = np.empty((numtetras, 4, 3))
+	orientations = initialConfig.random_orientations(numtetras, rng)
+	placed = 0
+	attempts = 0
+	while placed < numtetras and attempts < maxattempts:
+		attempts += 1
+		c = rng.uniform(0.0, cell.length, 3)
+		v = c + np.dot(reference, orientations[placed].T)
+		indices, translations = cell.images(c, centroids[:placed], reach)
+		if len(indices) and backend.intersects_any(v, verts[indices] + translations[:,None,:]):
+			continue
+		centroids[placed] = c
+		verts[placed] = v
+		placed += 1
+	if ownBackend:
+		backend.close()
+	assert placed == numtetras, "Placed only {0} of {1} tetrahedra in the periodic cell, lower the packing fraction".format(placed, numtetras)
+	if compact:
+		state = CompactPackingState(reference, centroids, orientations, resum_interval=resum_interval, path=path)
+	else:
+		state = PackingState(reference, centroids, orientations, resum_interval=resum_interval)
+	state.cell = cell
+	return state
+
+# Compresses the cell and every centroid by the cell's shrink fraction
+# The compression is undone and False returned if it creates an overlap
+# Every pair is checked once, against the tetrahedra the periodic grid finds
+# around the lower index, which keeps the check linear in the number of
+# tetrahedra; grid follows the compression, or one is built for the check
+# Centroids are scaled in place, so grids sharing them and memory-mapped states
+# see the change
+def try_shrink(state, reach, backend, grid=None):
+	cell = state.cell
+	factor = 1.0-cell.shrink
+	if cell.length*factor < reach:
+		return False
+	oldLength = cell.length
+	oldCentroids = state.centroids.copy()
+	cell.length *= factor
+	state.centroids[:] = oldCentroids*factor
+	state.resum()
+	if grid is None:
+		grid = PeriodicGrid(state.centroids, reach, cell.length)
+	else:
+		grid.rescale(state.centroids, cell.length)
+	for i in range(len(state)):
+		near = [j for j in grid.neighbours(state.centroids[i], i, count=False) if j > i]
+		if near and collides_periodic(state, i, state.verts[i], reach, backend, near):
+			cell.length = oldLength
+			state.centroids[:] = oldCentroids
+			state.resum()
+			grid.rescale(state.centroids, cell.length)
+			return False
+	return True
+
+# Move strategy for bulk density estimates: tetrahedra in a periodic cell take
+# random translations and rotations, checked against the periodic images of
+# their neighbours, while the cell is compressed after every sweep
+# Translations are up to scale edge lengths in each axis and rotations are
+# composed from one random rotation in every plane in either direction; the
+# schedule scales both back as in the other packings. The shrink fraction is
+# reduced on every rejected compression and grows back towards initshrink on
+# every accepted one
+# A run ends once every tetrahedron has converged and the shrink fraction has
+# fallen below shrinkthreshold
+class PeriodicMoves(packingEngine.MoveStrategy):
+	def __init__(self, packingfraction=0.05, initshrink=0.01, shrinkreduction=0.95, shrinkthreshold=1e-6):
+		assert(initshrink>0 and initshrink<1)
+		assert(shrinkreduction>0 and shrinkreduction<1)
+		self.packingfraction = packingfraction
+		self.initshrink = initshrink
+		self.shrinkreduction = shrinkreduction
+		self.shrinkthreshold = shrinkthreshold
+
+	def initial_state(self, engine, numtetras, genmult, geninc, comresum):
+		return periodic_configuration(numtetras, self.packingfraction, engine.l, self.initshrink, backend=engine.backend, resum_interval=comresum)
+
+	# Periodic grid with cells at least the interaction range wide
+	def grid(self, engine):
+		assert engine.state.cell is not None, "A periodic packing needs a state with a periodic cell"
+		return PeriodicGrid(engine.state.centroids, interaction_range(engine.state), engine.state.cell.length)
+
+	def start(self, engine):
+		self.reach = interaction_range(engine.state)
+
+	def collides(self, engine, i, candidate, timed=False):
+		state = engine.state
+		stats = engine.stats
+		if timed:
+			start = time.time()
+		near = np.array(engine.grid.neighbours(candidate.mean(axis=0), i), dtype=int)
+		indices, translations = state.cell.images(candidate.mean(axis=0), state.centroids[near], self.reach)
+		indices = near[indices]
+		if engine.separation is not None and len(indices) > 0:
+			hit, exact, skipped = engine.separation.collides(i, candidate, indices, engine.backend, translations)
+		else:
+			hit = len(indices) > 0 and engine.backend.intersects_any(candidate, state.verts[indices] + translations[:,None,:])
+			exact = len(indices)
+			skipped = 0
+		if stats is not None:
+			stats.record_pairs(len(state)-1-len(indices), exact, skipped)
+			if timed:
+				stats.add_time('collision', time.time()-start)
+		return hit
+
+	def surroundings(self, engine, c, exclude=()):
+		state = engine.state
+		near = np.array([j for j in engine.grid.neighbours(c, count=False) if j not in exclude], dtype=int)
+		indices, translations = state.cell.images(c, state.centroids[near], self.reach)
+		indices = near[indices]
+		return indices, state.verts[indices] + translations[:,None,:]
+
+	# Translation of up to scale edge lengths in each axis, wrapping the centroid
+	# back into the cell
+	def translation(self, engine, i):
+		state = engine.state
+		c = np.asarray(state.centroids[i], dtype=float)
+		tvec = np.random.uniform(-state.scales[i]*engine.l, state.scales[i]*engine.l, 3)
+		return state.cell.wrap(c+tvec) - c
+
+	def rotation(self, engine, i, usedVerts, usedCentroid):
+		rotranges = engine.state.rotranges
+		rotation = np.eye(3)
+		for j in range(3):
+			for k in range(j+1,3):
+				rotation = np.dot(rotation_matrix(np.random.uniform(-rotranges[i], rotranges[i]),(j,k),'deg'), rotation)
+		return rotation
+
+	# Compresses the cell, scaling back the shrink fraction if that fails and
+	# letting it grow back towards initshrink while compressions succeed
+	# A compression moves every tetrahedron, so the grid follows it and the cached
+	# separations are forgotten
+	def end_sweep(self, engine):
+		state = engine.state
+		cell = state.cell
+		if cell.shrink >= self.shrinkthreshold:
+			if try_shrink(state, self.reach, engine.backend, engine.grid):
+				cell.shrink = min(self.initshrink, cell.shrink/self.shrinkreduction)
+				if engine.separation is not None:
+					engine.separation.attach(state)
+				engine.centerOfMass = state.com()
+			else:
+				cell.shrink *= self.shrinkreduction
+		return cell.shrink < self.shrinkthreshold
+
+	def density(self, state, l=1.0):
+		return periodic_density(state, l)
+
+	def report(self, engine):
+		print "cell length: ", engine.state.cell.length
+		print "density: ", periodic_density(engine.state, engine.l)
@@ -0,0 +1,134 @@
+import numpy as np
+import collision
+
+# Cache of lower bounds on the separation of neighbouring tetrahedra, used to skip
+# exact overlap tests for moves too small to close the gap
+# Whenever a proposal for tetrahedron i is found clear of j, a lower bound on their
+# distance is stored together with how far both had travelled at the time. Every
+# accepted move adds the largest displacement of any vertex to the travel of the
+# tetrahedron that moved; since all points of a tetrahedron move at
+# most as far as its farthest moving vertex, the gap left for a pair is the stored
+# bound minus the travel of both since. A later proposal whose vertices move less
+# than that gap cannot overlap j and is accepted for that pair without an exact test
+# Bounds are measured at the proposed pose, so the displacement of the proposal is
+# taken off before storing, which keeps them valid whether or not it is accepted
+# tolerance absorbs the rounding of vertices rematerialized by PackingState.resum
+class SeparationCache(object):
+	def __init__(self, tolerance=1e-9):
+		self.tolerance = tolerance
+		self.state = None
+		self.bounds = {}
+		self.skipped = 0
+
+	# Binds the cache to a packing state, forgetting all stored bounds
+	def attach(self, state):
+		self.state = state
+		self.bounds = {}
+		self.travel = np.zeros(len(state))
+
+	# Key of the pair of tetrahedra i and j, with j shifted by offset, a
+	# translation by whole periodic cells, if one is given
+	def key(self, i, j, offset=None):
+		if offset is None:
+			if i < j:
+				return (i, j)
+			return (j, i)
+		if i < j:
+			return (i, j) + tuple(offset)
+		return (j, i) + tuple(-o for o in offset)
+
+	# Gap known to be left between tetrahedra i and j, 0 if nothing is stored
+	def remaining(self, i, j, offset=None):
+		key = self.key(i, j, offset)
+		entry = self.bounds.get(key)
+		if entry is None:
+			return 0.0
+		bound, travelA, travelB = entry
+		return bound - (self.travel[key[0]]-travelA) - (self.travel[key[1]]-travelB)
+
+	# Stores gap as the bound for the pair of i and j, or forgets the pair if it
+	# is not positive
+	def store(self, i, j, offset, gap):
+		key = self.key(i, j, offset)
+		if gap > 0:
+			self.bounds[key] = (gap, self.travel[key[0]], self.travel[key[1]])
+		else:
+			self.bounds.pop(key, None)
+
+	# Vertices of the tetrahedra at indices, each shifted by its offset if given
+	def vertices(self, indices, offsets):
+		verts = self.state.verts[indices]
+		if offsets is not None:
+			verts = verts + np.asarray(offsets)[:,None,:]
+		return verts
+
+	# Determines whether candidate vertices for tetrahedron i overlap any of the
+	# tetrahedra in near, each shifted by its entry in offsets if given
+	# Pairs whose stored gap the candidate's displacement cannot close are skipped;
+	# the others get a fresh separation bound, and the pairs it cannot prove
+	# disjoint are checked for a vertex inside the other tetrahedron before they
+	# are sent to the exact test
+	# Returns whether there is an overlap, the number of exact pair tests run and
+	# the number of pairs skipped on their stored gap
+	def collides(self, i, candidate, near, backend, offsets=None):
+		state = self.state
+		displacement = np.linalg.norm(candidate-state.verts[i], axis=1).max()
+		unresolved = [k for k in range(len(near)) if self.remaining(i, near[k], None if offsets is None else offsets[k]) <= displacement]
+		skipped = len(near)-len(unresolved)
+		self.skipped += skipped
+		if not unresolved:
+			return False, 0, skipped
+		others = self.vertices([near[k] for k in unresolved], None if offsets is None else [offsets[k] for k in unresolved])
+		bounds = collision.separation_bounds(candidate, others)
+		uncertain = np.flatnonzero(bounds <= self.tolerance)
+		if len(uncertain):
+			if collision.vertex_overlaps(candidate, others[uncertain]).any():
+				return True, 0, skipped
+			if backend.intersects_any(candidate, others[uncertain]):
+				return True, len(uncertain), skipped
+		for k, gap in zip(unresolved, bounds - displacement - self.tolerance):
+			self.store(i, near[k], None if offsets is None else offsets[k], gap)
+		return False, len(uncertain), skipped
+
+	# Determines which pairs of candidate poses (kx4x3) of tetrahedron i and
+	# tetrahedra js overlap, candidate ks[p] against tetrahedron js[p]
+	# Every pair is resolved like in collides, and every candidate's bound less its
+	# displacement is a gap left by the current pose, so the largest is stored
+	# Returns a boolean array of the overlapping pairs, the number of exact pair
+	# tests run and the number of pairs skipped on their stored gap
+	def overlaps(self, i, candidates, ks, js, backend):
+		state = self.state
+		ks = np.asarray(ks)
+		js = np.asarray(js)
+		displacements = np.linalg.norm(candidates-state.verts[i], axis=2).max(axis=1)
+		hits = np.zeros(len(ks), dtype=bool)
+		unresolved = np.array([p for p in range(len(ks)) if self.remaining(i, js[p]) <= displacements[ks[p]]], dtype=int)
+		skipped = len(ks)-len(unresolved)
+		self.skipped += skipped
+		if not len(unresolved):
+			return hits, 0, skipped
+		ks = ks[unresolved]
+		js = js[unresolved]
+		others = state.verts[js]
+		bounds = np.empty(len(unresolved))
+		inside = np.zeros(len(unresolved), dtype=bool)
+		for k in np.unique(ks):
+			pairs = ks == k
+			bounds[pairs] = collision.separation_bounds(candidates[k], others[pairs])
+			uncertain = pairs & (bounds <= self.tolerance)
+			if uncertain.any():
+				inside[uncertain] = collision.vertex_overlaps(candidates[k], others[uncertain])
+		exact = (bounds <= self.tolerance) & ~inside
+		hits[unresolved[inside]] = True
+		if exact.any():
+			hits[unresolved[exact]] = np.asarray(backend.intersect_pairs(candidates[ks[exact]], others[exact]), dtype=bool)
+		gaps = {}
+		for j, gap in zip(js, bounds - displacements[ks] - self.tolerance):
+			gaps[j] = max(gap, gaps.get(j, -np.inf))
+		for j, gap in gaps.items():
+			self.store(i, j, None, gap)
+		return hits, int(exact.sum()), skipped
+
+	# Records an accepted move of tetrahedron i from oldverts to its current pose
+	def moved(self, i, oldverts):
+		self.travel[i] += np.linalg.norm(self.state.verts[i]-oldverts, axis=1).max()
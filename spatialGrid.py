@@ -0,0 +1,390 @@
+import numpy as np
+import math
+
+# Uniform grid over tetrahedron centroids used as a broad phase for collision checks
+# With a cell size of at least the interaction range (twice the circumradius),
+# every tetrahedron that can touch a candidate lies in the 27 cells around it
+class SpatialGrid(object):
+	# centroids should have shape nx3
+	def __init__(self, centroids, cellsize):
+		self.cellsize = float(cellsize)
+		self.positions = np.array(centroids, dtype=float).reshape(-1, 3)
+		self.buffer = self.positions
+		self.cells = {}
+		self.keys = []
+		for i, c in enumerate(self.positions):
+			key = self._key(c)
+			self.keys.append(key)
+			self.cells.setdefault(key, []).append(i)
+		self.pruned = 0
+		self.queried = 0
+		self.pruned_history = []
+
+	def __len__(self):
+		return len(self.positions)
+
+	def _key(self, c):
+		return (int(math.floor(c[0]/self.cellsize)),
+				int(math.floor(c[1]/self.cellsize)),
+				int(math.floor(c[2]/self.cellsize)))
+
+	# Insert a new tetrahedron with centroid c and return its index
+	# The position array grows by doubling, so adding n tetrahedra costs O(n)
+	def add(self, c):
+		count = len(self.positions)
+		if count == len(self.buffer):
+			self.buffer = np.empty((max(16, 2*count), 3))
+			self.buffer[:count] = self.positions
+		self.buffer[count] = c
+		self.positions = self.buffer[:count+1]
+		key = self._key(self.positions[count])
+		self.keys.append(key)
+		self.cells.setdefault(key, []).append(count)
+		return count
+
+	# Update the stored centroid of tetrahedron i, moving it between cells if needed
+	def move(self, i, c):
+		self.positions[i] = c
+		key = self._key(c)
+		oldkey = self.keys[i]
+		if key != oldkey:
+			cell = self.cells[oldkey]
+			cell.remove(i)
+			if not cell:
+				del self.cells[oldkey]
+			self.cells.setdefault(key, []).append(i)
+			self.keys[i] = key
+
+	# Number of cells holding at least one tetrahedron
+	def occupied_cells(self):
+		return len(self.cells)
+
+	# Indices of the tetrahedra in cell (kx, ky, kz)
+	def members(self, kx, ky, kz):
+		return self.cells.get((kx, ky, kz), ())
+
+	# Indices of all tetrahedra in the 27 cells around c, excluding index exclude
+	# Counts every tetrahedron left out as pruned unless count is False
+	def neighbours(self, c, exclude=None, count=True):
+		kx, ky, kz = self._key(c)
+		found = []
+		for dx in (-1, 0, 1):
+			for dy in (-1, 0, 1):
+				for dz in (-1, 0, 1):
+					found.extend(self.members(kx+dx, ky+dy, kz+dz))
+		if exclude is not None and exclude in found:
+			found.remove(exclude)
+		if count:
+			others = len(self.positions) - (0 if exclude is None else 1)
+			self.queried += 1
+			self.pruned += others - len(found)
+		return found
+
+	# Index of the tetrahedron whose centroid is closest to c, excluding index exclude
+	# Searches up to maxring rings of cells outward and falls back to a vectorized
+	# scan of all centroids when nothing close enough is found there, or when the
+	# rings would cover more cells than are occupied
+	# Returns None if there is no other tetrahedron
+	def nearest(self, c, exclude=None, maxring=2):
+		if len(self.positions) - (0 if exclude is None else 1) <= 0:
+			return None
+		kx, ky, kz = self._key(c)
+		best = None
+		bestDist = None
+		r = 0
+		while r <= maxring and (2*r+1)**3 <= 2*self.occupied_cells():
+			for dx in range(-r, r+1):
+				for dy in range(-r, r+1):
+					for dz in range(-r, r+1):
+						if max(abs(dx), abs(dy), abs(dz)) != r:
+							continue
+						for j in self.members(kx+dx, ky+dy, kz+dz):
+							if j == exclude:
+								continue
+							d = np.linalg.norm(self.positions[j]-c)
+							if bestDist is None or d < bestDist:
+								best = j
+								bestDist = d
+			# anything outside ring r is at least r cells away
+			if bestDist is not None and bestDist <= r*self.cellsize:
+				return best
+			r += 1
+		dists = np.linalg.norm(self.positions-c, axis=1)
+		if exclude is not None:
+			dists[exclude] = np.inf
+		return int(np.argmin(dists))
+
+	# Distances from c to the centroids of the tetrahedra at indices
+	def distances(self, c, indices):
+		return np.linalg.norm(np.asarray(self.positions[indices], dtype=float)-c, axis=1)
+
+	# Close out a sweep: record and reset the number of pruned candidates
+	# Returns the number pruned during the sweep
+	def end_sweep(self):
+		pruned = self.pruned
+		self.pruned_history.append(pruned)
+		self.pruned = 0
+		self.queried = 0
+		return pruned
+
+# Spatial grid over the centroids of a packing in a cubic periodic cell of side
+# length
+# The cells tile the periodic cell and wrap around at its faces, so the 27 cells
+# around a point hold every tetrahedron whose nearest periodic image lies within
+# reach of it, and distances are measured to the nearest image. There are as many
+# cells per axis as fit while a hair wider than reach, so a centroid rounded into
+# a neighbouring cell is still found; cells narrower than 3 per axis show up in
+# several of the 27 places around a point but are searched once
+class PeriodicGrid(SpatialGrid):
+	def __init__(self, centroids, reach, length):
+		self.reach = float(reach)
+		self.length = float(length)
+		self.ncells = max(1, int(self.length // (self.reach*(1+1e-9))))
+		SpatialGrid.__init__(self, centroids, self.length/self.ncells)
+
+	def _key(self, c):
+		return (int(math.floor(c[0]/self.cellsize)) % self.ncells,
+				int(math.floor(c[1]/self.cellsize)) % self.ncells,
+				int(math.floor(c[2]/self.cellsize)) % self.ncells)
+
+	def neighbours(self, c, exclude=None, count=True):
+		kx, ky, kz = self._key(c)
+		n = self.ncells
+		keys = set(((kx+dx) % n, (ky+dy) % n, (kz+dz) % n) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1))
+		found = []
+		for key in sorted(keys):
+			found.extend(self.cells.get(key, ()))
+		if exclude is not None and exclude in found:
+			found.remove(exclude)
+		if count:
+			others = len(self.positions) - (0 if exclude is None else 1)
+			self.queried += 1
+			self.pruned += others - len(found)
+		return found
+
+	def distances(self, c, indices):
+		d = np.asarray(self.positions[indices], dtype=float)-c
+		return np.linalg.norm(d - self.length*np.round(d/self.length), axis=1)
+
+	# Nearest by periodic distance, found by a vectorized scan of all centroids
+	def nearest(self, c, exclude=None, maxring=2):
+		if len(self.positions) - (0 if exclude is None else 1) <= 0:
+			return None
+		dists = self.distances(c, slice(None))
+		if exclude is not None:
+			dists[exclude] = np.inf
+		return int(np.argmin(dists))
+
+	# Follows a compression or expansion of the periodic cell to length, with
+	# centroids the scaled centroids
+	# The cells scale with the periodic cell while the same number of them fits,
+	# so only the few tetrahedra rounded into another cell move; otherwise the
+	# grid is built again
+	def rescale(self, centroids, length):
+		self.length = float(length)
+		if max(1, int(self.length // (self.reach*(1+1e-9)))) != self.ncells:
+			pruned, history = self.pruned, self.pruned_history
+			PeriodicGrid.__init__(self, centroids, self.reach, self.length)
+			self.pruned, self.pruned_history = pruned, history
+			return
+		self.cellsize = self.length/self.ncells
+		self.positions[:] = centroids
+		keys = np.floor(self.positions/self.cellsize).astype(int) % self.ncells
+		for i in np.flatnonzero((keys != np.array(self.keys).reshape(-1, 3)).any(axis=1)):
+			self.move(i, self.positions[i])
+
+# Spatial grid for packings of 10^5 to 10^6 tetrahedra that keeps no Python
+# objects per tetrahedron
+# The centroids are shared with the caller instead of copied and the tetrahedra
+# are threaded into linked lists through an int32 array, one list per bucket. The
+# cells in the box occupied at the start, capped at a few cells per tetrahedron,
+# each have a bucket of their own in a dense int32 array of first members; cells
+# outside it, e.g. of a sparse cloud or rare while a packing contracts, share
+# spill buckets picked by a spatial hash of the cell, so walks through those
+# skip the members of other cells. Cells are keyed by their coordinates packed
+# into one integer of 21 bits per axis
+class CompactGrid(SpatialGrid):
+	OFFSET = 2**20
+
+	# centroids should have shape nx3 and are updated by the caller
+	def __init__(self, centroids, cellsize, chunk=4096, boxcells=4):
+		self.cellsize = float(cellsize)
+		self.positions = centroids
+		self.buffer = centroids
+		count = len(centroids)
+		self.codes = np.empty(count, dtype=np.int64)
+		lo = np.full(3, self.OFFSET)
+		hi = np.full(3, -self.OFFSET)
+		keysum = np.zeros(3)
+		for start in range(0, count, chunk):
+			keys = np.floor(np.asarray(centroids[start:start+chunk], dtype=float)/self.cellsize).astype(np.int64)
+			assert (np.abs(keys) < self.OFFSET).all(), "Centroids lie too far from the origin for the compact grid"
+			self.codes[start:start+chunk] = self._pack(keys[:,0], keys[:,1], keys[:,2])
+			lo = np.minimum(lo, keys.min(axis=0))
+			hi = np.maximum(hi, keys.max(axis=0))
+			keysum += keys.sum(axis=0)
+		# shrink the box to a cube about the mean cell if it would be too large
+		if count and np.prod(hi-lo+1) > boxcells*count+4096:
+			side = int((boxcells*count+4096)**(1.0/3.0))
+			lo = np.maximum(lo, np.round(keysum/count).astype(np.int64)-side//2)
+			hi = np.minimum(hi, lo+side-1)
+		self.lo = [int(k) for k in lo]
+		self.size = [max(0, int(k)) for k in hi-lo+1]
+		outside = sum(int((self._slots(self.codes[start:start+chunk]) < 0).sum()) for start in range(0, count, chunk))
+		# a box holding few of the tetrahedra, as in a sparse cloud, is not kept
+		if 2*outside > count:
+			self.size = [0, 0, 0]
+			outside = count
+		self.allocate(count, outside)
+		# link the members of every bucket in index order, a chunk at a time from the
+		# last, each chunk going in front of the members linked before
+		for start in reversed(range(0, count, chunk)):
+			codes = self.codes[start:start+chunk]
+			buckets = self._buckets(codes)
+			order = np.argsort(buckets, kind='mergesort')
+			buckets = buckets[order]
+			order += start
+			first = np.ones(len(order), dtype=bool)
+			first[1:] = buckets[1:] != buckets[:-1]
+			last = np.roll(first, -1)
+			self.next[order[:-1]] = order[1:]
+			self.next[order[last]] = self.heads[buckets[last]]
+			self.heads[buckets[first]] = order[first]
+		self.occupied = int((self.heads[:self.boxsize] >= 0).sum())
+		# cells sharing a spill bucket are told apart by their codes
+		for bucket in xrange(self.boxsize, self.boxsize+self.spill):
+			j = self.heads.item(bucket)
+			cells = set()
+			while j >= 0:
+				cells.add(self.codes.item(j))
+				j = self.next.item(j)
+			self.occupied += len(cells)
+		self.pruned = 0
+		self.queried = 0
+		self.pruned_history = []
+
+	# Sets up the links for count tetrahedra and the first members of the box cells
+	# followed by the spill buckets, a power of two of them and at least as many as
+	# the tetrahedra expected outside the box
+	def allocate(self, count, outside):
+		self.next = np.full(count, -1, dtype=np.int32)
+		self.boxsize = int(np.prod(self.size))
+		self.spill = 4096
+		while self.spill < outside:
+			self.spill *= 2
+		self.heads = np.full(self.boxsize+self.spill, -1, dtype=np.int32)
+		self.occupied = 0
+
+	# Grid with no tetrahedra yet whose adds fill buffer, an nx3 array of the
+	# caller's with room for all of them, so the centroids stay shared as they are
+	# added; the box of dense cells covers the region between the corners lo and hi
+	@classmethod
+	def reserve(cls, buffer, cellsize, lo, hi):
+		grid = cls(buffer[:0], cellsize)
+		grid.buffer = buffer
+		grid.codes = np.empty(len(buffer), dtype=np.int64)
+		grid.lo = [int(k) for k in np.floor(np.asarray(lo, dtype=float)/grid.cellsize)]
+		grid.size = [int(k)-low+1 for k, low in zip(np.floor(np.asarray(hi, dtype=float)/grid.cellsize), grid.lo)]
+		grid.allocate(len(buffer), 0)
+		return grid
+
+	# Cell of c computed in float64 like the initial cells, whatever the dtype of c
+	def _key(self, c):
+		return SpatialGrid._key(self, np.asarray(c, dtype=float))
+
+	def _pack(self, kx, ky, kz):
+		return ((kx+self.OFFSET) << 42) | ((ky+self.OFFSET) << 21) | (kz+self.OFFSET)
+
+	# Positions in the dense head array of an array of packed cells, -1 outside the box
+	def _slots(self, codes):
+		x = ((codes >> 42) & (2**21-1)) - self.OFFSET - self.lo[0]
+		y = ((codes >> 21) & (2**21-1)) - self.OFFSET - self.lo[1]
+		z = (codes & (2**21-1)) - self.OFFSET - self.lo[2]
+		inside = (x >= 0) & (x < self.size[0]) & (y >= 0) & (y < self.size[1]) & (z >= 0) & (z < self.size[2])
+		return np.where(inside, (x*self.size[1]+y)*self.size[2]+z, -1)
+
+	# Buckets of an array of packed cells: their slot in the box or a spill bucket
+	def _buckets(self, codes):
+		slots = self._slots(codes)
+		spilled = self.boxsize + (((codes >> 42)*73856093) ^ (((codes >> 21) & (2**21-1))*19349663) ^ ((codes & (2**21-1))*83492791)) % self.spill
+		return np.where(slots >= 0, slots, spilled)
+
+	# Bucket of the packed cell code
+	def _bucket(self, code):
+		x = ((code >> 42) & (2**21-1)) - self.OFFSET - self.lo[0]
+		y = ((code >> 21) & (2**21-1)) - self.OFFSET - self.lo[1]
+		z = (code & (2**21-1)) - self.OFFSET - self.lo[2]
+		if 0 <= x < self.size[0] and 0 <= y < self.size[1] and 0 <= z < self.size[2]:
+			return (x*self.size[1]+y)*self.size[2]+z
+		return self.boxsize + (((code >> 42)*73856093) ^ (((code >> 21) & (2**21-1))*19349663) ^ ((code & (2**21-1))*83492791)) % self.spill
+
+	# Whether a member of bucket holds the packed cell code
+	def _occupies(self, bucket, code):
+		j = self.heads.item(bucket)
+		while j >= 0:
+			if self.codes.item(j) == code:
+				return True
+			j = self.next.item(j)
+		return False
+
+	# Puts tetrahedron i first in the bucket of the packed cell code
+	def _push(self, i, code):
+		bucket = self._bucket(code)
+		if not self._occupies(bucket, code):
+			self.occupied += 1
+		self.next[i] = self.heads.item(bucket)
+		self.heads[bucket] = i
+
+	def occupied_cells(self):
+		return self.occupied
+
+	def members(self, kx, ky, kz):
+		code = self._pack(kx, ky, kz)
+		found = []
+		j = self.heads.item(self._bucket(code))
+		while j >= 0:
+			if self.codes.item(j) == code:
+				found.append(j)
+			j = self.next.item(j)
+		return found
+
+	# The first tetrahedron added copies the centroids into a buffer of the grid's
+	# own, after which the caller's array is no longer shared; the buffer, the cell
+	# codes and the links grow by doubling, so adding n tetrahedra costs O(n)
+	def add(self, c):
+		count = len(self.positions)
+		if count == len(self.buffer):
+			capacity = max(16, 2*count)
+			self.buffer = np.empty((capacity, 3), dtype=self.positions.dtype)
+			self.buffer[:count] = self.positions
+			codes = np.empty(capacity, dtype=np.int64)
+			codes[:count] = self.codes
+			self.codes = codes
+			links = np.full(capacity, -1, dtype=np.int32)
+			links[:count] = self.next
+			self.next = links
+		self.buffer[count] = c
+		self.positions = self.buffer[:count+1]
+		code = self._pack(*self._key(self.positions[count]))
+		self._push(count, code)
+		self.codes[count] = code
+		return count
+
+	def move(self, i, c):
+		self.positions[i] = c
+		code = self._pack(*self._key(c))
+		oldcode = self.codes.item(i)
+		if code != oldcode:
+			# unlink i from its old bucket, a short walk from its first member
+			bucket = self._bucket(oldcode)
+			j = self.heads.item(bucket)
+			if j == i:
+				self.heads[bucket] = self.next.item(i)
+			else:
+				while self.next.item(j) != i:
+					j = self.next.item(j)
+				self.next[j] = self.next.item(i)
+			if not self._occupies(bucket, oldcode):
+				self.occupied -= 1
+			self._push(i, code)
+			self.codes[i] = code
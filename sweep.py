@@ -0,0 +1,152 @@
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import numpy as np
+import collision
+import metrics
+import multistart
+import packingIO
+
+# Parameter sweeps over the packing with a content-addressed result cache
+# Every point of the sweep (its parameters plus seed) is hashed into a cache key;
+# the packing is stored as <key>.npz next to a <key>.json description, and points
+# whose key is already in the cache are not run again
+
+# Bumped whenever a change to the packing algorithms invalidates cached results
+CACHE_VERSION = 3
+
+# Sweepable parameters in table order: (name, flag, long flag, type, default values, help)
+PARAMETERS = [('numtetras', '-n', '--numtetras', int, [4], "numbers of tetrahedra to pack"),
+			  ('initstepscale', '-is', '--initstepscale', float, [0.9], "initial step size coefficients"),
+			  ('stepscalereduction', '-sr', '--stepscalereduction', float, [0.999], "step scale decay rates"),
+			  ('stepthreshold', '-st', '--stepthreshold', float, [1e-6], "minimum allowed step scales"),
+			  ('initrotrange', '-ir', '--initrotationrange', float, [360.0], "initial permitted ranges of a single rotation move"),
+			  ('rotreduction', '-rr', '--rotreduction', float, [0.999], "rotation range decay rates"),
+			  ('rotationthreshold', '-rt', '--rotationthreshold', float, [0.1], "minimum allowed rotation ranges"),
+			  ('bias', '-b', '--bias', int, [0], "1 to induce nearest neighbor attraction bias (V3), 0 for V2")]
+
+def parse_args():
+	parser = argparse.ArgumentParser(description="Tetrahedron Packing Parameter Sweep")
+	for name, flag, longflag, kind, default, helptext in PARAMETERS:
+		parser.add_argument(flag, longflag, dest=name, type=kind, nargs='+', help=helptext, default=default)
+	parser.add_argument("-l", "--length", type=float, help="edge length of the tetrahedra", default=1.0)
+	parser.add_argument("-i", "--iterations", type=int, help="max number of iterations", default=5000)
+	parser.add_argument("-s", "--seeds", type=int, nargs='+', help="random seeds run for every parameter combination", default=[0])
+	parser.add_argument("-rs", "--randomsample", type=int, help="instead of the full grid, draw this many points uniformly between the smallest and largest value of every parameter", default=0)
+	parser.add_argument("-ss", "--sampleseed", type=int, help="random seed for drawing the sample points", default=0)
+	parser.add_argument("-p", "--workers", type=int, help="number of worker processes", default=1)
+	parser.add_argument("-cb", "--backend", help="collision detection backend", choices=sorted(collision.BACKENDS.keys()), default='numpy')
+	parser.add_argument("-c", "--cache", help="directory holding cached results", default="sweep_cache")
+	parser.add_argument("-m", "--metric", help="container used to measure density in the summary", choices=metrics.METRICS, default='box')
+	parser.add_argument("-o", "--output", help="file to write the summary table to", default="sweep_summary.txt")
+	return parser.parse_args()
+
+# Every combination of the given parameter values, as a list of dicts
+def grid_points(values):
+	names = [name for name, _, _, _, _, _ in PARAMETERS]
+	return [dict(zip(names, combination)) for combination in itertools.product(*[values[name] for name in names])]
+
+# count points drawn uniformly between the smallest and largest value given for
+# every parameter; integer parameters are drawn as integers
+def random_points(values, count, rng):
+	points = []
+	for _ in range(count):
+		point = {}
+		for name, _, _, kind, _, _ in PARAMETERS:
+			lo, hi = min(values[name]), max(values[name])
+			if kind is int:
+				point[name] = int(rng.randint(lo, hi+1))
+			else:
+				point[name] = float(rng.uniform(lo, hi))
+		points.append(point)
+	return points
+
+# Cache key of one run: a hash of everything that determines its result
+def cache_key(point, seed, l, iterations):
+	description = dict(point, seed=seed, l=l, max_iters=iterations, version=CACHE_VERSION)
+	return hashlib.sha1(json.dumps(description, sort_keys=True)).hexdigest()
+
+# Collision backend of the current worker process, set up once by _init_worker
+_backend = None
+
+def _init_worker(backendname):
+	global _backend
+	_backend = collision.make_backend(backendname)
+
+# Runs one point of the sweep and stores the packing and its description in the
+# cache, writing to temporary files first so an interrupted sweep leaves no
+# partial entries
+def _run(job):
+	key, point, seed, l, iterations, cache = job
+	np.random.seed(seed)
+	kwargs = dict((name, point[name]) for name in point if name not in ('numtetras', 'bias'))
+	start = time.time()
+	state = multistart.VARIANTS['V3' if point['bias'] else 'V2'](point['numtetras'], l=l, max_iters=iterations, backend=_backend, **kwargs)
+	description = dict(point, seed=seed, l=l, max_iters=iterations, iterations=state.iteration, time=time.time()-start)
+	path = os.path.join(cache, key)
+	packingIO.write_npz(path+'.tmp.npz', state.basis, state.verts)
+	os.rename(path+'.tmp.npz', path+'.npz')
+	with open(path+'.tmp.json', 'w') as f:
+		json.dump(description, f, sort_keys=True)
+	os.rename(path+'.tmp.json', path+'.json')
+	return key
+
+# Runs every (point, seed) pair that is not cached yet across a pool of workers
+# Returns the list of all keys and the number of runs that were cached already
+def run_sweep(points, seeds, l, iterations, cache, workers=1, backend='numpy'):
+	if not os.path.isdir(cache):
+		os.makedirs(cache)
+	jobs = []
+	keys = []
+	for point in points:
+		for seed in seeds:
+			key = cache_key(point, seed, l, iterations)
+			keys.append(key)
+			if not os.path.exists(os.path.join(cache, key+'.json')):
+				jobs.append((key, point, seed, l, iterations, cache))
+	if jobs:
+		pool = multiprocessing.Pool(workers, _init_worker, (backend,))
+		try:
+			pool.map(_run, jobs, chunksize=1)
+		finally:
+			pool.close()
+			pool.join()
+	return keys, len(keys)-len(jobs)
+
+# Loads the description of a cached run and measures the density of its packing
+def load_result(cache, key, metric='box'):
+	with open(os.path.join(cache, key+'.json')) as f:
+		result = json.load(f)
+	basis, vertices = packingIO.read_packing(os.path.join(cache, key+'.npz'))
+	result['density'] = metrics.density(vertices, metric, result['l'])
+	return result
+
+# Formats results as a plain text table sorted by density, densest first
+def summary_table(results):
+	names = [name for name, _, _, _, _, _ in PARAMETERS]
+	columns = names + ['seed', 'iterations', 'time', 'density']
+	lines = ["\t".join(columns)]
+	for result in sorted(results, key=lambda r: -r['density']):
+		lines.append("\t".join(str(result[column]) for column in columns))
+	return "\n".join(lines)
+
+def main():
+	args = parse_args()
+	values = dict((name, getattr(args, name)) for name, _, _, _, _, _ in PARAMETERS)
+	if args.randomsample > 0:
+		points = random_points(values, args.randomsample, np.random.RandomState(args.sampleseed))
+	else:
+		points = grid_points(values)
+	keys, cached = run_sweep(points, args.seeds, args.length, args.iterations, args.cache, args.workers, args.backend)
+	print(str(len(keys))+" runs, "+str(cached)+" cached, "+str(len(keys)-cached)+" run now")
+	table = summary_table([load_result(args.cache, key, args.metric) for key in sorted(set(keys))])
+	with open(args.output, "w") as f:
+		f.write(table+"\n")
+	print(table)
+
+if __name__ == "__main__":
+	main()
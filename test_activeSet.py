@@ -0,0 +1,58 @@
+import itertools
+import unittest
+import numpy as np
+import activeSet
+import util
+from packingState import PackingState
+
+# A dense start: randomly turned tetrahedra on a cubic grid just wider than their
+# circumspheres, which jam and converge within a few sweeps
+def grid_state(numtetras, seed=5):
+	np.random.seed(seed)
+	side = int(np.ceil(numtetras**(1.0/3)))
+	tetralist = []
+	for site in itertools.islice(itertools.product(range(side), repeat=3), numtetras):
+		t = util.generate_tetrahedra(1)[0]
+		t.translate(1.25*np.array(site)-t.c)
+		for plane in ((0,1), (1,2), (0,2)):
+			t.Rotate(np.random.uniform(360), plane, 'deg')
+		tetralist.append(t)
+	state = PackingState.from_simplices(tetralist)
+	state.reset_schedule(0.3, 90.0)
+	return state
+
+def dense_run(activeset=None, iterations=24):
+	state = grid_state(24)
+	return util.randomizedGuidedPackingV2(24, max_iters=iterations, state=state, activeset=activeset, stepscalereduction=0.5, rotreduction=0.5, stepthreshold=1e-3, rotationthreshold=1.0)
+
+class ActiveSetTest(unittest.TestCase):
+	def test_same_run_without_reactivation(self):
+		activeset = activeSet.ActiveSet(wakedistance=np.inf)
+		state = dense_run(activeset)
+		self.assertEqual(activeset.woken, 0)
+		self.assertLess(activeset.history[-1], 24)
+		self.assertTrue(np.array_equal(state.verts, dense_run().verts))
+
+	def test_moves_wake_converged_neighbours(self):
+		state = dense_run(iterations=16)
+		activeset = activeSet.ActiveSet(0.1, wakescale=0.02, wakerange=2.0)
+		grid = util.build_grid(state)
+		activeset.attach(state, grid)
+		state.converged[:] = True
+		activeset.active.clear()
+		i = 0
+		old = state.centroids[i].copy()
+		oldVerts = state.verts[i].copy()
+		state.move(i, np.array([0.05, 0.0, 0.0]))
+		activeset.moved(i, old, oldVerts)
+		self.assertEqual(activeset.woken, 0)
+		state.move(i, np.array([0.06, 0.0, 0.0]))
+		activeset.moved(i, old, oldVerts)
+		near = [k for k in grid.neighbours(old, i, count=False) if np.linalg.norm(state.centroids[k]-old) <= 2*state.circumradius()]
+		self.assertTrue(near)
+		self.assertEqual(sorted(activeset.active), sorted(near))
+		self.assertFalse(state.converged[near].any())
+		self.assertTrue((state.scales[near] >= 0.02).all() and (state.rotranges[near] >= 2.0).all())
+
+if __name__ == '__main__':
+	unittest.main()
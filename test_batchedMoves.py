@@ -0,0 +1,64 @@
+import unittest
+import numpy as np
+import batchedMoves
+import collision
+import initialConfig
+import packingEngine
+import packingStats
+import separationCache
+import util
+from test_activeSet import grid_state
+from convexPolygon import rotation_matrix
+
+class BatchedMovesTest(unittest.TestCase):
+	def test_plane_rotations_compose_like_the_serial_loops(self):
+		degrees = np.random.RandomState(0).uniform(-180, 180, (5, 3))
+		for angles, rotation in zip(degrees, batchedMoves.plane_rotations(degrees)):
+			expected = np.eye(3)
+			for angle, plane in zip(angles, ((0,1), (0,2), (1,2))):
+				expected = np.dot(rotation_matrix(angle, plane, 'deg'), expected)
+			self.assertTrue(np.allclose(rotation, expected, rtol=0, atol=1e-14))
+
+	def test_translations_match_the_serial_draws(self):
+		c = np.array([1.0, 2.0, -1.0])
+		com = np.array([0.5, 0.0, 0.0])
+		tvecs = batchedMoves.propose_translations(c, com, 0.5, 200, np.random.RandomState(1))
+		rng = np.random.RandomState(1)
+		expected = [util.propose_translation(c, com, 0.5, rng) for k in range(200)]
+		self.assertTrue(np.array_equal(tvecs, expected))
+
+	def test_feasible_candidates_match_single_tests(self):
+		state = grid_state(30, seed=2)
+		grid = util.build_grid(state)
+		backend = collision.NumpyBackend()
+		reach = 2*state.circumradius()
+		rng = np.random.RandomState(3)
+		cache = separationCache.SeparationCache()
+		cache.attach(state)
+		for i in range(0, 30, 3):
+			centroids = state.centroids[i] + rng.normal(scale=0.2, size=(8, 3))
+			candidates = centroids[:,None,:] + (state.verts[i]-state.centroids[i])
+			feasible, exact, skipped = batchedMoves.feasible_candidates(state, i, candidates, centroids, grid, backend, reach)
+			others = np.array([j for j in range(30) if j != i])
+			expected = [not backend.intersects_any(candidate, state.verts[others]) for candidate in candidates]
+			self.assertEqual(list(feasible), expected)
+			cached, exact, skipped = batchedMoves.feasible_candidates(state, i, candidates, centroids, grid, backend, reach, cache)
+			self.assertEqual(list(cached), expected)
+
+	def test_dense_packing_leaves_no_overlaps(self):
+		for variant in ('V2', 'V3'):
+			state = grid_state(30, seed=4)
+			state = packingEngine.pack(batchedMoves.BatchedMoves(variant, 6), 30, max_iters=10, state=state)
+			self.assertEqual(initialConfig.overlapping(state, collision.NumpyBackend()), [], variant)
+
+	def test_separation_cache_keeps_the_result(self):
+		for variant in ('V2', 'V3'):
+			plain = packingEngine.pack(batchedMoves.BatchedMoves(variant, 5), 24, stepscalereduction=0.5, rotreduction=0.5, max_iters=20, state=grid_state(24))
+			stats = packingStats.PackingStats()
+			cached = packingEngine.pack(batchedMoves.BatchedMoves(variant, 5), 24, stepscalereduction=0.5, rotreduction=0.5, max_iters=20, state=grid_state(24),
+										stats=stats, separation=separationCache.SeparationCache())
+			self.assertTrue(np.array_equal(cached.verts, plain.verts), variant)
+			self.assertGreater(stats.cached_pairs, 0)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+import benchmarks
+
+class CompareTest(unittest.TestCase):
+	def test_flags_metrics_that_got_worse(self):
+		baseline = {'a/density': 0.1, 'b/seconds_per_sweep': 1.0, 'c/pairs_per_second': 100.0}
+		results = {'a/density': 0.07, 'b/seconds_per_sweep': 1.5, 'c/pairs_per_second': 110.0}
+		regressions = benchmarks.compare(results, baseline, 0.2)
+		self.assertEqual([r.split(':')[0] for r in regressions], ['a/density', 'b/seconds_per_sweep'])
+
+	def test_tolerates_small_changes_and_missing_metrics(self):
+		baseline = {'a/density': 0.1}
+		results = {'a/density': 0.09, 'b/seconds_per_sweep': 9.0}
+		self.assertEqual(benchmarks.compare(results, baseline, 0.2), [])
+
+	def test_stored_baseline_is_portable(self):
+		import json
+		with open('benchmark_baseline.json') as f:
+			baseline = json.load(f)
+		self.assertTrue(baseline)
+		for key in baseline:
+			self.assertIn(key.split('/')[-1], benchmarks.PORTABLE)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,122 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import activeSet
+import batchedMoves
+import checkpoint
+import clusterMoves
+import initialConfig
+import packingEngine
+import parallelSweep
+import periodic
+import separationCache
+import util
+
+# A run interrupted by a checkpoint and resumed must end exactly where the
+# uninterrupted run does
+class ResumeTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.path = os.path.join(self.dir, 'run.npz')
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	# features maps keyword arguments of the packing functions to factories of the
+	# optional objects, since every run needs fresh ones
+	# dense runs start from a lattice and shrink their steps quickly, so that
+	# tetrahedra jam and converge within a few sweeps
+	# compact runs store their state in a memory-mapped file if statepath is given
+	def resume_matches(self, variant, make_schedule=lambda: None, stop=7, iterations=16, dense=False, compact=False, statepath=None, **features):
+		pack = {'V2': util.randomizedGuidedPackingV2, 'V3': util.randomizedGuidedPackingV3}[variant]
+		fresh = lambda: dict((name, make()) for name, make in features.items())
+		kwargs = dict(initstepscale=0.3)
+		if dense:
+			kwargs = dict(stepscalereduction=0.5, rotreduction=0.5, stepthreshold=1e-3, rotationthreshold=1.0)
+		def start():
+			np.random.seed(5)
+			if not dense:
+				return None
+			state = initialConfig.lattice_configuration(24, 0.2, compact=compact)
+			state.reset_schedule(0.3, 90.0)
+			return state
+		full = pack(12, max_iters=iterations, state=start(), schedule=make_schedule(), **dict(kwargs, **fresh()))
+
+		schedule = make_schedule()
+		optional = fresh()
+		first = pack(12, max_iters=stop, state=start(), schedule=schedule, **dict(kwargs, **optional))
+		checkpoint.save_checkpoint(self.path, first, {'variant': variant}, schedule, optional.get('activeset'))
+		np.random.seed(0)
+		state, params = checkpoint.load_checkpoint(self.path, statepath)
+		schedule = make_schedule()
+		if schedule is not None:
+			checkpoint.load_schedule(self.path, schedule)
+		optional = fresh()
+		if 'activeset' in optional:
+			checkpoint.load_activeset(self.path, optional['activeset'])
+		resumed = pack(12, max_iters=iterations, state=state, schedule=schedule, **dict(kwargs, **optional))
+
+		self.assertEqual(params, {'variant': variant})
+		self.assertEqual(resumed.iteration, full.iteration)
+		self.assertTrue(np.array_equal(resumed.verts, full.verts))
+		self.assertTrue(np.array_equal(resumed.scales, full.scales))
+		self.assertTrue(np.array_equal(resumed.rotranges, full.rotranges))
+
+	def test_geometric(self):
+		for variant in ('V2', 'V3'):
+			self.resume_matches(variant)
+
+	def test_adaptive(self):
+		for variant in ('V2', 'V3'):
+			self.resume_matches(variant, packingEngine.AdaptiveSchedule)
+
+	def test_active_set(self):
+		# tetrahedra converge after 16 sweeps and are woken up again later
+		self.resume_matches('V2', stop=16, iterations=24, dense=True, activeset=lambda: activeSet.ActiveSet(0.1))
+
+	def test_compact_state(self):
+		self.resume_matches('V3', dense=True, compact=True, activeset=lambda: activeSet.ActiveSet(0.1))
+		self.resume_matches('V2', dense=True, compact=True, statepath=os.path.join(self.dir, 'state.dat'))
+		with np.load(self.path) as data:
+			self.assertNotIn('verts', data.files)
+
+	def test_separation_cache(self):
+		self.resume_matches('V3', dense=True, separation=separationCache.SeparationCache)
+
+	def test_cluster_moves(self):
+		self.resume_matches('V3', dense=True, clusters=lambda: clusterMoves.ClusterMoves(0.1, 6, 3, jamscale=0.05))
+
+	def test_other_packing_loops(self):
+		runs = {'batched': lambda iterations, state: packingEngine.pack(batchedMoves.BatchedMoves('V3', 4), 12, initstepscale=0.3, max_iters=iterations, state=state),
+				'periodic': lambda iterations, state: packingEngine.pack(periodic.PeriodicMoves(0.05), 12, initstepscale=0.3, max_iters=iterations, state=state),
+				'parallel': lambda iterations, state: packingEngine.pack(parallelSweep.ParallelSweep('V2', 2, 3), 12, initstepscale=0.3, max_iters=iterations, state=state)}
+		for name, run in sorted(runs.items()):
+			np.random.seed(5)
+			full = run(16, None)
+			np.random.seed(5)
+			checkpoint.save_checkpoint(self.path, run(7, None))
+			np.random.seed(0)
+			state, params = checkpoint.load_checkpoint(self.path)
+			resumed = run(16, state)
+			self.assertEqual(resumed.iteration, full.iteration, name)
+			self.assertTrue(np.array_equal(resumed.verts, full.verts), name)
+			if name == 'periodic':
+				self.assertEqual(resumed.cell.length, full.cell.length)
+
+	def test_adaptive_caps_survive_resume(self):
+		schedule = packingEngine.AdaptiveSchedule()
+		np.random.seed(5)
+		state = util.randomizedGuidedPackingV2(12, initstepscale=0.3, max_iters=5, schedule=schedule)
+		checkpoint.save_checkpoint(self.path, state, None, schedule)
+		state, params = checkpoint.load_checkpoint(self.path)
+		restored = packingEngine.AdaptiveSchedule()
+		checkpoint.load_schedule(self.path, restored)
+		restored.attach(state)
+		self.assertEqual(restored.maxscale, 0.3)
+		self.assertTrue(np.array_equal(restored.translationRates, schedule.translationRates))
+		self.assertTrue(np.array_equal(restored.rotationRates, schedule.rotationRates))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+import numpy as np
+import clusterMoves
+import collision
+import initialConfig
+import packingEngine
+from test_activeSet import grid_state
+
+def dense_engine(clusters, iterations):
+	state = grid_state(24)
+	engine = packingEngine.PackingEngine('V3', stepscalereduction=0.5, rotreduction=0.5, stepthreshold=1e-3, rotationthreshold=1.0)
+	engine.start(state, clusters=clusters)
+	for snapshot in engine.run(iterations):
+		pass
+	return engine
+
+def distances(verts):
+	points = verts.reshape(-1, 3)
+	return np.linalg.norm(points[:,None]-points[None], axis=-1)
+
+class ClusterMovesTest(unittest.TestCase):
+	def setUp(self):
+		self.clusters = clusterMoves.ClusterMoves(0.1, 6, 3, jamscale=0.05)
+		self.engine = dense_engine(None, 12)
+		self.jammed = self.engine.state.scales < self.clusters.jamscale
+
+	def test_clusters_are_jammed_near_contacts(self):
+		state = self.engine.state
+		np.random.seed(1)
+		found = self.clusters.find_clusters(state, self.engine.grid, self.jammed)
+		self.assertTrue(found)
+		members = sum(found, [])
+		self.assertEqual(len(members), len(set(members)))
+		for cluster in found:
+			self.assertTrue(2 <= len(cluster) <= 6)
+			self.assertTrue(self.jammed[cluster].all())
+			# every member joined through a near contact with an earlier one
+			for k in range(1, len(cluster)):
+				bounds = collision.separation_bounds(state.verts[cluster[k]], state.verts[cluster[:k]])
+				self.assertLessEqual(min(bounds), self.clusters.gap)
+		np.random.seed(1)
+		self.assertEqual(self.clusters.find_clusters(state, self.engine.grid, self.jammed), found)
+
+	def test_moves_are_rigid_and_free_of_overlaps(self):
+		state = self.engine.state
+		np.random.seed(2)
+		moved = 0
+		for members in self.clusters.find_clusters(state, self.engine.grid, self.jammed):
+			before = distances(state.verts[members])
+			if self.clusters.move_cluster(self.engine, members):
+				moved += 1
+				self.assertTrue(np.allclose(distances(state.verts[members]), before, rtol=0, atol=1e-12))
+		self.assertTrue(moved)
+		self.assertEqual(self.clusters.accepted, moved)
+		self.assertEqual(initialConfig.overlapping(state, self.engine.backend), [])
+
+	def test_packing_with_cluster_phases(self):
+		engine = dense_engine(self.clusters, 16)
+		self.assertTrue(self.clusters.history)
+		self.assertEqual([h[0] for h in self.clusters.history][:5], [2, 5, 8, 11, 14])
+		self.assertEqual(initialConfig.overlapping(engine.state, engine.backend), [])
+
+if __name__ == '__main__':
+	unittest.main()
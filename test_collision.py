@@ -0,0 +1,95 @@
+import unittest
+from distutils.spawn import find_executable
+import itertools
+import numpy as np
+import collision
+import initialConfig
+
+UNIT = np.array([[0.0,0.0,0.0],[1.0,0.0,0.0],[0.0,1.0,0.0],[0.0,0.0,1.0]])
+# the point reflection of UNIT, filling x+y+z >= 2
+MIRROR = 1.0-UNIT
+
+EDGES = list(itertools.combinations(range(4), 2))
+
+# Independent reference: two tetrahedra are disjoint exactly when their vertices
+# project to disjoint ranges on a face normal of either or on the cross product of
+# an edge of each
+def separated(p, q):
+	axes = [np.cross(t[b]-t[a], t[c]-t[a]) for t in (p, q) for a, b, c in itertools.combinations(range(4), 3)]
+	axes += [np.cross(p[b]-p[a], q[d]-q[c]) for a, b in EDGES for c, d in EDGES]
+	return any(np.dot(p, axis).max() < np.dot(q, axis).min() or np.dot(q, axis).max() < np.dot(p, axis).min() for axis in axes)
+
+class OverlapTest(unittest.TestCase):
+	def assert_pair(self, p, q, expected):
+		self.assertEqual(collision.intersect_tetrahedra(p, q), expected)
+		self.assertEqual(collision.intersect_tetrahedra(q, p), expected)
+
+	def test_known_pairs(self):
+		self.assert_pair(UNIT, UNIT, True)
+		self.assert_pair(UNIT, UNIT+0.1, True)
+		self.assert_pair(UNIT, UNIT+[2.0,0.0,0.0], False)
+		# boxes overlap, but the face x+y+z=1 separates them
+		self.assert_pair(UNIT, MIRROR-0.3, False)
+		self.assert_pair(UNIT, MIRROR-0.4, True)
+		# one tetrahedron inside the other
+		self.assert_pair(UNIT, 0.1+0.2*UNIT, True)
+
+	def test_edges_crossing_without_vertices_inside(self):
+		p = np.array([[-1.0,0.0,-0.1],[1.0,0.0,-0.1],[0.0,0.0,1.0],[0.0,0.1,0.0]])
+		q = np.array([[0.0,-1.0,0.1],[0.0,1.0,0.1],[0.0,0.0,-1.0],[0.1,0.0,0.0]])
+		self.assertFalse(collision.vertex_overlaps(p, q[None])[0])
+		self.assert_pair(p, q, True)
+
+	def test_matches_the_separating_axis_theorem(self):
+		rng = np.random.RandomState(3)
+		reference = initialConfig.reference_tetrahedron()
+		orientations = initialConfig.random_orientations(1000, rng)
+		ps = np.matmul(reference, np.swapaxes(orientations[:500], 1, 2))
+		qs = np.matmul(reference, np.swapaxes(orientations[500:], 1, 2)) + rng.uniform(-1.2, 1.2, (500, 1, 3))
+		random = collision.random_pairs(500, spread=1.0, rng=rng)
+		for p, q in zip(np.concatenate([ps, random[0]]), np.concatenate([qs, random[1]])):
+			self.assertEqual(collision.intersect_tetrahedra(p, q), not separated(p, q))
+
+	def test_vertex_order_does_not_matter(self):
+		rng = np.random.RandomState(0)
+		ps, qs = collision.random_pairs(200, rng=rng)
+		bits = collision.intersect_pairs(ps, qs)
+		self.assertTrue(0 < bits.sum() < 200)
+		self.assertTrue(np.array_equal(collision.intersect_pairs(ps[:,::-1], qs[:,[2,0,3,1]]), bits))
+		self.assertTrue(np.array_equal(collision.intersect_pairs(qs, ps), bits))
+
+	def test_many_matches_pairs(self):
+		rng = np.random.RandomState(1)
+		ps, qs = collision.random_pairs(100, rng=rng)
+		expected = [collision.intersect_tetrahedra(ps[0], q) for q in qs]
+		self.assertEqual(list(collision.intersect_many(ps[0], qs)), expected)
+		self.assertEqual(list(collision.NumpyBackend().intersect(ps[0], qs)), expected)
+
+class FormatTest(unittest.TestCase):
+	def test_numbers_round_trip_exactly(self):
+		coordinates = np.random.RandomState(0).uniform(-1, 1, (3, 4, 3))
+		numbers = collision.format_numbers(coordinates)
+		self.assertTrue(numbers.startswith('[') and numbers.endswith(']'))
+		self.assertTrue(np.array_equal(np.array([float(x) for x in numbers[1:-1].split()]), coordinates.ravel()))
+
+@unittest.skipUnless(find_executable('clojure'), "needs a clojure executable on the PATH")
+class ClojureBackendTest(unittest.TestCase):
+	def setUp(self):
+		self.backend = collision.ClojureBackend(max_pending=2)
+		self.expected = collision.NumpyBackend()
+		self.ps, self.qs = collision.random_pairs(40, rng=np.random.RandomState(1))
+
+	def tearDown(self):
+		self.backend.close()
+
+	def test_batches_match_numpy(self):
+		self.assertTrue(np.array_equal(self.backend.intersect_pairs(self.ps, self.qs, chunk=7), self.expected.intersect_pairs(self.ps, self.qs)))
+		self.assertTrue(np.array_equal(self.backend.intersect(self.ps[0], self.qs), self.expected.intersect(self.ps[0], self.qs)))
+
+	def test_pipelined_replies_keep_their_order(self):
+		replies = [self.backend.submit(p, self.qs[:10]) for p in self.ps[:5]]
+		for p, reply in zip(self.ps[:5], replies):
+			self.assertTrue(np.array_equal(reply.result(), self.expected.intersect(p, self.qs[:10])))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,57 @@
+import os
+import shutil
+import signal
+import tempfile
+import time
+import unittest
+import numpy as np
+import collision
+
+class CollisionServerTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.path = os.path.join(self.dir, 'collision.sock')
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def test_answers_like_its_backend_and_cleans_up(self):
+		client = collision.ServerBackend(self.path, backend='numpy', timeout=30.0)
+		self.assertTrue(os.path.exists(self.path+'.lock'))
+		rng = np.random.RandomState(0)
+		ps, qs = collision.random_pairs(50, rng=rng)
+		expected = collision.NumpyBackend()
+		self.assertTrue(np.array_equal(client.intersect_pairs(ps, qs), expected.intersect_pairs(ps, qs)))
+		self.assertTrue(np.array_equal(client.intersect(ps[0], qs), expected.intersect(ps[0], qs)))
+		self.assertEqual(len(client.intersect(ps[0], np.zeros((0, 4, 3)))), 0)
+		# a second client shares the running server
+		other = collision.ServerBackend(self.path, backend='numpy')
+		self.assertEqual(other.intersects_any(ps[0], qs), bool(expected.intersect(ps[0], qs).any()))
+		other.close()
+		client.close()
+		sock = collision.connect_server(self.path)
+		self.assertIsNotNone(sock)
+		sock.close()
+		os.killpg(self.server_group(), signal.SIGTERM)
+		deadline = time.time()+10
+		while os.path.exists(self.path) and time.time() < deadline:
+			time.sleep(0.05)
+		self.assertFalse(os.path.exists(self.path))
+		self.assertFalse(os.path.exists(self.path+'.lock'))
+
+	# The spawned server leads its own session, find it by its socket argument
+	def server_group(self):
+		for pid in os.listdir('/proc'):
+			if not pid.isdigit():
+				continue
+			try:
+				with open(os.path.join('/proc', pid, 'cmdline')) as f:
+					args = f.read().split('\0')
+			except IOError:
+				continue
+			if self.path in args:
+				return int(pid)
+		self.fail("no collision server is running on {0}".format(self.path))
+
+if __name__ == '__main__':
+	unittest.main()
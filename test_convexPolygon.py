@@ -0,0 +1,22 @@
+import unittest
+import numpy as np
+from convexPolygon import Simplex, rotation_matrix
+
+class RotationTest(unittest.TestCase):
+	def test_small_angles_are_not_rounded(self):
+		matrix = rotation_matrix(1e-5, (0, 1))
+		self.assertAlmostEqual(matrix[1,0], np.sin(1e-5), places=15)
+		self.assertTrue(np.allclose(np.dot(matrix, matrix.T), np.eye(3), rtol=0, atol=1e-15))
+
+	def test_degrees_match_radians(self):
+		self.assertTrue(np.array_equal(rotation_matrix(33.3, (1, 2), 'deg'), rotation_matrix(np.radians(33.3), (1, 2))))
+
+	def test_simplex_rotates_about_its_centroid(self):
+		simplex = Simplex([[0.0,0.0,0.0],[1.0,0.0,0.0],[0.0,1.0,0.0],[0.0,0.0,1.0]])
+		centroid = simplex.c.copy()
+		simplex.Rotate(90, (0, 1), 'deg')
+		self.assertTrue(np.allclose(simplex.v.mean(axis=0), centroid))
+		self.assertTrue(np.allclose(simplex.v[1]-centroid, np.dot(rotation_matrix(90, (0, 1), 'deg'), [0.75,-0.25,-0.25])))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import numpy as np
+import collision
+import initialConfig
+import util
+from packingState import CompactPackingState
+
+class InitialConfigTest(unittest.TestCase):
+	def setUp(self):
+		self.backend = collision.make_backend('numpy')
+
+	def assert_no_overlaps(self, state, numtetras):
+		self.assertEqual(len(state), numtetras)
+		self.assertEqual(initialConfig.overlapping(state, self.backend), [])
+
+	def test_lattice_sites_are_face_centered_and_nearest_first(self):
+		side = 6
+		sites = initialConfig.lattice_sites(side, 40)
+		coords = np.array(np.unravel_index(sites, (side, side, side))).T
+		self.assertTrue((coords.sum(axis=1) % 2 == 0).all())
+		distances = ((2*coords-(side-1))**2).sum(axis=1)
+		self.assertTrue((np.diff(distances) >= 0).all())
+
+	def test_lattice_without_overlaps(self):
+		for fraction in (0.05, 0.15, 0.2):
+			np.random.seed(1)
+			self.assert_no_overlaps(initialConfig.lattice_configuration(60, fraction), 60)
+
+	def test_compact_lattice_without_overlaps(self):
+		np.random.seed(1)
+		self.assert_no_overlaps(initialConfig.lattice_configuration(60, 0.2, compact=True), 60)
+
+	def test_lattice_reports_overlaps(self):
+		np.random.seed(1)
+		with self.assertRaises(ValueError):
+			initialConfig.lattice_configuration(60, 0.3, maxrounds=0)
+
+	def test_rsa_without_overlaps(self):
+		for fraction in (0.1, 0.2):
+			np.random.seed(1)
+			self.assert_no_overlaps(initialConfig.rsa_configuration(60, fraction), 60)
+
+	def test_compact_rsa_without_overlaps(self):
+		np.random.seed(1)
+		state = initialConfig.rsa_configuration(60, 0.2, compact=True)
+		self.assertIsInstance(state, CompactPackingState)
+		self.assert_no_overlaps(state, 60)
+		self.assertTrue(np.allclose(state.com(), np.asarray(state.centroids, dtype=float).mean(axis=0)))
+
+	def test_compact_spread_matches_the_simplices(self):
+		np.random.seed(2)
+		tetralist = util.generate_tetrahedra(40)
+		np.random.seed(2)
+		state = initialConfig.initial_state(40, compact=True)
+		self.assertIsInstance(state, CompactPackingState)
+		# float32 keeps about 7 digits of coordinates up to 2*40 edge lengths
+		for tet, verts in zip(tetralist, state.verts):
+			self.assertTrue(np.allclose(verts, tet.v, rtol=0, atol=1e-4))
+
+	def test_rsa_reports_leftovers(self):
+		np.random.seed(1)
+		with self.assertRaises(ValueError):
+			initialConfig.rsa_configuration(60, 0.5, maxattempts=256, maxshells=0)
+
+if __name__ == '__main__':
+	unittest.main()
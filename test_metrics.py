@@ -0,0 +1,52 @@
+import itertools
+import unittest
+import numpy as np
+import metrics
+from convexPolygon import Simplex, rotation_matrix
+from test_packingState import random_state
+
+# corners of a unit cube turned 30 degrees about z and 20 about x, as 2 "tetrahedra"
+CUBE = np.array(list(itertools.product((0.0, 1.0), repeat=3)))
+CORNERS = np.dot(CUBE, np.dot(rotation_matrix(20, (1, 2), 'deg'), rotation_matrix(30, (0, 1), 'deg')).T)
+TURNED = [Simplex(v) for v in CORNERS.reshape(2, 4, 3)]
+
+class MetricsTest(unittest.TestCase):
+	def test_containers_of_a_turned_cube(self):
+		self.assertGreater(metrics.box_volume(TURNED), 1.5)
+		# near-minimal, never below the true minimum
+		self.assertTrue(1.0-1e-12 <= metrics.obb_volume(TURNED) < 1.01)
+		center, radius = metrics.bounding_sphere(CORNERS)
+		self.assertLess(radius, 1.01*np.sqrt(3)/2)
+		self.assertTrue((np.linalg.norm(CORNERS-center, axis=1) <= radius+1e-12).all())
+
+	@unittest.skipIf(metrics.ConvexHull is None, "the hull metric needs scipy")
+	def test_hull_of_a_turned_cube(self):
+		self.assertAlmostEqual(metrics.hull_volume(TURNED), 1.0)
+
+	def test_tracked_box_follows_moves(self):
+		state = random_state(40)
+		state.track_bounds()
+		rng = np.random.RandomState(4)
+		for i in rng.randint(0, 40, 200):
+			state.move(i, rng.normal(size=3), rotation_matrix(rng.uniform(360), (0, 2), 'deg'))
+			points = state.verts.reshape(-1, 3)
+			self.assertTrue(np.array_equal(state.bounds.lo, points.min(axis=0)))
+			self.assertTrue(np.array_equal(state.bounds.hi, points.max(axis=0)))
+		self.assertEqual(metrics.box_volume(state), np.prod(points.max(axis=0)-points.min(axis=0)))
+
+	def test_density_of_one_regular_tetrahedron(self):
+		regular = [Simplex([[1.0,1.0,1.0],[1.0,-1.0,-1.0],[-1.0,1.0,-1.0],[-1.0,-1.0,1.0]])]
+		self.assertAlmostEqual(metrics.tetra_volume(2*np.sqrt(2)), 8.0/3.0)
+		self.assertAlmostEqual(metrics.density(regular, 'box', 2*np.sqrt(2)), 1.0/3.0)
+
+	def test_monitor_stops_at_the_target(self):
+		state = random_state(10)
+		density = metrics.density(state)
+		monitor = metrics.DensityMonitor('box', target=density, every=2)
+		self.assertFalse(monitor(0, state))
+		self.assertTrue(monitor(1, state))
+		self.assertEqual(monitor.history, [(2, density)])
+		self.assertIsNotNone(state.bounds)
+
+if __name__ == '__main__':
+	unittest.main()
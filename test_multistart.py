@@ -0,0 +1,59 @@
+import functools
+import multiprocessing
+import unittest
+import numpy as np
+import activeSet
+import batchedMoves
+import initialConfig
+import multistart
+import packingEngine
+import packingStats
+import util
+
+KWARGS = dict(numtetras=6, max_iters=10)
+
+class RestartTest(unittest.TestCase):
+	def test_keeps_the_densest_seeded_run(self):
+		state, summaries = multistart.run_restarts(3, 2, 'V2', seed=5, checkpoint=0, **KWARGS)
+		self.assertEqual([s['seed'] for s in summaries], [5, 6, 7])
+		self.assertFalse(any(s['cancelled'] for s in summaries))
+		self.assertEqual(util.boxDensity(state), max(s['density'] for s in summaries))
+		# a restart is the same packing as a plain run with its seed
+		np.random.seed(6)
+		self.assertEqual(util.boxDensity(util.randomizedGuidedPackingV2(**KWARGS)), summaries[1]['density'])
+
+	def test_runs_strategies_with_features(self):
+		initial = functools.partial(initialConfig.initial_state, 12, 'lattice', 0.2, compact=True)
+		features = lambda: dict(stats=packingStats.PackingStats(), activeset=activeSet.ActiveSet(0.05))
+		state, summaries = multistart.run_restarts(2, 2, batchedMoves.BatchedMoves('V3', 3), seed=5, checkpoint=0, initial=initial, features=features(), numtetras=12, max_iters=5)
+		self.assertEqual([s['stats'].sweeps for s in summaries], [5, 5])
+		np.random.seed(6)
+		plain = initial()
+		plain.reset_schedule()
+		plainFeatures = features()
+		plain = packingEngine.pack(batchedMoves.BatchedMoves('V3', 3), 12, max_iters=5, state=plain, **plainFeatures)
+		self.assertEqual(util.boxDensity(plain), summaries[1]['density'])
+		self.assertEqual(summaries[1]['stats'].proposals, plainFeatures['stats'].proposals)
+
+	def test_cancels_runs_that_trail_the_best(self):
+		best = multiprocessing.Array('d', [0.0, 0.0])
+		state = util.randomizedGuidedPackingV2(**KWARGS)
+		density = util.boxDensity(state)
+		canceller = multistart.CheckpointCanceller(best, 5, 0.25)
+		self.assertFalse(canceller(3, state))
+		self.assertFalse(canceller(4, state))
+		self.assertEqual(best[0], density)
+		best[1] = 2*density
+		self.assertTrue(canceller(9, state))
+		self.assertTrue(canceller.cancelled)
+		self.assertEqual(canceller.iterations, 10)
+
+	def test_summary_marks_the_best_finished_run(self):
+		summaries = [{'seed': 0, 'density': 0.3, 'iterations': 5, 'time': 1.0, 'cancelled': True},
+					 {'seed': 1, 'density': 0.2, 'iterations': 9, 'time': 1.0, 'cancelled': False}]
+		lines = multistart.summary_table(summaries).split("\n")
+		self.assertTrue(lines[1].endswith("cancelled"))
+		self.assertTrue(lines[2].endswith("finished (best)"))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,97 @@
+import sys
+import unittest
+from StringIO import StringIO
+import numpy as np
+import collision
+import packingEngine
+import util
+from test_packingState import random_state
+
+class ClosingBackend(collision.NumpyBackend):
+	closed = False
+	def close(self):
+		self.closed = True
+
+def engine_run(strategy, numtetras, seed, max_iters, backend='numpy'):
+	np.random.seed(seed)
+	engine = packingEngine.PackingEngine(strategy, backend)
+	state = engine.start(numtetras=numtetras)
+	snapshots = [(s.iteration, s.converged) for s in engine.run(max_iters)]
+	engine.close()
+	return engine, state, snapshots
+
+class PackingEngineTest(unittest.TestCase):
+	def test_run_yields_a_snapshot_per_sweep(self):
+		engine, state, snapshots = engine_run('V2', 12, 1, 6)
+		self.assertEqual([s[0] for s in snapshots], range(1, 7))
+		self.assertEqual(state.iteration, 6)
+		self.assertEqual(snapshots[-1][1], int(state.converged.sum()))
+
+	def test_wrappers_match_engine_runs(self):
+		wrappers = {'V1': util.randomizedGuidedPacking, 'V2': util.randomizedGuidedPackingV2, 'V3': util.randomizedGuidedPackingV3}
+		for variant, wrapper in sorted(wrappers.items()):
+			engine, state, snapshots = engine_run(variant, 12, 2, 8)
+			np.random.seed(2)
+			packed = wrapper(12, max_iters=8)
+			self.assertTrue(np.array_equal(packed.verts, state.verts), variant)
+
+	def test_callback_stops_the_run(self):
+		np.random.seed(3)
+		seen = []
+		def callback(iteration, state):
+			seen.append(iteration)
+			return iteration == 2
+		state = packingEngine.pack('V3', 12, max_iters=10, callback=callback)
+		self.assertEqual(seen, [0, 1, 2])
+		self.assertEqual(state.iteration, 3)
+
+	def test_backend_objects_stay_open(self):
+		backend = ClosingBackend()
+		engine, state, snapshots = engine_run('V1', 8, 4, 2, backend)
+		self.assertIs(engine.backend, backend)
+		self.assertFalse(backend.closed)
+		engine, state, snapshots = engine_run('V1', 8, 4, 2)
+		self.assertTrue(engine.ownBackend)
+
+	def test_strategy_objects_and_unknown_names(self):
+		strategy = packingEngine.V3Moves()
+		self.assertIs(packingEngine.PackingEngine(strategy).strategy, strategy)
+		with self.assertRaises(AssertionError):
+			packingEngine.PackingEngine('V4')
+
+class ScheduleTest(unittest.TestCase):
+	def test_adaptive_values_follow_the_acceptance_rate(self):
+		state = random_state(3)
+		state.reset_schedule(0.3, 90.0)
+		schedule = packingEngine.AdaptiveSchedule(target=0.3, window=5)
+		schedule.attach(state)
+		for k in range(50):
+			schedule.translated(state, 0, False)
+			schedule.rotated(state, 1, True)
+		shrunk = state.scales[0]
+		self.assertLess(shrunk, 0.1)
+		# growth is capped at the values the run started with
+		self.assertEqual(state.rotranges[1], 90.0)
+		self.assertEqual(state.scales[2], 0.3)
+		for k in range(10):
+			schedule.translated(state, 0, True)
+		self.assertGreater(state.scales[0], shrunk)
+
+	def test_verbose_counters_without_the_density(self):
+		reports = []
+		for reportdensity in (True, False):
+			np.random.seed(1)
+			stdout = sys.stdout
+			sys.stdout = StringIO()
+			try:
+				packingEngine.pack('V2', 8, max_iters=10, verbose=True, reportdensity=reportdensity)
+				reports.append(sys.stdout.getvalue())
+			finally:
+				sys.stdout = stdout
+		self.assertIn("candidates pruned by grid", reports[0])
+		self.assertIn("density", reports[0])
+		self.assertIn("candidates pruned by grid", reports[1])
+		self.assertNotIn("density", reports[1])
+
+if __name__ == '__main__':
+	unittest.main()
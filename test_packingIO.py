@@ -0,0 +1,53 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import packingIO
+from packingState import CompactPackingState
+from test_packingState import random_state
+
+class PackingIOTest(unittest.TestCase):
+	def setUp(self):
+		self.dir = tempfile.mkdtemp()
+		self.state = random_state(7)
+
+	def tearDown(self):
+		shutil.rmtree(self.dir)
+
+	def test_formats_round_trip(self):
+		for format in packingIO.FORMATS:
+			path = os.path.join(self.dir, packingIO.OUTPUT_FILES[format])
+			packingIO.write_packing(path, self.state, format)
+			basis, vertices = packingIO.read_packing(path)
+			self.assertEqual(vertices.shape, (7, 4, 3))
+			self.assertTrue(np.array_equal(basis, self.state.basis))
+			# str keeps 12 significant digits in the text format
+			atol = 1e-10 if format == 'text' else 0
+			self.assertTrue(np.allclose(vertices, self.state.verts, rtol=0, atol=atol), format)
+
+	def test_binary_formats_are_written_in_chunks(self):
+		state = CompactPackingState(self.state.reference, self.state.centroids, self.state.orientations)
+		for write, path in ((packingIO.write_npy, 'chunks.npy'), (packingIO.write_npz, 'chunks.npz')):
+			path = os.path.join(self.dir, path)
+			write(path, state.basis, state.verts, chunk=3)
+			basis, vertices = packingIO.read_packing(path)
+			self.assertTrue(np.array_equal(basis, state.basis))
+			self.assertTrue(np.array_equal(vertices, state.vertices()))
+		# no temporary file is left behind
+		self.assertEqual(sorted(os.listdir(self.dir)), ['chunks.npy', 'chunks.npz'])
+
+	def test_trajectory_keeps_written_frames(self):
+		path = os.path.join(self.dir, 'trajectory.npy')
+		writer = packingIO.TrajectoryWriter(path, 5, 7, every=2)
+		for iteration in range(6):
+			self.state.move(0, np.ones(3))
+			writer(iteration, self.state)
+		writer.close()
+		frames = packingIO.read_trajectory(path)
+		self.assertEqual(len(frames), 3)
+		self.assertTrue(np.array_equal(frames[-1], self.state.verts))
+		self.assertTrue(np.allclose(frames[1][0]-frames[0][0], 2.0))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,171 @@
+import os
+import subprocess
+import sys
+import unittest
+import numpy as np
+import initialConfig
+import util
+from convexPolygon import rotation_matrix
+from packingState import PackingState, CompactPackingState
+
+def random_state(numtetras, cls=PackingState, seed=0):
+	rng = np.random.RandomState(seed)
+	centroids = rng.uniform(-3, 3, (numtetras, 3))
+	return cls(initialConfig.reference_tetrahedron(), centroids, initialConfig.random_orientations(numtetras, rng))
+
+# Packs numtetras tetrahedra of a compact start one sweep and writes them in the
+# binary formats, in a fresh interpreter; prints the growth of its peak resident
+# memory over a small warm-up run, per tetrahedron
+MEMORY_RUN = """
+import os, resource, shutil, sys, tempfile
+import numpy as np
+import initialConfig, packingEngine, packingIO
+def run(numtetras, init, directory):
+	np.random.seed(1)
+	state = initialConfig.initial_state(numtetras, init, 0.05, compact=True)
+	# every tetrahedron converges on its first visit, so the sweep is quick
+	state.reset_schedule(0.5, 1.0)
+	engine = packingEngine.PackingEngine('V2', stepthreshold=1.0, rotationthreshold=10.0)
+	engine.start(state)
+	engine.step()
+	engine.close()
+	for format in ('npy', 'npz'):
+		packingIO.write_packing(os.path.join(directory, packingIO.OUTPUT_FILES[format]), state, format)
+directory = tempfile.mkdtemp()
+try:
+	numtetras, init = int(sys.argv[1]), sys.argv[2]
+	run(100, init, directory)
+	base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	run(numtetras, init, directory)
+	print((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss-base)*1024.0/numtetras)
+finally:
+	shutil.rmtree(directory)
+"""
+
+class PackingStateTest(unittest.TestCase):
+	def test_from_simplices_keeps_the_vertices(self):
+		np.random.seed(0)
+		tetralist = util.generate_tetrahedra(20)
+		state = PackingState.from_simplices(tetralist)
+		self.assertEqual(len(state), 20)
+		for tet, view in zip(tetralist, state):
+			self.assertTrue(np.allclose(view.v, tet.v, rtol=0, atol=1e-12))
+			self.assertTrue(np.allclose(view.c, tet.c, rtol=0, atol=1e-12))
+
+	def test_views_move_the_state(self):
+		state = random_state(5)
+		before = state.verts[2].copy()
+		state[2].translate([1.0, 0.0, 0.0])
+		self.assertTrue(np.allclose(state.verts[2], before+[1.0, 0.0, 0.0]))
+		state[-1].Rotate(90, (0, 1), 'deg')
+		self.assertTrue(np.allclose(state.verts[4], state.vertices([4])[0]))
+		with self.assertRaises(IndexError):
+			state[5]
+
+	def test_to_simplices_copies(self):
+		state = random_state(5)
+		tetralist = state.to_simplices()
+		state.translate(0, np.ones(3))
+		self.assertFalse(np.allclose(tetralist[0].v, state.verts[0]))
+		self.assertTrue(np.allclose(tetralist[1].v, state.verts[1]))
+
+	def test_running_centre_of_mass(self):
+		state = random_state(30)
+		state.resum_interval = 1000
+		rng = np.random.RandomState(1)
+		for i in rng.randint(0, 30, 500):
+			state.translate(i, rng.normal(size=3))
+		self.assertEqual(state.updates_since_resum, 500)
+		self.assertTrue(np.allclose(state.com(), state.centroids.mean(axis=0), rtol=0, atol=1e-12))
+
+	def test_resum_after_interval(self):
+		state = random_state(10)
+		state.resum_interval = 7
+		for i in range(20):
+			state.translate(i % 10, np.full(3, 0.1))
+		self.assertEqual(state.updates_since_resum, 6)
+		self.assertTrue(np.allclose(state.com(), state.centroids.mean(axis=0), rtol=0, atol=1e-13))
+
+	def test_rotations_keep_the_shape(self):
+		state = random_state(4)
+		state.resum_interval = 10**6
+		edges = np.linalg.norm(state.reference[:,None]-state.reference[None], axis=-1)
+		rng = np.random.RandomState(2)
+		for angles in rng.uniform(0, 360, (20000, 3)):
+			rotation = np.eye(3)
+			for angle, plane in zip(angles, ((0,1), (0,2), (1,2))):
+				rotation = np.dot(rotation_matrix(angle, plane, 'deg'), rotation)
+			state.move(0, None, rotation)
+		state.resum()
+		self.assertTrue(np.allclose(np.dot(state.orientations[0], state.orientations[0].T), np.eye(3), rtol=0, atol=1e-14))
+		verts = state.verts[0]
+		self.assertTrue(np.allclose(np.linalg.norm(verts[:,None]-verts[None], axis=-1), edges, rtol=0, atol=1e-12))
+		self.assertTrue(np.allclose(verts.mean(axis=0), state.centroids[0], rtol=0, atol=1e-12))
+
+	def test_rotate_about_an_anchor(self):
+		state = random_state(2)
+		anchor = np.zeros(3)
+		rotation = np.dot(rotation_matrix(40, (1, 2), 'deg'), rotation_matrix(70, (0, 1), 'deg'))
+		expected = np.dot(state.verts[1]-anchor, rotation.T)+anchor
+		state.rotate(1, rotation, anchor)
+		self.assertTrue(np.allclose(state.verts[1], expected, rtol=0, atol=1e-12))
+		self.assertTrue(np.allclose(state.centroids[1], expected.mean(axis=0), rtol=0, atol=1e-12))
+
+class CompactPackingStateTest(unittest.TestCase):
+	def assert_bounds(self, state, atol):
+		points = np.asarray(state.vertices()).reshape(-1, 3)
+		self.assertTrue(np.allclose(state.bounds.lo, points.min(axis=0), atol=atol))
+		self.assertTrue(np.allclose(state.bounds.hi, points.max(axis=0), atol=atol))
+
+	def test_tracked_bounds_follow_moves(self):
+		state = random_state(200, CompactPackingState)
+		state.track_bounds()
+		self.assertEqual(state.bounds.lows.dtype, np.float32)
+		self.assert_bounds(state, 1e-5)
+		rng = np.random.RandomState(1)
+		for i in rng.randint(0, 200, 300):
+			# pull the tetrahedra in, so faces of the box move inwards too
+			state.move(i, -0.5*np.asarray(state.centroids[i], dtype=float))
+		self.assert_bounds(state, 1e-5)
+
+	def test_matches_the_full_state(self):
+		full = random_state(50)
+		compact = random_state(50, CompactPackingState)
+		self.assertEqual(compact.centroids.dtype, np.float32)
+		rng = np.random.RandomState(2)
+		for i in rng.randint(0, 50, 200):
+			tvec = rng.normal(scale=0.1, size=3)
+			rotation = initialConfig.random_orientations(1, rng)[0]
+			full.move(i, tvec, rotation)
+			compact.move(i, tvec, rotation)
+		self.assertTrue(np.allclose(compact.vertices(), full.verts, rtol=0, atol=1e-5))
+		self.assertTrue(np.allclose(compact.com(), full.com(), rtol=0, atol=1e-5))
+
+	# a few dozen bytes per tetrahedron: the 37 byte records, the grid's links and
+	# cells, and buffers of a few chunks
+	@unittest.skipUnless(sys.platform.startswith('linux'), "ru_maxrss is in kilobytes on Linux")
+	def test_peak_memory_per_tetrahedron(self):
+		for init in ('lattice', 'spread'):
+			output = subprocess.check_output([sys.executable, '-c', MEMORY_RUN, '100000', init], cwd=os.path.dirname(os.path.abspath(__file__)))
+			self.assertLess(float(output), 96, init)
+
+	def test_candidates_match_the_stored_poses(self):
+		state = random_state(50, CompactPackingState)
+		rng = np.random.RandomState(2)
+		for i in range(50):
+			tvec = state.stored_translation(i, rng.normal(scale=0.1, size=3))
+			rotation = initialConfig.random_orientations(1, rng)[0]
+			centroid = state.centroids[i] + tvec
+			candidate = state.pose_vertices(centroid, state.stored_orientations(np.dot(rotation, state.orientations[i])))
+			state.move(i, tvec, rotation)
+			self.assertTrue(np.array_equal(np.asarray(state.centroids[i], dtype=float), centroid))
+			self.assertTrue(np.allclose(state.verts[i], candidate, rtol=0, atol=1e-14))
+
+	def test_full_state_stores_poses_as_given(self):
+		state = random_state(5)
+		tvec = np.array([0.1, 0.2, 0.3])
+		self.assertIs(state.stored_translation(0, tvec), tvec)
+		self.assertIs(state.stored_orientations(state.orientations), state.orientations)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,38 @@
+import json
+import unittest
+from StringIO import StringIO
+import numpy as np
+import packingStats
+import util
+
+class PackingStatsTest(unittest.TestCase):
+	def test_counts_every_proposal_without_changing_the_run(self):
+		stream = StringIO()
+		stats = packingStats.PackingStats(4, stream)
+		np.random.seed(3)
+		state = util.randomizedGuidedPackingV2(8, max_iters=6, stats=stats)
+		np.random.seed(3)
+		plain = util.randomizedGuidedPackingV2(8, max_iters=6)
+		self.assertTrue(np.array_equal(state.verts, plain.verts))
+
+		self.assertEqual(stats.sweeps, 6)
+		self.assertEqual(stats.proposals, 48)
+		self.assertEqual(stats.sampled, 12)
+		record = stats.as_dict()
+		self.assertEqual(record['translations_accepted']+record['translations_rejected'], 48)
+		self.assertEqual(record['rotations_accepted']+record['rotations_rejected'], 48)
+		lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+		self.assertEqual([line['iteration'] for line in lines], range(1, 7))
+		self.assertEqual(lines[-1]['proposals'], 48)
+		self.assertIn("proposals: 48", stats.summary())
+
+	def test_sampled_times_are_scaled_up(self):
+		stats = packingStats.PackingStats(2)
+		for k in range(10):
+			if stats.sample():
+				stats.add_time('collision', 1.0)
+		self.assertEqual(stats.estimated_time('collision'), 10.0)
+		self.assertEqual(stats.estimated_time('update'), 0.0)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import numpy as np
+import collision
+import activeSet
+import clusterMoves
+import initialConfig
+import packingEngine
+import packingStats
+import parallelSweep
+import periodic
+from test_activeSet import grid_state
+
+class ParallelSweepTest(unittest.TestCase):
+	def run_with(self, workers, variant='V2', maxstep=None, state=None, **features):
+		if state is None:
+			state = grid_state(40, seed=2)
+		return packingEngine.pack(parallelSweep.ParallelSweep(variant, workers, seed=7, maxstep=maxstep), 40, max_iters=6, state=state, **features)
+
+	def test_independent_of_worker_count(self):
+		for variant, maxstep in (('V2', None), ('V3', 0.05)):
+			serial = self.run_with(1, variant, maxstep)
+			self.assertEqual(initialConfig.overlapping(serial, collision.NumpyBackend()), [])
+			for workers in (2, 3):
+				self.assertTrue(np.array_equal(self.run_with(workers, variant, maxstep).verts, serial.verts), (variant, workers))
+
+	def test_features_independent_of_worker_count(self):
+		features = lambda: dict(stats=packingStats.PackingStats(4), activeset=activeSet.ActiveSet(0.05), schedule=packingEngine.AdaptiveSchedule(),
+								clusters=clusterMoves.ClusterMoves(0.1, 6, 3, jamscale=0.05))
+		serialFeatures = features()
+		serial = self.run_with(1, 'V3', 0.05, **serialFeatures)
+		self.assertEqual(initialConfig.overlapping(serial, collision.NumpyBackend()), [])
+		self.assertGreater(serialFeatures['stats'].translations_accepted, 0)
+		parallelFeatures = features()
+		self.assertTrue(np.array_equal(self.run_with(2, 'V3', 0.05, **parallelFeatures).verts, serial.verts))
+		self.assertEqual(parallelFeatures['stats'].proposals, serialFeatures['stats'].proposals)
+
+	def test_compact_and_periodic_states(self):
+		compact = lambda: initialConfig.initial_state(40, 'lattice', 0.3, rng=np.random.RandomState(2), compact=True)
+		serial = self.run_with(1, 'V2', 0.05, compact())
+		self.assertEqual(initialConfig.overlapping(serial, collision.NumpyBackend()), [])
+		self.assertTrue(np.array_equal(self.run_with(2, 'V2', 0.05, compact()).verts, serial.verts))
+		runs = []
+		for workers in (1, 2):
+			np.random.seed(3)
+			state = periodic.periodic_configuration(40, 0.05)
+			strategy = parallelSweep.ParallelSweep(periodic.PeriodicMoves(0.05), workers, seed=7, maxstep=0.05)
+			runs.append(packingEngine.pack(strategy, 40, initstepscale=0.05, max_iters=6, state=state))
+		self.assertTrue(np.array_equal(runs[1].verts, runs[0].verts))
+		self.assertGreater(runs[0].cell.length, 4.0)
+		backend = collision.NumpyBackend()
+		reach = periodic.interaction_range(runs[0])
+		self.assertFalse(any(periodic.collides_periodic(runs[0], i, runs[0].verts[i], reach, backend) for i in range(40)))
+
+	def test_deferred_moves_are_visited_on_the_packing(self):
+		stats = packingStats.PackingStats()
+		state = self.run_with(1, 'V2', 1e-9, stats=stats)
+		self.assertEqual(initialConfig.overlapping(state, collision.NumpyBackend()), [])
+		self.assertEqual(stats.deferred, 6*40)
+		self.assertEqual(stats.translations_accepted+stats.translations_rejected, stats.deferred)
+		self.assertTrue(np.array_equal(self.run_with(2, 'V2', 1e-9).verts, state.verts))
+
+	def test_cell_generators_depend_on_every_key(self):
+		draws = set(parallelSweep.cell_rng(*key).uniform() for key in ((7, 0, 0, (5, 1, 2)), (8, 0, 0, (5, 1, 2)), (7, 1, 0, (5, 1, 2)), (7, 0, 1, (5, 1, 2)), (7, 0, 0, (5, 1, 3))))
+		self.assertEqual(len(draws), 5)
+		self.assertEqual(parallelSweep.cell_rng(7, 0, 0, (5, 1, 2)).uniform(), parallelSweep.cell_rng(7, 0, 0, (5, 1, 2)).uniform())
+
+if __name__ == '__main__':
+	unittest.main()
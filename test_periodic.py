@@ -0,0 +1,85 @@
+import unittest
+import numpy as np
+import collision
+import activeSet
+import initialConfig
+import packingEngine
+import packingStats
+import periodic
+import separationCache
+from packingState import PackingState, CompactPackingState
+
+class PeriodicTest(unittest.TestCase):
+	def test_cell_geometry(self):
+		cell = periodic.PeriodicCell(4.0)
+		self.assertTrue(np.allclose(cell.wrap(np.array([[-0.5, 4.5, 2.0]])), [[3.5, 0.5, 2.0]]))
+		self.assertTrue(np.allclose(cell.minimum_image(np.array([[3.0, -3.0, 1.0]])), [[-1.0, 1.0, 1.0]]))
+		indices, translations = cell.images(np.array([0.2, 2.0, 2.0]), np.array([[3.9, 2.0, 2.0], [2.0, 2.0, 2.0]]), 1.0)
+		self.assertEqual(list(indices), [0])
+		self.assertTrue(np.allclose(translations, [[-4.0, 0.0, 0.0]]))
+
+	def test_overlaps_across_the_boundary(self):
+		reference = initialConfig.reference_tetrahedron()
+		state = PackingState(reference, [[0.1, 2.0, 2.0], [3.95, 2.0, 2.0]], [np.eye(3), np.eye(3)])
+		state.cell = periodic.PeriodicCell(4.0)
+		backend = collision.NumpyBackend()
+		reach = periodic.interaction_range(state)
+		self.assertTrue(periodic.collides_periodic(state, 0, state.verts[0], reach, backend))
+		state.move(1, np.array([-1.9, 0.0, 0.0]))
+		self.assertFalse(periodic.collides_periodic(state, 0, state.verts[0], reach, backend))
+
+	def test_compression_leaves_no_overlaps(self):
+		np.random.seed(4)
+		state = packingEngine.pack(periodic.PeriodicMoves(0.05), 20, initstepscale=0.3, max_iters=30)
+		self.assertGreater(periodic.periodic_density(state), 0.05)
+		self.assertNoOverlaps(state)
+
+	def test_compression_check_matches_a_full_scan(self):
+		np.random.seed(4)
+		state = packingEngine.pack(periodic.PeriodicMoves(0.05), 20, initstepscale=0.3, max_iters=30)
+		backend = collision.NumpyBackend()
+		reach = periodic.interaction_range(state)
+		grid = periodic.PeriodicGrid(state.centroids, reach, state.cell.length)
+		for shrink in (0.2, 0.05, 0.01, 0.001):
+			state.cell.shrink = shrink
+			length = state.cell.length
+			centroids = state.centroids.copy()
+			# the full scan of every tetrahedron against all others
+			state.cell.length *= 1-shrink
+			state.centroids[:] = centroids*(1-shrink)
+			state.resum()
+			fits = state.cell.length >= reach and not any(periodic.collides_periodic(state, i, state.verts[i], reach, backend) for i in range(len(state)))
+			state.cell.length = length
+			state.centroids[:] = centroids
+			state.resum()
+			self.assertEqual(periodic.try_shrink(state, reach, backend, grid), fits)
+			self.assertNoOverlaps(state)
+			self.assertEqual(grid.length, state.cell.length)
+
+	def assertNoOverlaps(self, state):
+		backend = collision.NumpyBackend()
+		reach = periodic.interaction_range(state)
+		self.assertFalse(any(periodic.collides_periodic(state, i, state.verts[i], reach, backend) for i in range(len(state))))
+
+	def test_features(self):
+		def run(**features):
+			np.random.seed(4)
+			return packingEngine.pack(periodic.PeriodicMoves(0.05), 20, initstepscale=0.3, stepscalereduction=0.5, rotreduction=0.5, max_iters=30, **features)
+		plain = run()
+		stats = packingStats.PackingStats()
+		cached = run(stats=stats, separation=separationCache.SeparationCache())
+		self.assertTrue(np.array_equal(cached.verts, plain.verts))
+		self.assertEqual(cached.cell.length, plain.cell.length)
+		self.assertGreater(stats.cached_pairs, 0)
+		self.assertNoOverlaps(run(activeset=activeSet.ActiveSet(0.05), schedule=packingEngine.AdaptiveSchedule()))
+
+	def test_compact_state(self):
+		np.random.seed(4)
+		state = periodic.periodic_configuration(20, 0.05, compact=True)
+		self.assertIsInstance(state, CompactPackingState)
+		state = packingEngine.pack(periodic.PeriodicMoves(0.05), 20, initstepscale=0.3, max_iters=30, state=state)
+		self.assertGreater(periodic.periodic_density(state), 0.05)
+		self.assertNoOverlaps(state)
+
+if __name__ == '__main__':
+	unittest.main()
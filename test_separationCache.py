@@ -0,0 +1,70 @@
+import unittest
+import numpy as np
+import collision
+import initialConfig
+import packingStats
+import separationCache
+import util
+from test_activeSet import grid_state
+
+class SeparationBoundsTest(unittest.TestCase):
+	def setUp(self):
+		self.ps, self.qs = collision.random_pairs(400, spread=1.0, rng=np.random.RandomState(0))
+		self.overlapping = collision.intersect_pairs(self.ps, self.qs)
+
+	def test_bounds_are_conservative(self):
+		rng = np.random.RandomState(1)
+		bounds = np.array([collision.separation_bounds(p, q[None])[0] for p, q in zip(self.ps, self.qs)])
+		self.assertTrue((bounds >= 0).all())
+		self.assertFalse(self.overlapping[bounds > 0].any())
+		self.assertGreater((bounds > 0).sum(), 50)
+		# no shift shorter than the bound can make the pair touch, least of all
+		# one straight towards the other tetrahedron
+		for p, q, bound in zip(self.ps, self.qs, bounds):
+			if bound <= 0:
+				continue
+			towards = p.mean(axis=0)-q.mean(axis=0)
+			for direction in [towards] + list(rng.normal(size=(4, 3))):
+				shift = 0.999*bound*direction/np.linalg.norm(direction)
+				self.assertFalse(collision.intersect_tetrahedra(p, q+shift))
+
+	def test_vertex_overlaps_prove_overlaps(self):
+		inside = np.array([collision.vertex_overlaps(p, q[None])[0] for p, q in zip(self.ps, self.qs)])
+		self.assertTrue(inside.any())
+		self.assertTrue(self.overlapping[inside].all())
+
+class SeparationCacheTest(unittest.TestCase):
+	def dense_run(self, separation=None):
+		state = grid_state(24)
+		return util.randomizedGuidedPackingV3(24, max_iters=16, state=state, separation=separation, stepscalereduction=0.5, rotreduction=0.5)
+
+	def test_same_run_with_fewer_exact_tests(self):
+		cache = separationCache.SeparationCache()
+		state = self.dense_run(cache)
+		self.assertGreater(cache.skipped, 0)
+		self.assertTrue(np.array_equal(state.verts, self.dense_run().verts))
+
+	def test_stats_count_the_skipped_pairs(self):
+		cache = separationCache.SeparationCache()
+		stats = packingStats.PackingStats()
+		state = grid_state(24)
+		util.randomizedGuidedPackingV3(24, max_iters=16, state=state, separation=cache, stats=stats, stepscalereduction=0.5, rotreduction=0.5)
+		self.assertGreater(cache.skipped, 0)
+		self.assertEqual(stats.cached_pairs, cache.skipped)
+
+	def test_gap_shrinks_with_travel(self):
+		state = initialConfig.lattice_configuration(2, 0.01)
+		cache = separationCache.SeparationCache()
+		cache.attach(state)
+		collides, exact, skipped = cache.collides(0, state.verts[0], [1], collision.NumpyBackend())
+		self.assertFalse(collides)
+		gap = cache.remaining(0, 1)
+		self.assertGreater(gap, 0)
+		self.assertEqual(cache.remaining(1, 0), gap)
+		old = state.verts[1].copy()
+		state.move(1, np.array([0.1, 0.0, 0.0]))
+		cache.moved(1, old)
+		self.assertAlmostEqual(cache.remaining(0, 1), gap-0.1)
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import numpy as np
+from spatialGrid import SpatialGrid, CompactGrid, PeriodicGrid
+
+class SpatialGridTest(unittest.TestCase):
+	def setUp(self):
+		rng = np.random.RandomState(3)
+		self.rng = rng
+		# float32 values, so both grids see exactly the same points
+		self.centroids = rng.uniform(-4, 4, (300, 3)).astype(np.float32).astype(float)
+
+	def assert_same_neighbours(self, grid, compact, points):
+		for c in points:
+			self.assertEqual(sorted(grid.neighbours(c, count=False)), sorted(compact.neighbours(c, count=False)))
+
+	def test_neighbours_cover_the_interaction_range(self):
+		grid = SpatialGrid(self.centroids, 1.0)
+		for i in range(0, 300, 7):
+			found = set(grid.neighbours(self.centroids[i], i))
+			close = np.flatnonzero(np.linalg.norm(self.centroids-self.centroids[i], axis=1) <= 1.0)
+			self.assertTrue(set(close) - set([i]) <= found)
+			self.assertNotIn(i, found)
+
+	def test_nearest_matches_a_full_scan(self):
+		grid = SpatialGrid(self.centroids, 1.0)
+		for i in range(0, 300, 11):
+			dists = np.linalg.norm(self.centroids-self.centroids[i], axis=1)
+			dists[i] = np.inf
+			self.assertEqual(grid.nearest(self.centroids[i], i), np.argmin(dists))
+
+	def test_end_sweep_counts_pruned_candidates(self):
+		grid = SpatialGrid(self.centroids, 1.0)
+		found = grid.neighbours(self.centroids[0], 0)
+		self.assertEqual(grid.end_sweep(), 299-len(found))
+		self.assertEqual(grid.end_sweep(), 0)
+		self.assertEqual(grid.pruned_history, [299-len(found), 0])
+
+	def test_compact_grid_matches_after_moves(self):
+		grid = SpatialGrid(self.centroids, 1.0)
+		# built from chunks of 64 tetrahedra
+		compact = CompactGrid(self.centroids.astype(np.float32), 1.0, chunk=64)
+		self.assert_same_neighbours(grid, compact, self.centroids[::5])
+		self.assertEqual(grid.occupied_cells(), compact.occupied_cells())
+		for i in self.rng.randint(0, 300, 200):
+			# far enough to leave the dense box now and then
+			c = (self.centroids[i] + self.rng.uniform(-3, 3, 3)).astype(np.float32)
+			grid.move(i, c)
+			compact.move(i, c)
+		self.assert_same_neighbours(grid, compact, self.rng.uniform(-8, 8, (60, 3)))
+		self.assertEqual(grid.occupied_cells(), compact.occupied_cells())
+
+	def test_compact_grid_matches_after_adds(self):
+		grid = SpatialGrid(self.centroids, 1.0)
+		centroids = self.centroids.astype(np.float32)
+		compact = CompactGrid(centroids, 1.0)
+		for c in self.rng.uniform(-6, 6, (100, 3)).astype(np.float32):
+			self.assertEqual(grid.add(c), compact.add(c))
+		self.assertEqual(len(compact), 400)
+		self.assertEqual(len(centroids), 300)
+		compact.move(350, np.zeros(3, dtype=np.float32))
+		grid.move(350, np.zeros(3))
+		self.assert_same_neighbours(grid, compact, self.rng.uniform(-6, 6, (60, 3)))
+		self.assertEqual(grid.occupied_cells(), compact.occupied_cells())
+
+	def test_compact_grid_matches_in_a_sparse_cloud(self):
+		# a cloud like the spread start, with every cell in a shared spill bucket
+		centroids = self.rng.uniform(0, 60, (6000, 3)).astype(np.float32)
+		grid = SpatialGrid(centroids, 1.0)
+		compact = CompactGrid(centroids, 1.0, chunk=1000)
+		self.assertEqual(compact.boxsize, 0)
+		self.assertEqual(grid.occupied_cells(), compact.occupied_cells())
+		self.assert_same_neighbours(grid, compact, centroids[::97])
+		for i in self.rng.randint(0, 6000, 500):
+			c = (centroids[i] + self.rng.uniform(-2, 2, 3)).astype(np.float32)
+			grid.move(i, c)
+			compact.move(i, c)
+		self.assert_same_neighbours(grid, compact, self.rng.uniform(0, 60, (60, 3)))
+		self.assertEqual(grid.occupied_cells(), compact.occupied_cells())
+
+	def test_compact_grid_fills_a_reserved_buffer(self):
+		grid = SpatialGrid(np.zeros((0, 3)), 1.0)
+		centroids = np.zeros((120, 3), dtype=np.float32)
+		compact = CompactGrid.reserve(centroids, 1.0, -np.ones(3), np.ones(3))
+		for c in self.rng.uniform(-3, 3, (120, 3)).astype(np.float32):
+			self.assertEqual(grid.add(c), compact.add(c))
+		self.assertIs(compact.positions.base, centroids)
+		self.assertTrue(np.array_equal(centroids, grid.positions))
+		self.assert_same_neighbours(grid, compact, self.rng.uniform(-4, 4, (60, 3)))
+		self.assertEqual(grid.occupied_cells(), compact.occupied_cells())
+
+	def test_periodic_grid_covers_the_nearest_images(self):
+		for length in (8.0, 2.5, 1.5):
+			points = (self.centroids+4) % length
+			grid = PeriodicGrid(points, 1.0, length)
+			d = points[:,None,:]-points[None]
+			d = np.linalg.norm(d-length*np.round(d/length), axis=2)
+			for i in range(0, 300, 7):
+				found = grid.neighbours(points[i], i)
+				self.assertEqual(len(found), len(set(found)))
+				self.assertTrue(set(np.flatnonzero(d[i] <= 1.0)) - set([i]) <= set(found))
+				self.assertNotIn(i, found)
+				np.testing.assert_allclose(grid.distances(points[i], found), d[i][found])
+
+	def test_periodic_grid_follows_a_rescale(self):
+		points = (self.centroids+4) % 8.0
+		grid = PeriodicGrid(points, 1.0, 8.0)
+		for length in (7.0, 4.5, 2.0, 8.0):
+			scaled = points*length/8.0
+			grid.rescale(scaled, length)
+			rebuilt = PeriodicGrid(scaled, 1.0, length)
+			self.assertEqual(grid.ncells, rebuilt.ncells)
+			for i in range(0, 300, 13):
+				self.assertEqual(sorted(grid.neighbours(scaled[i], i)), sorted(rebuilt.neighbours(scaled[i], i)))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import sweep
+import util
+
+class SweepTest(unittest.TestCase):
+	def setUp(self):
+		self.cache = os.path.join(tempfile.mkdtemp(), 'cache')
+		self.values = dict((name, default) for name, _, _, _, default, _ in sweep.PARAMETERS)
+		self.values['numtetras'] = [4, 5]
+		self.values['bias'] = [0, 1]
+
+	def tearDown(self):
+		shutil.rmtree(os.path.dirname(self.cache))
+
+	def test_runs_are_cached_and_match_plain_runs(self):
+		points = sweep.grid_points(self.values)
+		self.assertEqual(len(points), 4)
+		keys, cached = sweep.run_sweep(points, [0, 1], 1.0, 5, self.cache, workers=2)
+		self.assertEqual((len(set(keys)), cached), (8, 0))
+		keys, cached = sweep.run_sweep(points[:2], [1, 2], 1.0, 5, self.cache)
+		self.assertEqual(cached, 2)
+		self.assertEqual(len(os.listdir(self.cache)), 20)
+
+		point = points[0]
+		result = sweep.load_result(self.cache, sweep.cache_key(point, 1, 1.0, 5))
+		np.random.seed(1)
+		kwargs = dict((name, point[name]) for name in point if name not in ('numtetras', 'bias'))
+		plain = (util.randomizedGuidedPackingV3 if point['bias'] else util.randomizedGuidedPackingV2)(point['numtetras'], max_iters=5, **kwargs)
+		self.assertEqual(result['density'], util.boxDensity(plain))
+		self.assertIn(str(result['density']), sweep.summary_table([result]))
+
+	def test_keys_depend_on_every_input(self):
+		point = sweep.grid_points(self.values)[0]
+		keys = set([sweep.cache_key(point, 0, 1.0, 5), sweep.cache_key(point, 1, 1.0, 5),
+					sweep.cache_key(point, 0, 2.0, 5), sweep.cache_key(point, 0, 1.0, 6),
+					sweep.cache_key(dict(point, initstepscale=0.5), 0, 1.0, 5)])
+		self.assertEqual(len(keys), 5)
+		self.assertEqual(sweep.cache_key(dict(point), 0, 1.0, 5), sweep.cache_key(point, 0, 1.0, 5))
+
+	def test_random_points_stay_in_range(self):
+		self.values['initstepscale'] = [0.2, 0.8]
+		for point in sweep.random_points(self.values, 20, np.random.RandomState(0)):
+			self.assertTrue(0.2 <= point['initstepscale'] <= 0.8)
+			self.assertIn(point['numtetras'], (4, 5))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,66 @@
+import subprocess
+import sys
+import unittest
+import numpy as np
+import initialConfig
+import metrics
+import util
+
+try:
+	import plotly
+except ImportError:
+	plotly = None
+
+class DetailTest(unittest.TestCase):
+	def setUp(self):
+		np.random.seed(1)
+		self.verts = np.asarray(initialConfig.lattice_configuration(200, 0.1).verts)
+
+	def test_all_and_sample(self):
+		self.assertTrue(np.array_equal(util.detail_indices(self.verts), np.arange(200)))
+		shown = util.detail_indices(self.verts, 'sample', 50, np.random.RandomState(2))
+		self.assertEqual(len(set(shown)), 50)
+		self.assertTrue((np.diff(shown) > 0).all())
+		self.assertEqual(len(util.detail_indices(self.verts, 'sample', 500)), 200)
+
+	def test_hull_keeps_the_outer_layer(self):
+		centroids = self.verts.mean(axis=1)
+		radius = np.linalg.norm(centroids-centroids.mean(axis=0), axis=1)
+		hull = util.detail_indices(self.verts, 'hull')
+		self.assertIn(np.argmax(radius), hull)
+		self.assertNotIn(np.argmin(radius), hull)
+		self.assertLess(len(hull), 200)
+
+	def test_hull_without_scipy(self):
+		centroids = self.verts.mean(axis=1)
+		radius = np.linalg.norm(centroids-centroids.mean(axis=0), axis=1)
+		hull, metrics.ConvexHull = metrics.ConvexHull, None
+		try:
+			shell = util.detail_indices(self.verts, 'hull')
+		finally:
+			metrics.ConvexHull = hull
+		self.assertIn(np.argmax(radius), shell)
+		self.assertNotIn(np.argmin(radius), shell)
+
+	def test_unknown_level(self):
+		with self.assertRaises(AssertionError):
+			util.detail_indices(self.verts, 'faces')
+
+class PlottingTest(unittest.TestCase):
+	def test_import_does_not_load_plotly(self):
+		code = "import sys, util; print('plotly' in sys.modules)"
+		self.assertEqual(subprocess.check_output([sys.executable, '-c', code]).strip(), b'False')
+
+	@unittest.skipIf(plotly is None, "plotly is not installed")
+	def test_one_mesh_for_all_tetrahedra(self):
+		verts = np.random.RandomState(3).normal(size=(7, 4, 3))
+		trace = util.mesh_trace(verts)
+		self.assertEqual(len(trace.x), 28)
+		self.assertEqual(len(trace.i), 28)
+		# every tetrahedron's faces index its own four vertices
+		faces = np.array([trace.i, trace.j, trace.k]).T.reshape(7, 4, 3)
+		for n in range(7):
+			self.assertEqual(set(faces[n].ravel()), set(range(4*n, 4*n+4)))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -83,8 +83,8 @@
         xb (bit-and mb (bit-xor xa mb))
         edge (fn [a b i j]
                (let [cp (- (* (ea i) (eb j)) (* (ea j) (eb i)))]
-                 (or (and (pos? cp) (pos? (bit-or xa a)) (pos? (bit-or xb b)))
-                     (and (neg? cp) (pos? (bit-or xa b)) (pos? (bit-or xb a))))))]
+                 (or (and (pos? cp) (pos? (bit-and xa a)) (pos? (bit-and xb b)))
+                     (and (neg? cp) (pos? (bit-and xa b)) (pos? (bit-and xb a))))))]
     (not
      (or
       (not= 15 (bit-or ma mb))
@@ -163,6 +163,34 @@
            [[qb qa] [qc qa] [qd qa] [qc qb] [qd qb]]
            p qb [[:f 0 1] [:f 2 0] [:f 1 2] [:f* 4 3]])))))
 
+;; Batch protocol used by collision.py: tetrahedra are sent as one flat
+;; vector of numbers (12 per tetrahedron) and answered with one string
+;; holding a 1 or 0 per test, so a whole batch costs a single round trip.
+
+(defn- read-tetras
+  "Splits a flat seq of numbers into tetrahedra, 12 numbers each,
+  returned as vectors of 4 3D points."
+  [xs] (map (fn [t] (mapv vec (partition 3 t))) (partition 12 xs)))
+
+(defn- bits
+  "Returns a string with 1 for each truthy and 0 for each falsy value."
+  [results] (apply str (map #(if % \1 \0) results)))
+
+(defn intersect-batch
+  "Takes a flat vector of numbers holding one candidate tetrahedron
+  followed by any number of neighbours. Returns a string with one
+  character per neighbour, 1 if it intersects the candidate."
+  [xs]
+  (let [[p & qs] (read-tetras xs)]
+    (bits (map #(intersect-tetrahedra? p %) qs))))
+
+(defn intersect-pairs
+  "Takes a flat vector of numbers holding pairs of tetrahedra, 24
+  numbers per pair. Returns a string with one character per pair, 1 if
+  the two tetrahedra of that pair intersect."
+  [xs]
+  (bits (map (fn [[p q]] (intersect-tetrahedra? p q)) (partition 2 (read-tetras xs)))))
+
 ;; Uncomment to accept user input when running file
 ; (def a 
 ;   (into []
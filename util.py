@@ -1,82 +1,203 @@
 import numpy as np
-import plotly.offline as offline
-import plotly.graph_objs as go
-import subprocess
 import time
+import collision
+import metrics
+import packingEngine
 from convexPolygon import Simplex
+from packingState import PackingState
+
+# Levels of detail for plots
+# all: every tetrahedron
+# hull: only the outer layer, the tetrahedra whose centroid lies within one
+# tetrahedron diameter of the convex hull of all vertices
+# sample: a random subset of the tetrahedra
+DETAIL_LEVELS = ('all', 'hull', 'sample')
+
+# Triangle corners of the four faces of a tetrahedron, as Mesh3d expects them
+TETRA_FACES = (np.array([0, 0, 0, 1]), np.array([1, 2, 3, 2]), np.array([2, 3, 1, 3]))
+
+# Indices of the tetrahedra in an nx4x3 vertex array shown at the given level of
+# detail; sample is the number of tetrahedra kept by the sample level
+# The hull layer falls back to a spherical shell around the bounding sphere
+# center when scipy is unavailable
+def detail_indices(verts, lod='all', sample=1000, rng=np.random):
+	assert lod in DETAIL_LEVELS, "Unknown level of detail {0}, expected one of {1}".format(lod, DETAIL_LEVELS)
+	if lod == 'sample':
+		if sample >= len(verts):
+			return np.arange(len(verts))
+		return np.sort(rng.choice(len(verts), sample, replace=False))
+	if lod == 'all' or len(verts) <= 4:
+		return np.arange(len(verts))
+	centroids = verts.mean(axis=1)
+	depth = 2*np.linalg.norm(verts[0]-centroids[0], axis=1).max()
+	points = verts.reshape(-1, 3)
+	if metrics.ConvexHull is not None:
+		# facet equations are outward unit normals with offsets, so the distance
+		# of an inside point to the hull is the smallest negated plane value
+		equations = metrics.ConvexHull(points).equations
+		inside = -(np.dot(centroids, equations[:,:3].T) + equations[:,3]).max(axis=1)
+	else:
+		center, radius = metrics.bounding_sphere(points)
+		inside = radius - np.linalg.norm(centroids-center, axis=1)
+	return np.flatnonzero(inside <= depth)
+
+# One Mesh3d trace holding every tetrahedron in an nx4x3 vertex array
+# All tetrahedra share the vertex and triangle index arrays; each one gets its own
+# intensity, spread so that consecutive tetrahedra get distant colours
+# Coordinates are rounded to decimals places to keep the output small
+# plotly is only imported by the plotting functions, so runs that do not plot
+# start faster
+def mesh_trace(verts, decimals=5):
+	import plotly.graph_objs as go
+	n = len(verts)
+	points = np.round(np.asarray(verts, dtype=float).reshape(-1, 3), decimals)
+	offsets = 4*np.arange(n)[:,None]
+	colours = np.repeat((np.arange(n)*0.618033988749895) % 1.0, 4)
+	return go.Mesh3d(x=points[:,0], y=points[:,1], z=points[:,2],
+					 i=(offsets+TETRA_FACES[0]).ravel(),
+					 j=(offsets+TETRA_FACES[1]).ravel(),
+					 k=(offsets+TETRA_FACES[2]).ravel(),
+					 intensity=np.round(colours, 3),
+					 colorscale='Viridis',
+					 showscale=False,
+					 flatshading=True)
 
 # Plots a group of tetrahedra in a 3-D cartesian coordinate space
-def plot_tetrahedra(tetrahedra_list, filename):
-	mesh_list = []
-	# Create plotly tetrahedra meshes
-	for tetrahedron in tetrahedra_list:
-		mesh = go.Mesh3d(x=tetrahedron.v[:,0],
-						 y=tetrahedron.v[:,1],
-						 z=tetrahedron.v[:,2],
-						 i=[0, 0, 0, 1],
-						 j=[1, 2, 3, 2],
-						 k=[2, 3, 1, 3])
-		mesh_list.append(mesh)
+# tetrahedra_list may be a PackingState, a list of Simplex objects or an nx4x3
+# vertex array; all of them are drawn as a single mesh, optionally reduced to a
+# level of detail from DETAIL_LEVELS
+def plot_tetrahedra(tetrahedra_list, filename, lod='all', sample=1000):
+	import plotly.offline as offline
+	import plotly.graph_objs as go
+	verts = metrics.packing_vertices(tetrahedra_list)
+	shown = detail_indices(verts, lod, sample)
 	layout = go.Layout(xaxis=go.XAxis(title='x'),
-					   yaxis=go.YAxis(title='y'))
-	data = go.Data(mesh_list)
-	fig = go.Figure(data=data, layout=layout)
+					   yaxis=go.YAxis(title='y'),
+					   scene=dict(aspectmode='data'))
+	fig = go.Figure(data=[mesh_trace(verts[shown])], layout=layout)
+	offline.plot(fig, filename=filename)
+
+# Animates a trajectory of frames (an fxnx4x3 array, e.g. from
+# packingIO.read_trajectory) as one mesh whose vertices move from frame to frame
+# The triangle indices and colours are only stored once, in the first frame's
+# trace; the other frames carry nothing but coordinates
+# The level of detail is chosen on the last frame and kept for all of them
+def plot_trajectory(frames, filename, lod='all', sample=1000, every=1, decimals=5):
+	import plotly.offline as offline
+	import plotly.graph_objs as go
+	shown = detail_indices(np.asarray(frames[-1]), lod, sample)
+	names = [str((f+1)*every) for f in range(len(frames))]
+	animation = []
+	for name, frame in zip(names, frames):
+		points = np.round(np.asarray(frame)[shown].reshape(-1, 3), decimals)
+		animation.append(go.Frame(data=[go.Mesh3d(x=points[:,0], y=points[:,1], z=points[:,2])], name=name))
+	play = dict(label='Play', method='animate', args=[None, dict(frame=dict(duration=100, redraw=True), fromcurrent=True)])
+	slider = dict(steps=[dict(label=name, method='animate', args=[[name], dict(frame=dict(duration=0, redraw=True), mode='immediate')]) for name in names],
+				  currentvalue=dict(prefix='iteration '))
+	layout = go.Layout(scene=dict(aspectmode='data'),
+					   updatemenus=[dict(type='buttons', buttons=[play], showactive=False)],
+					   sliders=[slider])
+	fig = go.Figure(data=[mesh_trace(np.asarray(frames[0])[shown], decimals)], layout=layout, frames=animation)
 	offline.plot(fig, filename=filename)
 
 # Determines whether or not two tetrahedra intersect each other
-# Takes in 2 3-D simplex objects and a subprocess running a clojure REPL
+# Takes in 2 3-D simplex objects and optionally a subprocess running a clojure REPL
+# Uses the in-process NumPy overlap test when no subprocess is given
+# If cell is a periodic.PeriodicCell, every periodic image of tetra2 is considered
 # Returns True if they do, False otherwise
-def collision_detection(tetra1, tetra2, subproc):
+def collision_detection(tetra1, tetra2, subproc=None, cell=None):
 	l = np.linalg.norm(tetra1.v[0]-tetra1.c)
+	if cell is not None:
+		# only images whose centroids are close enough need the expensive check
+		indices, translations = cell.images(tetra1.c, np.array([tetra2.c]), 2*l)
+		return any(collision_detection(tetra1, Simplex(tetra2.v+translation, tetra2.b), subproc) for translation in translations)
 	# If the centroids of 2 tetrahedra are not at least this close
 	# then there is no need to perform the expensive check
 	if np.linalg.norm(tetra1.c-tetra2.c) > 2*l:
 		return False
+	elif subproc is None:
+		return collision.intersect_tetrahedra(tetra1.v, tetra2.v)
 	else:
 		# Uses a persistent subprocess for many repeated collision detections
-		stringv1 = tetra1.to_string()
-		stringv2 = tetra2.to_string()
-		command = '(prn (intersect-tetrahedra? '+stringv1+' '+stringv2+'))'
-		subproc.stdin.write(command)
-		subproc.stdin.write('(flush)')
-		subproc.stdout.readline() # flush out empty line
-		collided = subproc.stdout.readline()
-		subproc.stdout.readline() # flush out empty line
-
-		# Preliminary integration of provided clojure implementation for
-		# tetrahedron overlap/collision detection
-		# Run collision detection with new clojure REPL
-		# closes after algorithm is done
-		# very slow due to REPL boot time
-		# //////////////////////////////////////////////////
-		# command = ["clojure", "tetrahedron-intersect.clj"]
-		# for i in range(len(tetra1.v)):
-		# 	for j in range(len(tetra1.v[i])):
-		# 		command.append(str(tetra1.v[i][j]))
-		# for i in range(len(tetra2.v)):
-		# 	for j in range(len(tetra2.v[i])):
-		# 		command.append(str(tetra2.v[i][j]))
-		# collided = subprocess.check_output(command)
-		# //////////////////////////////////////////////////
-
-		return collided == 'true\n'
+		return collision.clojure_intersect(subproc, tetra1.to_string(), tetra2.to_string())
+
+# Determines whether candidate vertices for tetrahedron i intersect any other
+# tetrahedron in a PackingState
+# Only tetrahedra in the grid cells around the candidate are considered; they go
+# through the centroid filter at once and the survivors reach the backend in one call
+# If separation is given, a SeparationCache bound to the state, pairs it knows to
+# be too far apart for the candidate's displacement skip the backend
+# If stats is given the pairs pruned by the centroid filter and those sent to the
+# backend are counted, and the time taken is recorded when timed is set
+def collides(state, i, candidate, grid, backend, stats=None, timed=False, separation=None):
+	if timed:
+		start = time.time()
+	c = candidate.mean(axis=0)
+	neighbours = grid.neighbours(c, i)
+	near = []
+	if len(neighbours) > 0:
+		l = state.circumradius()
+		near = [j for j, d in zip(neighbours, np.linalg.norm(state.centroids[neighbours]-c, axis=1)) if d <= 2*l]
+	if separation is not None and len(near) > 0:
+		hit, exact, skipped = separation.collides(i, candidate, near, backend)
+	else:
+		hit = len(near) > 0 and backend.intersects_any(candidate, state.verts[near])
+		exact = len(near)
+		skipped = 0
+	if stats is not None:
+		stats.record_pairs(len(neighbours)-len(near), exact, skipped)
+		if timed:
+			stats.add_time('collision', time.time()-start)
+	return hit
+
+# Builds the broad phase grid for a PackingState, a compact one for compact states
+# Cells are as wide as the centroid filter distance, twice the circumradius
+def build_grid(state):
+	return state.spatial_grid(2*state.circumradius())
+
+# Random translation for a tetrahedron with centroid c, scaled by its distance to
+# the center of mass and flipped if it would move the tetrahedron away from it
+# rng may be any NumPy random generator, the global one by default
+def propose_translation(c, centerOfMass, scale, rng=np.random):
+	dist = np.linalg.norm(centerOfMass-c)
+	step_size = scale*dist
+	tvec = rng.uniform(-step_size,step_size,len(c))
+	# flip diretion of translation if it moves the tetrahedron away from COM
+	if np.linalg.norm(centerOfMass-c-tvec)>dist:
+		tvec *= -1
+	return tvec
+
+# Applies a rotation matrix to a 4x3 vertex array about its centroid
+def rotate_vertices(vertices, rotation):
+	c = vertices.mean(axis=0)
+	return np.dot(vertices-c, rotation.T) + c
+
+# Sum of the distances from point to every vertex
+def net_distance(point, vertices):
+	return np.linalg.norm(vertices-point, axis=1).sum()
 
 # Get volume of smallest axis aligned rectangular prism containing all tetrahedra
 # Used to observe convergence; not a good measure of packing quality because
 # the box is axis aligned meaning the volume is greatly affected by tetrahedra orientations
+# See metrics.py for better measures
 def cubeContainerVolume(tetlist):
-	corners = [[None,None] for _ in range(len(tetlist[0].c))]
-	for tet in tetlist:
-		for vertex in tet.v:
-			for i in range(len(vertex)):
-				if vertex[i] < corners[i][0] or corners[i][0] == None:
-					corners[i][0] = vertex[i]
-				if vertex[i] > corners[i][1] or corners[i][1] == None:
-					corners[i][1] = vertex[i]
-	volume = 1
-	for edge in corners:
-		volume *= (edge[1]-edge[0])
-	return volume
+	return metrics.box_volume(tetlist)
+
+# Combines several packing callbacks into one that calls each of them in turn
+# and asks the run to stop if any of them does
+def chain_callbacks(*callbacks):
+	callbacks = [callback for callback in callbacks if callback is not None]
+	def chained(iteration, state):
+		stop = False
+		for callback in callbacks:
+			stop = callback(iteration, state) or stop
+		return stop
+	return chained
+
+# Density of the packing relative to its axis aligned box container,
+# the same measure printed by the packing functions in verbose mode
+def boxDensity(tetlist, l=1.0):
+	return metrics.density(tetlist, 'box', l)
 
 # Generates a list of numtetras tetrahedra with random positions and orientations
 # initialmultiplier determines the minimum tetrahedron lengths away that two tetrahedra can be from each other
@@ -110,6 +231,8 @@ def generate_tetrahedra(numtetras, initialmultiplier=2, multiplierincrement=2, l
 # Get "center of mass" of all tetrahedra,
 # calculated as the average of all tetrahedra centroid positions
 def getCOM(tetralist):
+	if isinstance(tetralist, PackingState):
+		return tetralist.com()
 	COM = np.zeros(len(tetralist[0].c))
 	for tet in tetralist:
 		COM += tet.c
@@ -119,419 +242,20 @@ def getCOM(tetralist):
 # Packing algorithm that randomly initializes numtetras tetrahedra in space
 # then compresses them by performing random translations and rotations that 
 # move the tetrahedra towards the collective "center of mass"
-def randomizedGuidedPacking(numtetras, genmult=2, geninc=2, initstepscale=0.9, stepscalereduction=0.95, initrotrange=360, rotreduction=0.95, stepthreshold=1e-6, rotationthreshold=0.1, l=1.0, max_iters=1000, verbose=False):
-	assert(initstepscale>0 and initstepscale<=1)
-	assert(stepscalereduction>0 and stepscalereduction<1)
-	assert(stepthreshold>0)
-	assert(rotreduction>0 and rotreduction<1)
-
-	# Can be removed if python implementation of collision detection is used
-	subproc = subprocess.Popen('clojure', stdout=subprocess.PIPE, stdin=subprocess.PIPE)
-	subproc.stdin.write('(clojure.main/load-script "tetrahedron-intersect.clj")')
-	subproc.stdin.write('(flush)')
-	subproc.stdout.readline() # flush out useless line
-	subproc.stdout.readline() # flush out useless line
-
-	tetralist = generate_tetrahedra(numtetras,genmult,geninc,l)
-	scales = [initstepscale]*len(tetralist)
-	rotranges = [initrotrange]*len(tetralist)
-	converged = [False]*len(tetralist)
-	centerOfMass = getCOM(tetralist)
-	for iteration in range(max_iters):
-		updatedlist = []
-		for i, tet in enumerate(tetralist):
-			# preliminary convergence check
-			useTranslation = True
-			useRotation = True
-			if scales[i] < stepthreshold and rotranges[i] < rotationthreshold:
-				updatedlist.append(tet)
-				converged[i] = True
-				continue
-
-			# get translation
-			dist = np.linalg.norm(centerOfMass-tet.c)
-			step_size = scales[i]*dist
-			tvec = np.random.uniform(-step_size,step_size,len(tet.c))
-			# flip diretion of translation if it moves the tetrahedron away from COM
-			if np.linalg.norm(centerOfMass-tet.c-tvec)>dist:
-				tvec *= -1
-			translatedTet = Simplex(tet.v)
-			translatedTet.translate(tvec)
-			# reject translation if it results in a collision and scale back step size
-			for j in range(len(tetralist)):
-				if j == i:
-					continue
-				elif j < i:
-					if collision_detection(translatedTet,updatedlist[j],subproc):
-						useTranslation = False
-						scales[i] *= stepscalereduction
-						break
-				else:
-					if collision_detection(translatedTet,tetralist[j],subproc):
-						useTranslation = False
-						scales[i] *= stepscalereduction
-						break
-
-			tetUsed = tet
-			if useTranslation:
-				tetUsed = translatedTet
-
-			# get rotation
-			degrees = np.random.uniform(rotranges[i])
-			plane = (0,np.random.choice(range(1,len(tetUsed.c))))
-			rotatedTet = Simplex(tetUsed.v)
-			rotatedTet.Rotate(degrees,plane,'deg')
-			netdist = 0
-			netrdist = 0
-			for j in range(len(tetUsed.v)):
-				d = np.linalg.norm(centerOfMass-tetUsed.v[j])
-				rd = np.linalg.norm(centerOfMass-rotatedTet.v[j])
-				netdist += d
-				netrdist += rd
-			# flip direction of rotation if it increases net vertex distance from COM
-			if netrdist > netdist:
-				degrees *= -1
-			rotatedTet = Simplex(tetUsed.v)
-			rotatedTet.Rotate(degrees,plane,'deg')
-			# reject rotation if it results in a collision and scale back rotation size
-			for j in range(len(tetralist)):
-				if j == i:
-					continue
-				elif j < i:
-					if collision_detection(rotatedTet,updatedlist[j],subproc):
-						useRotation = False
-						rotranges[i] *= rotreduction
-						break
-				else:
-					if collision_detection(rotatedTet,tetralist[j],subproc):
-						useRotation = False
-						rotranges[i] *= rotreduction
-						break
-
-			# apply correct update
-			updatedTet = Simplex(tet.v)
-			if useTranslation:
-				updatedTet.translate(tvec)
-			if useRotation:
-				updatedTet.Rotate(degrees,plane,'deg')
-			updatedlist.append(updatedTet)
-
-			# update center of mass
-			if i != len(tetralist)-1:
-				centerOfMass = getCOM(updatedlist+tetralist[i+1:])
-			else:
-				centerOfMass = getCOM(updatedlist)
-
-		# update tetralist, print density calculation, check convergence condition
-		tetralist = updatedlist[:]
-		if verbose and iteration % 10 == 9:
-			print("Iteration: " + str(iteration+1))
-			cubeVolume = cubeContainerVolume(tetralist)
-			print "box container volume: ", cubeVolume
-			tetVolume = l**3.0/(6*2**0.5)*numtetras
-			print "density: ", tetVolume/cubeVolume
-		if not False in converged:
-			break
-	return tetralist
+# The loop itself lives in packingEngine, shared by all three variants
+def randomizedGuidedPacking(numtetras, genmult=2, geninc=2, initstepscale=0.9, stepscalereduction=0.95, initrotrange=360, rotreduction=0.95, stepthreshold=1e-6, rotationthreshold=0.1, l=1.0, max_iters=1000, verbose=False, backend='numpy', comresum=1000, callback=None, state=None, stats=None, activeset=None, separation=None, clusters=None, schedule=None):
+	return packingEngine.pack('V1', numtetras, genmult, geninc, initstepscale, stepscalereduction, initrotrange, rotreduction, stepthreshold, rotationthreshold, l, max_iters, verbose, backend, comresum, callback, state, stats, activeset, separation, clusters, schedule)
 
 # Packing algorithm that randomly initializes numtetras tetrahedra in space
 # then compresses them by performing random translations and rotations that 
 # move the tetrahedra towards the collective "center of mass"
 # V2 adds more dynamic rotations
-def randomizedGuidedPackingV2(numtetras, genmult=2, geninc=2, initstepscale=0.9, stepscalereduction=0.95, initrotrange=360, rotreduction=0.95, stepthreshold=1e-6, rotationthreshold=0.1, l=1.0, max_iters=1000, verbose=False):
-	assert(initstepscale>0 and initstepscale<=1)
-	assert(stepscalereduction>0 and stepscalereduction<1)
-	assert(stepthreshold>0)
-	assert(rotreduction>0 and rotreduction<1)
-
-	# Can be removed if python implementation of collision detection is used
-	subproc = subprocess.Popen('clojure', stdout=subprocess.PIPE, stdin=subprocess.PIPE)
-	subproc.stdin.write('(clojure.main/load-script "tetrahedron-intersect.clj")')
-	subproc.stdin.write('(flush)')
-	subproc.stdout.readline() # flush out useless line
-	subproc.stdout.readline() # flush out useless line
-
-	tetralist = generate_tetrahedra(numtetras,genmult,geninc,l)
-	scales = [initstepscale]*len(tetralist)
-	rotranges = [initrotrange]*len(tetralist)
-	converged = [False]*len(tetralist)
-	centerOfMass = getCOM(tetralist)
-	for iteration in range(max_iters):
-		updatedlist = []
-		for i, tet in enumerate(tetralist):
-			# preliminary convergence check
-			useTranslation = True
-			useRotation = True
-			if scales[i] < stepthreshold and rotranges[i] < rotationthreshold:
-				updatedlist.append(tet)
-				converged[i] = True
-				continue
-
-			# get translation
-			dist = np.linalg.norm(centerOfMass-tet.c)
-			step_size = scales[i]*dist
-			tvec = np.random.uniform(-step_size,step_size,len(tet.c))
-			# flip diretion of translation if it moves the tetrahedron away from COM
-			if np.linalg.norm(centerOfMass-tet.c-tvec)>dist:
-				tvec *= -1
-			translatedTet = Simplex(tet.v)
-			translatedTet.translate(tvec)
-			# reject translation if it results in a collision and scale back step size
-			for j in range(len(tetralist)):
-				if j == i:
-					continue
-				elif j < i:
-					if collision_detection(translatedTet,updatedlist[j],subproc):
-						useTranslation = False
-						scales[i] *= stepscalereduction
-						break
-				else:
-					if collision_detection(translatedTet,tetralist[j],subproc):
-						useTranslation = False
-						scales[i] *= stepscalereduction
-						break
-
-			tetUsed = tet
-			if useTranslation:
-				tetUsed = translatedTet
-
-			# get rotation
-			degreeslist = []
-			planelist = []
-			for j in range(len(tet.c)):
-				for k in range(j+1,len(tet.c)):
-					degrees = np.random.uniform(rotranges[i])
-					plane = (j,k)
-					rotatedTet = Simplex(tetUsed.v)
-					rotatedTet.Rotate(degrees,plane,'deg')
-					netdist = 0
-					netrdist = 0
-					for n in range(len(tetUsed.v)):
-						d = np.linalg.norm(centerOfMass-tetUsed.v[n])
-						rd = np.linalg.norm(centerOfMass-rotatedTet.v[n])
-						netdist += d
-						netrdist += rd
-					# flip direction of rotation if it increases net vertex distance from COM
-					if netrdist > netdist:
-						degrees *= -1
-					degreeslist.append(degrees)
-					planelist.append(plane)
-			rotatedTet = Simplex(tetUsed.v)
-			for j in range(len(degreeslist)):
-				rotatedTet.Rotate(degreeslist[j],planelist[j],'deg')
-			# reject rotation if it results in a collision and scale back rotation size
-			for j in range(len(tetralist)):
-				if j == i:
-					continue
-				elif j < i:
-					if collision_detection(rotatedTet,updatedlist[j],subproc):
-						useRotation = False
-						rotranges[i] *= rotreduction
-						break
-				else:
-					if collision_detection(rotatedTet,tetralist[j],subproc):
-						useRotation = False
-						rotranges[i] *= rotreduction
-						break
-
-			# apply correct update
-			updatedTet = Simplex(tet.v)
-			if useTranslation:
-				updatedTet.translate(tvec)
-			if useRotation:
-				for j in range(len(degreeslist)):
-					updatedTet.Rotate(degreeslist[j],planelist[j],'deg')
-			updatedlist.append(updatedTet)
-
-			# update center of mass
-			if i != len(tetralist)-1:
-				centerOfMass = getCOM(updatedlist+tetralist[i+1:])
-			else:
-				centerOfMass = getCOM(updatedlist)
-
-		# update tetralist, print density calculation, check convergence condition
-		tetralist = updatedlist[:]
-		if verbose and iteration % 10 == 9:
-			print("Iteration: " + str(iteration+1))
-			cubeVolume = cubeContainerVolume(tetralist)
-			print "box container volume: ", cubeVolume
-			tetVolume = l**3.0/(6*2**0.5)*numtetras
-			print "density: ", tetVolume/cubeVolume
-		if not False in converged:
-			break
-	return tetralist
+def randomizedGuidedPackingV2(numtetras, genmult=2, geninc=2, initstepscale=0.9, stepscalereduction=0.95, initrotrange=360, rotreduction=0.95, stepthreshold=1e-6, rotationthreshold=0.1, l=1.0, max_iters=1000, verbose=False, backend='numpy', comresum=1000, callback=None, state=None, stats=None, activeset=None, separation=None, clusters=None, schedule=None):
+	return packingEngine.pack('V2', numtetras, genmult, geninc, initstepscale, stepscalereduction, initrotrange, rotreduction, stepthreshold, rotationthreshold, l, max_iters, verbose, backend, comresum, callback, state, stats, activeset, separation, clusters, schedule)
 
 # Packing algorithm that randomly initializes numtetras tetrahedra in space
 # then compresses them by performing random translations and rotations that 
 # move the tetrahedra towards the collective "center of mass"
 # V3 adds local optimization bias to potentially reduce "dog piling" in center
-def randomizedGuidedPackingV3(numtetras, genmult=2, geninc=2, initstepscale=0.9, stepscalereduction=0.95, initrotrange=360.0, rotreduction=0.95, stepthreshold=1e-6, rotationthreshold=0.1, l=1.0, max_iters=1000, verbose=False):
-	assert(initstepscale>0 and initstepscale<=1)
-	assert(stepscalereduction>0 and stepscalereduction<1)
-	assert(stepthreshold>0)
-	assert(rotreduction>0 and rotreduction<1)
-
-	# Can be removed if python implementation of collision detection is used
-	subproc = subprocess.Popen('clojure', stdout=subprocess.PIPE, stdin=subprocess.PIPE)
-	subproc.stdin.write('(clojure.main/load-script "tetrahedron-intersect.clj")')
-	subproc.stdin.write('(flush)')
-	subproc.stdout.readline() # flush out useless line
-	subproc.stdout.readline() # flush out useless line
-
-	tetralist = generate_tetrahedra(numtetras,genmult,geninc,l)
-	scales = [initstepscale]*len(tetralist)
-	rotranges = [initrotrange]*len(tetralist)
-	converged = [False]*len(tetralist)
-	centerOfMass = getCOM(tetralist)
-	for iteration in range(max_iters):
-		updatedlist = []
-		for i, tet in enumerate(tetralist):
-			# preliminary convergence check
-			useTranslation = True
-			useRotation = True
-			if scales[i] < stepthreshold and abs(rotranges[i])< rotationthreshold:
-				updatedlist.append(tet)
-				converged[i] = True
-				continue
-
-			# get translation
-			dist = np.linalg.norm(centerOfMass-tet.c)
-			step_size = scales[i]*dist
-			tvec = np.random.uniform(-step_size,step_size,len(tet.c))
-			# flip diretion of translation if it moves the tetrahedron away from COM
-			if np.linalg.norm(centerOfMass-tet.c-tvec)>dist:
-				tvec *= -1
-			# add local optimization bias
-			nearest = None
-			minDist = None
-			for j in range(len(tetralist)):
-				if j == i:
-					continue
-				elif j < i:
-					d = np.linalg.norm(updatedlist[j].c-tet.c)
-					if minDist == None or d<minDist:
-						minDist = d
-						nearest = updatedlist[j]
-				else:
-					d = np.linalg.norm(tetralist[j].c-tet.c)
-					if minDist == None or d<minDist:
-						minDist = d
-						nearest = tetralist[j]
-			# if only one tetrahedron
-			if nearest == None:
-				nearest = tet
-			bias = nearest.c - tet.c
-			for j in range(len(bias)):
-				tvec[j] += scales[i]*np.random.uniform(min(bias[j],0),max(bias[j],0))
-			translatedTet = Simplex(tet.v)
-			translatedTet.translate(tvec)
-			# reject translation if it results in a collision and scale back step size
-			for j in range(len(tetralist)):
-				if j == i:
-					continue
-				elif j < i:
-					if collision_detection(translatedTet,updatedlist[j],subproc):
-						useTranslation = False
-						scales[i] *= stepscalereduction
-						break
-				else:
-					if collision_detection(translatedTet,tetralist[j],subproc):
-						useTranslation = False
-						scales[i] *= stepscalereduction
-						break
-
-			tetUsed = tet
-			if useTranslation:
-				tetUsed = translatedTet
-			# fine nearest after possible translation
-			nearest = None
-			minDist = None
-			for j in range(len(tetralist)):
-				if j == i:
-					continue
-				elif j < i:
-					d = np.linalg.norm(updatedlist[j].c-tetUsed.c)
-					if minDist == None or d<minDist:
-						minDist = d
-						nearest = updatedlist[j]
-				else:
-					d = np.linalg.norm(tetralist[j].c-tetUsed.c)
-					if minDist == None or d<minDist:
-						minDist = d
-						nearest = tetralist[j]
-			# if only one tetrahedron
-			if nearest == None:
-				nearest = tetUsed
-
-			# get rotation
-			degreeslist = []
-			planelist = []
-			for j in range(len(tet.c)):
-				for k in range(j+1,len(tet.c)):
-					degrees = np.random.uniform(rotranges[i])
-					plane = (j,k)
-					rotatedTet = Simplex(tetUsed.v)
-					rotatedTet.Rotate(degrees,plane,'deg')
-					netdist1 = 0
-					netrdist1 = 0
-					netdist2 = 0
-					netrdist2 = 0
-					for n in range(len(tetUsed.v)):
-						d1 = np.linalg.norm(centerOfMass-tetUsed.v[n])
-						rd1 = np.linalg.norm(centerOfMass-rotatedTet.v[n])
-						d2 = np.linalg.norm(nearest.c-tetUsed.v[n])
-						rd2 = np.linalg.norm(nearest.c-rotatedTet.v[n])
-						netdist1 += d1
-						netrdist1 += rd1
-						netdist2 += d2
-						netrdist2 += rd2
-					# flip direction of rotation if it increases net vertex distance from COM
-					if netrdist1 > netdist1 and netrdist2 > netrdist2:
-						degrees *= -1
-					degreeslist.append(degrees)
-					planelist.append(plane)
-
-			rotatedTet = Simplex(tetUsed.v)
-			for j in range(len(degreeslist)):
-				rotatedTet.Rotate(degreeslist[j],planelist[j],'deg')
-			# reject rotation if it results in a collision and scale back rotation size
-			for j in range(len(tetralist)):
-				if j == i:
-					continue
-				elif j < i:
-					if collision_detection(rotatedTet,updatedlist[j],subproc):
-						useRotation = False
-						rotranges[i] *= rotreduction
-						break
-				else:
-					if collision_detection(rotatedTet,tetralist[j],subproc):
-						useRotation = False
-						rotranges[i] *= rotreduction
-						break
-
-			# apply correct update
-			updatedTet = Simplex(tet.v)
-			if useTranslation:
-				updatedTet.translate(tvec)
-			if useRotation:
-				for j in range(len(degreeslist)):
-					updatedTet.Rotate(degreeslist[j],planelist[j],'deg')
-			updatedlist.append(updatedTet)
-
-			# update center of mass
-			if i != len(tetralist)-1:
-				centerOfMass = getCOM(updatedlist+tetralist[i+1:])
-			else:
-				centerOfMass = getCOM(updatedlist)
-
-		# update tetralist, print density calculation, check convergence condition
-		tetralist = updatedlist[:]
-		if verbose and iteration % 10 == 9:
-			print("Iteration: " + str(iteration+1))
-			cubeVolume = cubeContainerVolume(tetralist)
-			print "box container volume: ", cubeVolume
-			tetVolume = l**3.0/(6*2**0.5)*numtetras
-			print "density: ", tetVolume/cubeVolume
-		if not False in converged:
-			break
-	return tetralist
\ No newline at end of file
+def randomizedGuidedPackingV3(numtetras, genmult=2, geninc=2, initstepscale=0.9, stepscalereduction=0.95, initrotrange=360.0, rotreduction=0.95, stepthreshold=1e-6, rotationthreshold=0.1, l=1.0, max_iters=1000, verbose=False, backend='numpy', comresum=1000, callback=None, state=None, stats=None, activeset=None, separation=None, clusters=None, schedule=None):
+	return packingEngine.pack('V3', numtetras, genmult, geninc, initstepscale, stepscalereduction, initrotrange, rotreduction, stepthreshold, rotationthreshold, l, max_iters, verbose, backend, comresum, callback, state, stats, activeset, separation, clusters, schedule)